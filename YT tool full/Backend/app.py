@@ -1,13 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+import httplib2
 from youtube_transcript_api import YouTubeTranscriptApi
 from groq import Groq
 import os
 from datetime import datetime, timedelta
 from collections import defaultdict
+import hashlib
 import re
-from typing import List, Dict, Any
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple, Iterator
+from urllib.parse import urlsplit, parse_qsl, urlencode
 import json
 from dotenv import load_dotenv
 
@@ -20,12 +28,336 @@ CORS(app)
 # Configuration
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY', '')
 GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
+# Video detail requests that may be in flight at once, across all requests
+YOUTUBE_MAX_WORKERS = int(os.getenv('YOUTUBE_MAX_WORKERS', '4'))
+# Quota units one channel fetch may spend (0 = no limit); list calls cost 1 unit each
+YOUTUBE_QUOTA_BUDGET = int(os.getenv('YOUTUBE_QUOTA_BUDGET', '0'))
+# On-disk cache of API responses, in the Flask instance folder by default; 0 MB turns it off
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join(app.instance_path, 'api_cache.db'))
+CACHE_MAX_MB = float(os.getenv('CACHE_MAX_MB', '50'))
+# Seconds each kind of YouTube response stays fresh (None = never expires, only evicted when the cache is full)
+YOUTUBE_CACHE_TTLS = {
+    'channel_id': None,            # handle / custom URL -> channel ID
+    'channels': 10 * 60,           # subscriber and view counts
+    'playlistItems': 5 * 60,       # new uploads
+    'videos': 15 * 60,             # view, like and comment counts
+    'commentThreads': 30 * 60,
+    'search': 60 * 60,             # /api/search-channels
+}
+# Videos of analysed channels, so re-analysis only fetches new uploads and stale counts ('' turns it off)
+CHANNEL_STORE_PATH = os.getenv('CHANNEL_STORE_PATH', os.path.join(app.instance_path, 'channels.db'))
+# How long a stored video's counts are trusted, by the video's age: new uploads change fastest
+VIDEO_STATS_TTLS = [
+    (2 * 86400, 30 * 60),          # under 2 days old: 30 minutes
+    (30 * 86400, 6 * 3600),        # under a month: 6 hours
+    (None, 3 * 86400),             # older: 3 days
+]
+# Groq answers to byte-identical prompts are reused for LLM_CACHE_TTL seconds (0 MB turns it off)
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(app.instance_path, 'llm_cache.db'))
+LLM_CACHE_MAX_MB = float(os.getenv('LLM_CACHE_MAX_MB', '20'))
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', str(24 * 3600)))
 
 # Initialize clients
 youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY) if YOUTUBE_API_KEY else None
 groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
 
 
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+class CacheEntry(NamedTuple):
+    value: Any
+    etag: Optional[str]
+    fresh: bool
+
+
+class ResponseCache:
+    """JSON responses kept in SQLite, with a TTL per entry, ETags and LRU eviction by size
+    
+    Entries live in namespaces (the kind of response). An expired entry is not deleted:
+    its ETag lets the caller revalidate it, and refresh() makes it fresh again.
+    Once the stored values pass `max_bytes`, the least recently used are evicted.
+    """
+    
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS entries (
+            namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, etag TEXT,
+            size INTEGER NOT NULL, expires_at REAL, last_used REAL NOT NULL,
+            PRIMARY KEY (namespace, key))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)')
+        self._bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self.counters = defaultdict(int)
+    
+    def get(self, namespace: str, key: str) -> Optional[CacheEntry]:
+        """The entry stored under `key`, fresh or expired; None if there is none"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT value, etag, expires_at FROM entries WHERE namespace = ? AND key = ?',
+                                   (namespace, key)).fetchone()
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            self._db.execute('UPDATE entries SET last_used = ? WHERE namespace = ? AND key = ?', (now, namespace, key))
+            fresh = row[2] is None or row[2] > now
+            self.counters['hits' if fresh else 'misses'] += 1
+            if not fresh:
+                self.counters['stale'] += 1
+            return CacheEntry(json.loads(row[0]), row[1], fresh)
+    
+    def put(self, namespace: str, key: str, value: Any, ttl: Optional[float], etag: Optional[str] = None):
+        """Store `value` for `ttl` seconds (None = no expiry)"""
+        data = json.dumps(value, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute('SELECT size FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (namespace, key, data, etag, len(data), None if ttl is None else now + ttl, now))
+            self._bytes += len(data) - (old[0] if old else 0)
+            self.counters['stores'] += 1
+            if self._bytes > self.max_bytes:
+                self._evict()
+    
+    def refresh(self, namespace: str, key: str, ttl: Optional[float]):
+        """Mark an entry fresh again for `ttl` seconds (after the server answered 304 Not Modified)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute('UPDATE entries SET expires_at = ?, last_used = ? WHERE namespace = ? AND key = ?',
+                             (None if ttl is None else now + ttl, now, namespace, key))
+            self.counters['revalidated'] += 1
+    
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its size
+        target = self.max_bytes * 0.9
+        rows = self._db.execute('SELECT namespace, key, size FROM entries ORDER BY last_used').fetchall()
+        doomed = []
+        for namespace, key, size in rows:
+            if self._bytes <= target:
+                break
+            doomed.append((namespace, key))
+            self._bytes -= size
+        self._db.executemany('DELETE FROM entries WHERE namespace = ? AND key = ?', doomed)
+        self.counters['evictions'] += len(doomed)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'hit_ratio': round(self.counters['hits'] / lookups, 3) if lookups else None,
+                'entries': entries,
+                'size_bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+def _request_key(api_request) -> str:
+    """Cache key of a Google API request: its path and sorted query, without the API key"""
+    url = urlsplit(api_request.uri)
+    params = sorted((k, v) for k, v in parse_qsl(url.query) if k != 'key')
+    return f"{url.path}?{urlencode(params)}"
+
+
+api_cache = ResponseCache(CACHE_PATH, int(CACHE_MAX_MB * 1024 * 1024)) if youtube and CACHE_MAX_MB > 0 else None
+
+
+# ============================================================================
+# CHANNEL VIDEO STORE
+# ============================================================================
+
+def _stats_ttl(published_at: str, now: float) -> float:
+    """Seconds the counts of a video published at `published_at` stay fresh"""
+    try:
+        age = now - datetime.fromisoformat(published_at.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        age = 0
+    for max_age, ttl in VIDEO_STATS_TTLS:
+        if max_age is None or age < max_age:
+            return ttl
+
+
+class ChannelVideoStore:
+    """The videos of every channel analysed so far, kept in SQLite
+    
+    Per channel it records the uploads playlist, the newest publishedAt seen, how far
+    down the stored videos are known to have no gaps (`synced_through`, the publishedAt
+    of the oldest one) and whether that reaches the end of the playlist. Per video it
+    keeps the details returned by DataAcquisitionAgent and when their counts were fetched.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS channels (
+            channel_id TEXT PRIMARY KEY, uploads_playlist TEXT NOT NULL, newest_published TEXT,
+            complete INTEGER NOT NULL DEFAULT 0, synced_at REAL, synced_through TEXT)''')
+        try:
+            self._db.execute('ALTER TABLE channels ADD COLUMN synced_through TEXT')
+        except sqlite3.OperationalError:
+            pass  # already there
+        self._db.execute('''CREATE TABLE IF NOT EXISTS videos (
+            channel_id TEXT NOT NULL, video_id TEXT NOT NULL, published_at TEXT NOT NULL,
+            data TEXT NOT NULL, stats_at REAL NOT NULL, PRIMARY KEY (channel_id, video_id))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS videos_newest ON videos(channel_id, published_at)')
+    
+    def channel(self, channel_id: str) -> Optional[Dict[str, Any]]:
+        """Sync state of a channel, or None if it was never synced"""
+        with self._lock:
+            row = self._db.execute('SELECT uploads_playlist, newest_published, complete, synced_at, synced_through '
+                                   'FROM channels WHERE channel_id = ?', (channel_id,)).fetchone()
+        if row is None:
+            return None
+        return {'uploads_playlist': row[0], 'newest_published': row[1], 'complete': bool(row[2]), 'synced_at': row[3],
+                'synced_through': row[4]}
+    
+    def published_dates(self, channel_id: str) -> Dict[str, str]:
+        """publishedAt of every stored video of the channel, by video ID"""
+        with self._lock:
+            return dict(self._db.execute('SELECT video_id, published_at FROM videos WHERE channel_id = ?', (channel_id,)))
+    
+    def save_videos(self, channel_id: str, videos: List[Dict[str, Any]], fetched_at: float):
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?)',
+                                 [(channel_id, v['id'], v['published_at'], json.dumps(v), fetched_at) for v in videos])
+    
+    def remove_videos(self, channel_id: str, video_ids):
+        with self._lock:
+            self._db.executemany('DELETE FROM videos WHERE channel_id = ? AND video_id = ?',
+                                 [(channel_id, v) for v in video_ids])
+    
+    def save_channel(self, channel_id: str, uploads_playlist: str, synced_through: Optional[str], complete: bool):
+        """Record a finished sync; the newest publishedAt is taken from the stored videos"""
+        with self._lock:
+            newest = self._db.execute('SELECT MAX(published_at) FROM videos WHERE channel_id = ?',
+                                      (channel_id,)).fetchone()[0]
+            self._db.execute('INSERT OR REPLACE INTO channels (channel_id, uploads_playlist, newest_published, complete, '
+                             'synced_at, synced_through) VALUES (?, ?, ?, ?, ?, ?)',
+                             (channel_id, uploads_playlist, newest, int(complete), time.time(), synced_through))
+    
+    def stale_ids(self, channel_id: str, limit: int, now: float) -> List[str]:
+        """IDs among the `limit` newest videos whose counts are older than their TTL"""
+        with self._lock:
+            rows = self._db.execute('SELECT video_id, published_at, stats_at FROM videos WHERE channel_id = ? '
+                                    'ORDER BY published_at DESC LIMIT ?', (channel_id, limit)).fetchall()
+        return [video_id for video_id, published_at, stats_at in rows
+                if now - stats_at > _stats_ttl(published_at, now)]
+    
+    def videos(self, channel_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The `limit` newest stored videos, newest first"""
+        with self._lock:
+            rows = self._db.execute('SELECT data FROM videos WHERE channel_id = ? ORDER BY published_at DESC LIMIT ?',
+                                    (channel_id, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+
+video_store = ChannelVideoStore(CHANNEL_STORE_PATH) if youtube and CHANNEL_STORE_PATH else None
+
+
+# ============================================================================
+# LLM COMPLETION CACHE
+# ============================================================================
+
+class CompletionCache:
+    """Groq chat completions, reused when the same request was answered before
+    
+    Entries are keyed by the SHA-256 of (model, messages, temperature, max_tokens)
+    and kept in a ResponseCache with the seconds the original call took, so hits
+    can be reported as latency saved.
+    """
+    
+    def __init__(self, groq_client, cache: Optional[ResponseCache], ttl: int = LLM_CACHE_TTL):
+        self.groq = groq_client
+        self.cache = cache
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.saved_seconds = 0.0
+        self.api_seconds = 0.0
+    
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        request = json.dumps([model, messages, temperature, max_tokens], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+    
+    def _cached(self, key: str, use_cache: bool) -> Optional[str]:
+        entry = self.cache.get('completions', key) if use_cache and self.cache else None
+        if entry is None or not entry.fresh:
+            return None
+        with self._lock:
+            self.saved_seconds += entry.value['seconds']
+        return entry.value['content']
+    
+    def _store(self, key: str, content: str, seconds: float):
+        with self._lock:
+            self.api_seconds += seconds
+        if self.cache:
+            self.cache.put('completions', key, {'content': content, 'seconds': round(seconds, 3)}, self.ttl)
+    
+    def complete(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                 use_cache: bool = True) -> str:
+        """Text of the completion; with use_cache=False Groq is always asked and the answer re-stored"""
+        key = self.key(model, messages, temperature, max_tokens)
+        content = self._cached(key, use_cache)
+        if content is not None:
+            return content
+        
+        started = time.perf_counter()
+        response = self.groq.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        content = response.choices[0].message.content
+        self._store(key, content, time.perf_counter() - started)
+        return content
+    
+    def stream(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+               use_cache: bool = True) -> Iterator[str]:
+        """Like complete(), but yields the text piece by piece as Groq writes it
+        
+        A cached answer comes out as a single piece. The answer is only stored once
+        the stream has been read to the end.
+        """
+        key = self.key(model, messages, temperature, max_tokens)
+        content = self._cached(key, use_cache)
+        if content is not None:
+            yield content
+            return
+        
+        started = time.perf_counter()
+        parts = []
+        for chunk in self.groq.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        ):
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                parts.append(text)
+                yield text
+        self._store(key, ''.join(parts), time.perf_counter() - started)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats() if self.cache else {'cache': 'disabled'}
+        return {**stats, 'saved_seconds': round(self.saved_seconds, 2), 'api_seconds': round(self.api_seconds, 2)}
+
+
+llm_cache = ResponseCache(LLM_CACHE_PATH, int(LLM_CACHE_MAX_MB * 1024 * 1024)) if groq_client and LLM_CACHE_MAX_MB > 0 else None
+llm = CompletionCache(groq_client, llm_cache) if groq_client else None
+
+
 # ============================================================================
 # AGENT 1: DATA ACQUISITION AGENT
 # ============================================================================
@@ -33,16 +365,62 @@ groq_client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
 class DataAcquisitionAgent:
     """Fetches YouTube channel data, video metadata, comments, and transcripts"""
     
-    def __init__(self, youtube_client):
+    def __init__(self, youtube_client, max_workers: int = YOUTUBE_MAX_WORKERS,
+                 cache: Optional[ResponseCache] = None, store: Optional[ChannelVideoStore] = None):
         self.youtube = youtube_client
+        self.cache = cache
+        self.store = store
+        # Video details are fetched on this pool while the playlist is still being paged
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='youtube-details')
+        self._local = threading.local()
+        self._quota_lock = threading.Lock()
+        self.quota_used = 0
+        self.quota_saved = 0
+    
+    def execute(self, api_request, cost: int = 1, kind: Optional[str] = None, cache: bool = True) -> Dict[str, Any]:
+        """Run an API request on this thread's own connection and count its quota cost
+        
+        Responses are cached by `kind` (default: the resource, e.g. 'videos') for as long as
+        YOUTUBE_CACHE_TTLS says. An expired entry is revalidated with its ETag; if the
+        server answers 304 Not Modified, the cached response is used again.
+        """
+        kind = kind or api_request.methodId.split('.')[1]
+        use_cache = cache and self.cache is not None and kind in YOUTUBE_CACHE_TTLS
+        key = _request_key(api_request) if use_cache else None
+        entry = self.cache.get(kind, key) if use_cache else None
+        if entry is not None and entry.fresh:
+            with self._quota_lock:
+                self.quota_saved += cost
+            return entry.value
+        if entry is not None and entry.etag:
+            api_request.headers['If-None-Match'] = entry.etag
+        
+        # httplib2 connections are not thread-safe, so each thread gets its own
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = httplib2.Http(timeout=30)
+        try:
+            response = api_request.execute(http=http)
+        except HttpError as e:
+            if entry is not None and e.resp.status == 304:
+                self.cache.refresh(kind, key, YOUTUBE_CACHE_TTLS[kind])
+                return entry.value
+            raise
+        finally:
+            with self._quota_lock:
+                self.quota_used += cost
+        if use_cache:
+            self.cache.put(kind, key, response, YOUTUBE_CACHE_TTLS[kind], etag=response.get('etag'))
+        return response
     
     def get_channel_info(self, channel_id: str) -> Dict[str, Any]:
         """Get basic channel information"""
         try:
-            response = self.youtube.channels().list(
+            response = self.execute(self.youtube.channels().list(
                 part='snippet,statistics,contentDetails',
                 id=channel_id
-            ).execute()
+            ))
             
             if not response['items']:
                 return {'error': 'Channel not found'}
@@ -60,62 +438,142 @@ class DataAcquisitionAgent:
         except Exception as e:
             return {'error': str(e)}
     
-    def get_channel_videos(self, channel_id: str, max_results: int = 50) -> List[Dict[str, Any]]:
+    def get_channel_videos(self, channel_id: str, max_results: int = 50,
+                           quota_budget: Optional[int] = None) -> List[Dict[str, Any]]:
         """Fetch recent videos from a channel"""
+        return self.sync_channel_videos(channel_id, max_results, quota_budget)[0]
+    
+    def sync_channel_videos(self, channel_id: str, max_results: int = 50,
+                            quota_budget: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """The channel's `max_results` newest videos, and a summary of what had to be fetched
+        
+        Playlist pages are read one after another (each needs the previous page's token),
+        but the details of each page's new videos are requested on the thread pool as soon as
+        the page arrives. With a video store, a channel synced before is only read down to
+        its first stored video, and only videos whose counts are stale are fetched again,
+        so re-analysing it costs a page or two. The stored videos are only trusted down to
+        `synced_through`: a sync cut short by `max_results` leaves a gap below what it read,
+        and the next sync that needs more videos reads on through it. Stops early once
+        `quota_budget` units (default YOUTUBE_QUOTA_BUDGET, 0 = no limit) would be exceeded.
+        """
+        budget = YOUTUBE_QUOTA_BUDGET if quota_budget is None else quota_budget
+        summary = {'new_videos': 0, 'refreshed': 0, 'playlist_pages': 0}
         try:
-            # Get uploads playlist ID
-            channel_response = self.youtube.channels().list(
-                part='contentDetails',
-                id=channel_id
-            ).execute()
-            
-            if not channel_response['items']:
-                return []
-            
-            uploads_playlist = channel_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+            state = self.store.channel(channel_id) if self.store else None
+            known = self.store.published_dates(channel_id) if self.store else {}
+            # Stored videos with no gap above them (all of them if the playlist was read to the end)
+            synced_through = state['synced_through'] if state else None
+            trusted = sum(1 for published in known.values() if synced_through and published >= synced_through)
+            spent = 0
+            if state:
+                uploads_playlist = state['uploads_playlist']
+            else:
+                # Get uploads playlist ID
+                channel_response = self.execute(self.youtube.channels().list(
+                    part='contentDetails',
+                    id=channel_id
+                ))
+                spent = 1
+                
+                if not channel_response['items']:
+                    return [], summary
+                
+                uploads_playlist = channel_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
+            complete = bool(state and state['complete'])
             
-            # Get videos from uploads playlist
-            videos = []
+            # Page through the uploads playlist, handing each page's new IDs to the pool
+            detail_batches = []
+            new_count = 0
+            seen = 0
+            seen_ids = []
+            caught_up = reached_end = False
             next_page_token = None
             
-            while len(videos) < max_results:
-                playlist_response = self.youtube.playlistItems().list(
+            while seen < max_results:
+                if budget and spent + 2 > budget:  # one playlist page + one details call
+                    print(f"Quota budget of {budget} units reached after {seen} videos")
+                    break
+                playlist_response = self.execute(self.youtube.playlistItems().list(
                     part='snippet',
                     playlistId=uploads_playlist,
-                    maxResults=min(50, max_results - len(videos)),
+                    maxResults=min(50, max_results - seen),
                     pageToken=next_page_token
-                ).execute()
-                
-                video_ids = [item['snippet']['resourceId']['videoId'] for item in playlist_response['items']]
+                ))
+                spent += 1
+                summary['playlist_pages'] += 1
                 
-                # Get detailed video statistics
-                video_details = self.youtube.videos().list(
-                    part='statistics,snippet,contentDetails',
-                    id=','.join(video_ids)
-                ).execute()
-                
-                for video in video_details['items']:
-                    videos.append({
-                        'id': video['id'],
-                        'title': video['snippet']['title'],
-                        'description': video['snippet']['description'],
-                        'published_at': video['snippet']['publishedAt'],
-                        'thumbnail': video['snippet']['thumbnails']['medium']['url'],
-                        'view_count': int(video['statistics'].get('viewCount', 0)),
-                        'like_count': int(video['statistics'].get('likeCount', 0)),
-                        'comment_count': int(video['statistics'].get('commentCount', 0)),
-                        'duration': video['contentDetails']['duration'],
-                        'tags': video['snippet'].get('tags', [])
-                    })
+                page_ids = [item['snippet']['resourceId']['videoId'] for item in playlist_response['items']]
+                video_ids = [v for v in page_ids if v not in known]
+                if video_ids:
+                    detail_batches.append(self._pool.submit(self._get_video_details, video_ids, self.store is None))
+                    new_count += len(video_ids)
+                    spent += 1
+                seen += len(page_ids)
+                seen_ids.extend(page_ids)
                 
+                # The first stored video read is the newest one, and down to synced_through the store
+                # has no gaps, so stop there unless that is still too few
+                if len(video_ids) < len(page_ids) and (complete or trusted + new_count >= max_results):
+                    caught_up = True
+                    break
                 next_page_token = playlist_response.get('nextPageToken')
                 if not next_page_token:
+                    reached_end = True
                     break
             
-            return videos
+            # Collect in playlist order (newest first, as before)
+            videos = []
+            for batch in detail_batches:
+                videos.extend(batch.result())
+            summary['new_videos'] = len(videos)
+            if self.store is None:
+                return videos, summary
+            
+            now = time.time()
+            self.store.save_videos(channel_id, videos, now)
+            stale = self.store.stale_ids(channel_id, max_results, now)
+            batches = [stale[i:i + 50] for i in range(0, len(stale), 50)]
+            if budget:
+                batches = batches[:max(budget - spent, 0)]
+            refreshes = [self._pool.submit(self._get_video_details, batch, False) for batch in batches]
+            for batch, refresh in zip(batches, refreshes):
+                refreshed = refresh.result()
+                self.store.save_videos(channel_id, refreshed, now)
+                # Videos missing from the answer were deleted or made private
+                self.store.remove_videos(channel_id, set(batch) - {v['id'] for v in refreshed})
+                summary['refreshed'] += len(refreshed)
+            if not caught_up and seen_ids:
+                # Everything read is stored now, with no gap down to the oldest of it; below that
+                # only a read to the end of the playlist makes the store whole
+                published = {**known, **{v['id']: v['published_at'] for v in videos}}
+                synced_through = min((published[v] for v in seen_ids if v in published), default=synced_through)
+                complete = reached_end
+            self.store.save_channel(channel_id, uploads_playlist, synced_through, complete)
+            summary['newest_published'] = self.store.channel(channel_id)['newest_published']
+            return self.store.videos(channel_id, max_results), summary
         except Exception as e:
             print(f"Error fetching videos: {e}")
-            return []
+            return [], summary
+    
+    def _get_video_details(self, video_ids: List[str], cache: bool = True) -> List[Dict[str, Any]]:
+        """Statistics, snippet and duration of up to 50 videos (one API call)"""
+        video_details = self.execute(self.youtube.videos().list(
+            part='statistics,snippet,contentDetails',
+            id=','.join(video_ids)
+        ), cache=cache)
+        
+        return [{
+            'id': video['id'],
+            'title': video['snippet']['title'],
+            'description': video['snippet']['description'],
+            'published_at': video['snippet']['publishedAt'],
+            'thumbnail': video['snippet']['thumbnails']['medium']['url'],
+            'view_count': int(video['statistics'].get('viewCount', 0)),
+            'like_count': int(video['statistics'].get('likeCount', 0)),
+            'comment_count': int(video['statistics'].get('commentCount', 0)),
+            'duration': video['contentDetails']['duration'],
+            'tags': video['snippet'].get('tags', [])
+        } for video in video_details['items']]
     
     def get_video_comments(self, video_id: str, max_results: int = 100) -> List[Dict[str, Any]]:
         """Fetch top comments from a video"""
@@ -124,13 +582,13 @@ class DataAcquisitionAgent:
             next_page_token = None
             
             while len(comments) < max_results:
-                response = self.youtube.commentThreads().list(
+                response = self.execute(self.youtube.commentThreads().list(
                     part='snippet',
                     videoId=video_id,
                     maxResults=min(100, max_results - len(comments)),
                     order='relevance',
                     pageToken=next_page_token
-                ).execute()
+                ))
                 
                 for item in response['items']:
                     comment = item['snippet']['topLevelComment']['snippet']
@@ -168,14 +626,25 @@ class DataAcquisitionAgent:
 class TrendAnalysisAgent:
     """Analyzes video performance and identifies trends using Groq"""
     
-    def __init__(self, groq_client):
-        self.groq = groq_client
+    def __init__(self, llm: CompletionCache):
+        self.llm = llm
     
-    def analyze_performance_patterns(self, videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def analyze_performance_patterns(self, videos: List[Dict[str, Any]], use_cache: bool = True) -> Dict[str, Any]:
         """Analyze video performance patterns"""
         if not videos:
             return {'error': 'No videos to analyze'}
         
+        metrics = self.compute_metrics(videos)
+        
+        try:
+            analysis = self.llm.complete(**self.analysis_request(metrics, videos), use_cache=use_cache)
+            
+            return {**metrics, 'groq_analysis': analysis}
+        except Exception as e:
+            return {'error': f'Groq analysis failed: {str(e)}'}
+    
+    def compute_metrics(self, videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Engagement rate of each video (added to it), channel averages and the top performers"""
         # Calculate engagement metrics
         for video in videos:
             views = video['view_count']
@@ -186,39 +655,31 @@ class TrendAnalysisAgent:
         
         # Sort by performance
         sorted_videos = sorted(videos, key=lambda x: x['view_count'], reverse=True)
-        top_performers = sorted_videos[:10]
         
-        # Prepare data for Groq analysis
-        analysis_prompt = self._create_analysis_prompt(top_performers, videos)
-        
-        try:
-            response = self.groq.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert YouTube content analyst. Analyze video performance data and identify patterns, trends, and insights. Provide structured, actionable analysis."
-                    },
-                    {
-                        "role": "user",
-                        "content": analysis_prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
-            )
-            
-            analysis = response.choices[0].message.content
-            
-            return {
-                'top_performers': top_performers[:5],
-                'average_views': sum(v['view_count'] for v in videos) / len(videos),
-                'average_engagement': sum(v['engagement_rate'] for v in videos) / len(videos),
-                'groq_analysis': analysis,
-                'total_videos_analyzed': len(videos)
-            }
-        except Exception as e:
-            return {'error': f'Groq analysis failed: {str(e)}'}
+        return {
+            'top_performers': sorted_videos[:5],
+            'average_views': sum(v['view_count'] for v in videos) / len(videos),
+            'average_engagement': sum(v['engagement_rate'] for v in videos) / len(videos),
+            'total_videos_analyzed': len(videos)
+        }
+    
+    def analysis_request(self, metrics: Dict[str, Any], videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Groq completion arguments for the performance analysis"""
+        return dict(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are an expert YouTube content analyst. Analyze video performance data and identify patterns, trends, and insights. Provide structured, actionable analysis."
+                },
+                {
+                    "role": "user",
+                    "content": self._create_analysis_prompt(metrics['top_performers'], videos)
+                }
+            ],
+            temperature=0.3,
+            max_tokens=2000
+        )
     
     def _create_analysis_prompt(self, top_performers: List[Dict], all_videos: List[Dict]) -> str:
         """Create a detailed prompt for Groq analysis"""
@@ -253,7 +714,7 @@ Provide structured, data-driven insights."""
         
         return prompt
     
-    def analyze_comment_sentiment(self, comments: List[Dict], video_title: str) -> Dict[str, Any]:
+    def analyze_comment_sentiment(self, comments: List[Dict], video_title: str, use_cache: bool = True) -> Dict[str, Any]:
         """Analyze comment sentiment and themes using Groq"""
         if not comments:
             return {'error': 'No comments to analyze'}
@@ -276,7 +737,7 @@ ANALYSIS REQUIRED:
 Provide a structured analysis."""
         
         try:
-            response = self.groq.chat.completions.create(
+            sentiment = self.llm.complete(
                 model="llama-3.3-70b-versatile",
                 messages=[
                     {
@@ -289,11 +750,12 @@ Provide a structured analysis."""
                     }
                 ],
                 temperature=0.3,
-                max_tokens=1000
+                max_tokens=1000,
+                use_cache=use_cache
             )
             
             return {
-                'sentiment_analysis': response.choices[0].message.content,
+                'sentiment_analysis': sentiment,
                 'total_comments_analyzed': len(comments)
             }
         except Exception as e:
@@ -307,12 +769,19 @@ Provide a structured analysis."""
 class StrategyGenerationAgent:
     """Generates content strategy based on trend analysis"""
     
-    def __init__(self, groq_client):
-        self.groq = groq_client
+    def __init__(self, llm: CompletionCache):
+        self.llm = llm
     
-    def generate_content_strategy(self, trend_analysis: Dict, channel_info: Dict) -> Dict[str, Any]:
+    def generate_content_strategy(self, trend_analysis: Dict, channel_info: Dict, use_cache: bool = True) -> Dict[str, Any]:
         """Generate comprehensive content strategy"""
-        
+        try:
+            strategy = self.llm.complete(**self.strategy_request(trend_analysis, channel_info), use_cache=use_cache)
+            return self.finish_strategy(strategy, trend_analysis)
+        except Exception as e:
+            return {'error': f'Strategy generation failed: {str(e)}'}
+    
+    def strategy_request(self, trend_analysis: Dict, channel_info: Dict) -> Dict[str, Any]:
+        """Groq completion arguments for the content strategy"""
         prompt = f"""Based on the following YouTube channel analysis, create a comprehensive content strategy:
 
 CHANNEL: {channel_info.get('title', 'Unknown')}
@@ -351,35 +820,32 @@ TASK: Generate a detailed content strategy with:
 
 Make it actionable and data-driven. Format as structured JSON."""
         
-        try:
-            response = self.groq.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert YouTube content strategist. Create detailed, actionable content strategies based on data analysis. Always return well-structured, implementable recommendations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=3000
-            )
-            
-            strategy = response.choices[0].message.content
-            
-            # Also generate quick wins
-            quick_wins = self._generate_quick_wins(trend_analysis)
-            
-            return {
-                'strategy': strategy,
-                'quick_wins': quick_wins,
-                'generated_at': datetime.now().isoformat()
-            }
-        except Exception as e:
-            return {'error': f'Strategy generation failed: {str(e)}'}
+        return dict(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are an expert YouTube content strategist. Create detailed, actionable content strategies based on data analysis. Always return well-structured, implementable recommendations."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.7,
+            max_tokens=3000
+        )
+    
+    def finish_strategy(self, strategy: str, trend_analysis: Dict) -> Dict[str, Any]:
+        """The strategy text together with the quick wins"""
+        # Also generate quick wins
+        quick_wins = self._generate_quick_wins(trend_analysis)
+        
+        return {
+            'strategy': strategy,
+            'quick_wins': quick_wins,
+            'generated_at': datetime.now().isoformat()
+        }
     
     def _generate_quick_wins(self, trend_analysis: Dict) -> List[str]:
         """Generate immediate action items"""
@@ -411,9 +877,9 @@ Make it actionable and data-driven. Format as structured JSON."""
 # INITIALIZE AGENTS
 # ============================================================================
 
-data_agent = DataAcquisitionAgent(youtube) if youtube else None
-trend_agent = TrendAnalysisAgent(groq_client) if groq_client else None
-strategy_agent = StrategyGenerationAgent(groq_client) if groq_client else None
+data_agent = DataAcquisitionAgent(youtube, cache=api_cache, store=video_store) if youtube else None
+trend_agent = TrendAnalysisAgent(llm) if llm else None
+strategy_agent = StrategyGenerationAgent(llm) if llm else None
 
 
 # ============================================================================
@@ -427,10 +893,20 @@ def health_check():
         'status': 'healthy',
         'youtube_api': 'configured' if YOUTUBE_API_KEY else 'missing',
         'groq_api': 'configured' if GROQ_API_KEY else 'missing',
+        'youtube_quota': {'used': data_agent.quota_used, 'saved': data_agent.quota_saved} if data_agent else None,
+        'cache': api_cache.stats() if api_cache else 'disabled',
+        'llm_cache': llm.stats() if llm else None,
         'timestamp': datetime.now().isoformat()
     })
 
 
+def _use_llm_cache(data: Dict[str, Any]) -> bool:
+    """False when the request opts out of cached Groq answers ("cache": false or Cache-Control: no-cache)"""
+    if 'no-cache' in request.headers.get('Cache-Control', ''):
+        return False
+    return str(data.get('cache', True)).lower() != 'false'
+
+
 def _resolve_channel_id(channel_identifier: str) -> str | None:
     """Resolve a YouTube channel URL/handle/custom name to a channel ID."""
     if not channel_identifier:
@@ -454,7 +930,8 @@ def _resolve_channel_id(channel_identifier: str) -> str | None:
         candidate = m.group(2) or m.group(3) or m.group(4)
         if candidate:
             try:
-                resp = youtube.search().list(part='snippet', q=candidate, type='channel', maxResults=1).execute()
+                resp = data_agent.execute(youtube.search().list(part='snippet', q=candidate, type='channel', maxResults=1),
+                                          cost=100, kind='channel_id')
                 items = resp.get('items', [])
                 if items:
                     return items[0]['snippet']['channelId']
@@ -466,7 +943,8 @@ def _resolve_channel_id(channel_identifier: str) -> str | None:
     if s.startswith('@'):
         handle = s[1:]
         try:
-            resp = youtube.search().list(part='snippet', q=handle, type='channel', maxResults=1).execute()
+            resp = data_agent.execute(youtube.search().list(part='snippet', q=handle, type='channel', maxResults=1),
+                                      cost=100, kind='channel_id')
             items = resp.get('items', [])
             if items:
                 return items[0]['snippet']['channelId']
@@ -476,7 +954,8 @@ def _resolve_channel_id(channel_identifier: str) -> str | None:
 
     # Fallback: try a search with the raw input (best-effort)
     try:
-        resp = youtube.search().list(part='snippet', q=s, type='channel', maxResults=1).execute()
+        resp = data_agent.execute(youtube.search().list(part='snippet', q=s, type='channel', maxResults=1),
+                                  cost=100, kind='channel_id')
         items = resp.get('items', [])
         if items:
             return items[0]['snippet']['channelId']
@@ -509,28 +988,112 @@ def analyze_channel():
         if 'error' in channel_info:
             return jsonify(channel_info), 404
 
-        videos = data_agent.get_channel_videos(resolved_channel_id, max_videos)
+        videos, sync = data_agent.sync_channel_videos(resolved_channel_id, max_videos)
         if not videos:
             return jsonify({'error': 'No videos found'}), 404
 
         # Step 2: Trend Analysis
-        trend_analysis = trend_agent.analyze_performance_patterns(videos)
+        trend_analysis = trend_agent.analyze_performance_patterns(videos, use_cache=_use_llm_cache(data))
 
         # Step 3: Strategy Generation
-        strategy = strategy_agent.generate_content_strategy(trend_analysis, channel_info)
+        strategy = strategy_agent.generate_content_strategy(trend_analysis, channel_info, use_cache=_use_llm_cache(data))
 
         return jsonify({
             'success': True,
             'channel': channel_info,
             'analysis': trend_analysis,
             'strategy': strategy,
-            'videos_analyzed': len(videos)
+            'videos_analyzed': len(videos),
+            'sync': sync
         })
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _sse(event: str, data: Any) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/analyze-channel/stream', methods=['GET', 'POST'])
+def analyze_channel_stream():
+    """/api/analyze-channel as Server-Sent Events, one event per stage as soon as it is ready
+    
+    Events: `channel`, `videos` (with the sync summary), `metrics`, then `analysis_token`
+    pieces while Groq writes the trend analysis and `analysis` with all of it, the same for
+    `strategy_token` / `strategy`, and finally `done`. A failure ends the stream with `error`.
+    Takes the JSON body of /api/analyze-channel, or query parameters for a browser EventSource.
+    """
+    data = request.get_json(silent=True) or request.args.to_dict()
+    channel_id_input = data.get('channel_id')
+    use_cache = _use_llm_cache(data)
+
+    if not channel_id_input:
+        return jsonify({'error': 'channel_id is required'}), 400
+
+    # Query parameters arrive as strings, so check the number before the stream starts
+    try:
+        max_videos = int(data.get('max_videos', 20))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_videos must be a whole number'}), 400
+    if max_videos < 1:
+        return jsonify({'error': 'max_videos must be at least 1'}), 400
+
+    # Resolve URL/handle/custom name to real channel ID
+    resolved_channel_id = _resolve_channel_id(channel_id_input)
+    if not resolved_channel_id:
+        return jsonify({'error': 'Unable to resolve channel ID from input. Provide a channel ID, channel URL, or handle (e.g., @handle).'}), 400
+
+    if not all([data_agent, trend_agent, strategy_agent]):
+        return jsonify({'error': 'API keys not configured'}), 500
+
+    def events():
+        # Step 1: Data Acquisition
+        channel_info = data_agent.get_channel_info(resolved_channel_id)
+        if 'error' in channel_info:
+            yield _sse('error', {'stage': 'channel', **channel_info})
+            return
+        yield _sse('channel', channel_info)
+
+        videos, sync = data_agent.sync_channel_videos(resolved_channel_id, max_videos)
+        if not videos:
+            yield _sse('error', {'stage': 'videos', 'error': 'No videos found'})
+            return
+        yield _sse('videos', {'videos': videos, 'sync': sync})
+
+        # Step 2: Trend Analysis
+        metrics = trend_agent.compute_metrics(videos)
+        yield _sse('metrics', metrics)
+        try:
+            parts = []
+            for text in llm.stream(**trend_agent.analysis_request(metrics, videos), use_cache=use_cache):
+                parts.append(text)
+                yield _sse('analysis_token', {'text': text})
+        except Exception as e:
+            yield _sse('error', {'stage': 'analysis', 'error': f'Groq analysis failed: {str(e)}'})
+            return
+        trend_analysis = {**metrics, 'groq_analysis': ''.join(parts)}
+        yield _sse('analysis', trend_analysis)
+
+        # Step 3: Strategy Generation
+        try:
+            parts = []
+            for text in llm.stream(**strategy_agent.strategy_request(trend_analysis, channel_info), use_cache=use_cache):
+                parts.append(text)
+                yield _sse('strategy_token', {'text': text})
+        except Exception as e:
+            yield _sse('error', {'stage': 'strategy', 'error': f'Strategy generation failed: {str(e)}'})
+            return
+        yield _sse('strategy', strategy_agent.finish_strategy(''.join(parts), trend_analysis))
+
+        yield _sse('done', {'success': True, 'videos_analyzed': len(videos)})
+
+    # No buffering on the way out, or the events would arrive all at once
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 def _extract_video_id(video_id_or_url: str) -> str | None:
     """Extract a 11-char YouTube video ID from a URL or return it if already an ID."""
     if not video_id_or_url:
@@ -587,10 +1150,10 @@ def analyze_video():
 
     try:
         # Fetch video details
-        video_response = youtube.videos().list(
+        video_response = data_agent.execute(youtube.videos().list(
             part='snippet,statistics',
             id=video_id
-        ).execute()
+        ))
 
         if not video_response.get('items'):
             return jsonify({'error': 'Video not found'}), 404
@@ -611,7 +1174,7 @@ def analyze_video():
         transcript = data_agent.get_video_transcript(video_id)
 
         # Analyze sentiment
-        sentiment = trend_agent.analyze_comment_sentiment(comments, video_info['title'])
+        sentiment = trend_agent.analyze_comment_sentiment(comments, video_info['title'], use_cache=_use_llm_cache(data))
 
         return jsonify({
             'success': True,
@@ -641,12 +1204,12 @@ def search_channels():
         return jsonify({'error': 'YouTube API not configured'}), 500
     
     try:
-        response = youtube.search().list(
+        response = data_agent.execute(youtube.search().list(
             part='snippet',
             q=query,
             type='channel',
             maxResults=max_results
-        ).execute()
+        ), cost=100)
         
         channels = []
         for item in response['items']:
@@ -673,7 +1236,7 @@ def generate_ideas():
     if not niche:
         return jsonify({'error': 'niche is required'}), 400
     
-    if not groq_client:
+    if not llm:
         return jsonify({'error': 'Groq API not configured'}), 500
     
     try:
@@ -688,19 +1251,20 @@ For each idea provide:
 
 Make them trending, data-driven, and actionable."""
         
-        response = groq_client.chat.completions.create(
+        ideas = llm.complete(
             model="llama-3.3-70b-versatile",
             messages=[
                 {"role": "system", "content": "You are a YouTube content strategy expert specializing in viral content."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.8,
-            max_tokens=2000
+            max_tokens=2000,
+            use_cache=_use_llm_cache(data)
         )
         
         return jsonify({
             'success': True,
-            'ideas': response.choices[0].message.content,
+            'ideas': ideas,
             'niche': niche
         })
     
@@ -715,6 +1279,7 @@ if __name__ == '__main__':
     
     print("\nEndpoints:")
     print("  POST /api/analyze-channel - Analyze channel and generate strategy")
+    print("  GET|POST /api/analyze-channel/stream - The same, streamed as Server-Sent Events")
     print("  POST /api/analyze-video - Deep dive into specific video")
     print("  POST /api/search-channels - Search for channels")
     print("  POST /api/generate-ideas - Generate content ideas by niche")
@@ -1,24 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-import openpyxl
+from startup import timer  # first, so the startup report covers the other imports
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, Response, abort
 import os
 import threading
 # import webview # Commented out if not running in webview context for now
 from collections import defaultdict
 from werkzeug.utils import secure_filename  # For secure file names
-from datetime import datetime, date
-import webview
-app = Flask(__name__)
-app.secret_key = "secret_key"  # For flashing messages
-data_dir = "data"
-
-if not os.path.exists(data_dir):
-    os.makedirs(data_dir)
+from datetime import datetime, date, timedelta
+from io import BytesIO
+import datastores
+from dashboard import create_app
+from defaulters import write_xlsx, write_pdf
+from ledger import parse_date, period_start, next_period
+from paging import paginate, render_page
+from bulk import import_students, post_payments, template_csv, BulkFileError
+from pictures import PictureStore, THUMB_SIZES
+import receipts
+from store import Student, CompStudent
+
+# Student, fee and computer academy pages; school_app.py serves them next to the transport and payroll pages.
+fee_pages = Blueprint('fees', __name__)
+data_dir = datastores.DATA_DIR
 
 # Define upload folder for pictures (stored in static/uploads)
-UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
+UPLOAD_FOLDER = os.path.join(fee_pages.root_path, 'static', 'uploads')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # Allowed file extensions for student pictures.
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -26,26 +32,35 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Paths for Excel files
-students_file = os.path.join(data_dir, "students.xlsx")
+# Uploads are stored once per distinct image, with thumbnails made in the background.
+pictures = PictureStore(UPLOAD_FOLDER)
+
+# Batch receipts and reports are drawn on a process pool, started with the first print job.
+print_queue = receipts.PrintQueue()
 
-# Initialize Excel file with updated headers including "Admission Date" and "Picture"
-def initialize_excel_file(file_path, headers):
-    if not os.path.exists(file_path):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.append(headers)  # Add header row
-        wb.save(file_path)
+def release_picture(filename):
+    """Delete a picture file unless another student (in either roster) still uses it."""
+    if not filename:
+        return
+    if any(s.picture == filename for s in students.all()) or \
+       any(s.picture == filename for s in comp_students.all()):
+        return
+    pictures.discard(filename)
 
-# Header: "Admission Date", "Picture"
-initialize_excel_file(students_file, [
-    "ID", "Name", "Father Name", "Contact Number", "Grade", "Monthly Fee", "Months Paid",
-    "Paid Fee", "Dues", "Paid Dates", "Annual Charge", "Paid Annual Charge", "Admission Fee",
-    "Paid Admission Fee", "Admission Date", "Exam Charge", "Paid Exam Charge", "Remarks", "Picture"
-])
+# Paths for Excel files (created with a header row on first run, see datastores.py)
+students_file = datastores.STUDENTS_FILE
 
+# Process-wide cache of students.xlsx, shared with the dashboard; reloaded only when the file
+# changes on disk. Edits are journaled and merged into the workbook in the background.
+# payments: one entry per paid month, with the paid date parsed once when the student is saved.
+# fee_totals: collected/outstanding totals per (grade, year, month) and per student, updated on every edit.
+# student_search: n-gram index over ID, name, father's name and contact for the search box and sibling lookup.
+# defaulter_grid: paid months as bitmasks per student and year, for the unpaid view and defaulter exports.
+# student_accounts: expected fee, paid and dues per grade, the totals of the student list.
+students, payments, fee_totals, student_search, defaulter_grid, student_accounts, _ = datastores.school_roster()
 
-@app.route('/')
+
+@fee_pages.route('/')
 def index():
     return render_template('index.html')
 
@@ -54,14 +69,14 @@ def index():
 #     app.run(host='127.0.0.1', port=5000)
 
 
-@app.route('/add_student', methods=['GET', 'POST'])
+@fee_pages.route('/add_student', methods=['GET', 'POST'])
 def add_student():
     if request.method == 'POST':
         student_id = request.form.get('id', '').strip()
         name = request.form.get('name', '').strip()
         if not student_id or not name:
             flash("ID and Name are required.", "error")
-            return redirect(url_for('add_student'))
+            return redirect(url_for('.add_student'))
 
         fathers_name = request.form.get('fathers_name', '').strip()
         contact_number = request.form.get('contact_number', '').strip()
@@ -94,77 +109,88 @@ def add_student():
         picture_filename = ""
         if picture_file and picture_file.filename != "":
             if allowed_file(picture_file.filename):
-                filename = secure_filename(picture_file.filename)
-                picture_filename = f"{student_id}_{filename}"
-                picture_file.save(os.path.join(app.config['UPLOAD_FOLDER'], picture_filename))
+                picture_filename = pictures.save(picture_file)
             else:
                 flash("Invalid file type for picture. Allowed types: png, jpg, jpeg, gif", "error")
-                return redirect(url_for('add_student'))
+                return redirect(url_for('.add_student'))
 
-        wb = openpyxl.load_workbook(students_file)
-        ws = wb.active
-        ws.append([
+        students.add(Student(
             student_id, name, fathers_name, contact_number, grade, monthly_fee, months_paid_str,
             paid_fee, dues, paid_dates_str, annual_charge, paid_annual_charge, # Use paid_dates_str
             admission_fee, paid_admission_fee, admission_date, exam_charge, paid_exam_charge, "", picture_filename
-        ])
-        wb.save(students_file)
+        ))
 
         flash("Student added successfully!", "success")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
 
     return render_template('add_student.html')
 
 
-@app.route('/students', methods=['GET', 'POST'])
+class _GroupTotals(dict):
+    """Running totals of some groups; a group missing from them is read from `accounts`.
+
+    The page lists students read before the totals, so a student added meanwhile can be
+    in a group that did not exist yet when the groups were listed.
+    """
+
+    def __init__(self, accounts, groups):
+        super().__init__((g, accounts.totals(g)) for g in groups)
+        self.accounts = accounts
+
+    def __missing__(self, group):
+        self[group] = totals = self.accounts.totals(group)
+        return totals
+
+
+def list_totals(accounts, account, matching=None, groups=None):
+    """({group: {'fee', 'paid_fee', 'dues'}}, overall totals) for a student list.
+
+    matching=None means the whole roster, or just `groups`: the totals are read from
+    `accounts` without touching the students. Otherwise they are summed over `matching`.
+    """
+    if matching is None:
+        by_group = _GroupTotals(accounts, accounts.groups() if groups is None else groups)
+    else:
+        by_group = defaultdict(lambda: {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0})
+        for record in matching:
+            group, expected, paid = account(record)
+            by_group[group]['fee'] += expected
+            by_group[group]['paid_fee'] += paid
+            by_group[group]['dues'] += record.dues or 0.0
+    overall = {key: sum(t[key] for t in by_group.values()) for key in ('fee', 'paid_fee', 'dues')}
+    return by_group, overall
+
+
+@fee_pages.route('/students', methods=['GET', 'POST'])
 def manage_students():
     search_query = request.args.get('search', '').lower().strip()
     grade_filter = request.args.get('grade', '').strip()
     dues_range = request.args.get('dues_range', '').strip()
     sort_by = request.args.get('sort_by', '').strip()
 
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-    all_students = list(ws.iter_rows(min_row=2, values_only=True))
-
     exact_match = None
     similar_students = []
     filtered_students = [] # Initialize filtered_students
 
     if search_query:
-        # This temporary list will hold matches from the loop
-        # We'll assign it to filtered_students after the loop if it's populated,
-        # or handle the exact_match logic.
+        # An exact ID is a dictionary lookup; partial queries go through the search index.
         current_search_results = []
-        for student_tuple in all_students:
-            s_id = str(student_tuple[0]).lower() if len(student_tuple) > 0 and student_tuple[0] is not None else ""
-            s_name = str(student_tuple[1]).lower() if len(student_tuple) > 1 and student_tuple[1] is not None else ""
-            s_father_name = str(student_tuple[2]).lower() if len(student_tuple) > 2 and student_tuple[2] is not None else ""
-            # s_contact = str(student_tuple[3]).lower() if len(student_tuple) > 3 and student_tuple[3] is not None else "" # Not used in this part of search
-
-            if search_query.isdigit() or search_query.startswith('s'): # Search by ID
-                if search_query == s_id:
-                    exact_match = student_tuple # Found exact match by ID
-                    # Find similar students (same father's name or contact)
-                    if exact_match: # Should always be true here
-                        similar_students = [
-                            s for s in all_students
-                            if len(s) > 3 and s != exact_match and (
-                                (s[2] == exact_match[2] and str(s[2]).strip()) or
-                                (str(s[3]) == str(exact_match[3]) and str(s[3]).strip())
-                            )
-                        ]
-                    # For exact ID match, we prioritize it and its similar ones
-                    # So, we can break the loop and set filtered_students outside
-                    break 
-                elif search_query in s_id: # Partial ID match
-                    current_search_results.append(student_tuple)
-            elif (search_query in s_id or 
-                  search_query in s_name or 
-                  search_query in s_father_name): # General search
-                current_search_results.append(student_tuple)
-        
+        if search_query.isdigit() or search_query.startswith('s'): # Search by ID
+            id_matches = students.lookup('id', search_query)
+            exact_match = id_matches[0] if id_matches else None
+            if exact_match is None:
+                # Digits that are not an ID may be (part of) a phone number.
+                current_search_results = student_search.search(search_query, fields=('id', 'contact'))
+        else:
+            current_search_results = student_search.search(search_query, fields=('id', 'name', 'father_name'))
+
         if exact_match: # If an exact ID match was found
+            # Similar students (same father's name or contact) come from the index's hash maps
+            seen_ids = {exact_match.id}
+            for s in student_search.siblings(exact_match):
+                if s.id not in seen_ids:
+                    seen_ids.add(s.id)
+                    similar_students.append(s)
             filtered_students = [exact_match] + similar_students
         elif current_search_results: # If no exact ID match, but other matches found
             filtered_students = current_search_results
@@ -172,83 +198,59 @@ def manage_students():
              flash(f"No student found for query: {search_query}", "info")
              filtered_students = [] # Ensure it's an empty list
 
+    elif grade_filter:
+        filtered_students = students.lookup('grade', grade_filter)
     else: # No search query
-        filtered_students = all_students
+        filtered_students = students.all()
 
     if grade_filter:
-        filtered_students = [s for s in filtered_students if len(s) > 4 and str(s[4]).strip() == grade_filter]
+        filtered_students = [s for s in filtered_students if s.grade == grade_filter]
 
     if dues_range:
         try:
             dues_range_clean = dues_range.replace(" ", "")
-            temp_filtered_students = []
-            for student_tuple in filtered_students:
-                if len(student_tuple) > 8 and student_tuple[8] is not None:
-                    try:
-                        student_dues = float(student_tuple[8])
-                        if dues_range_clean.endswith('+'):
-                            min_dues = float(dues_range_clean[:-1])
-                            if student_dues >= min_dues:
-                                temp_filtered_students.append(student_tuple)
-                        else:
-                            min_dues, max_dues = map(float, dues_range_clean.split('-'))
-                            if min_dues <= student_dues < max_dues:
-                                temp_filtered_students.append(student_tuple)
-                    except ValueError:
-                        # print(f"Warning: Could not parse dues '{student_tuple[8]}' for student ID '{student_tuple[0]}'")
-                        continue 
-            filtered_students = temp_filtered_students
+            if dues_range_clean.endswith('+'):
+                min_dues = float(dues_range_clean[:-1])
+                filtered_students = [s for s in filtered_students if s.dues >= min_dues]
+            else:
+                min_dues, max_dues = map(float, dues_range_clean.split('-'))
+                filtered_students = [s for s in filtered_students if min_dues <= s.dues < max_dues]
         except Exception as e:
             flash(f"Invalid dues range format: {e}", "error")
 
 
     grade_order = ["PG", "NUR", "PREP", "1", "2", "3", "4", "5", "6", "7", "8", "9", "10"]
+    # Sort keys end with the ID so every row has a unique, stable position for paging.
     if sort_by == 'dues':
-        def get_dues_key(student_tuple):
-            try:
-                return float(student_tuple[8] if len(student_tuple) > 8 and student_tuple[8] is not None else 0)
-            except ValueError:
-                return 0 
-        sorted_students = sorted(filtered_students, key=get_dues_key, reverse=True)
+        def sort_key(s):
+            return (-s.dues, s.id)
     else:
-        def get_grade_key(student_tuple):
-            grade_val = str(student_tuple[4]) if len(student_tuple) > 4 and student_tuple[4] is not None else ""
-            return grade_order.index(grade_val) if grade_val in grade_order else len(grade_order)
-        sorted_students = sorted(filtered_students, key=get_grade_key)
-
-
-    categorized_students = defaultdict(lambda: {'students': [], 'totals': {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0}})
-    grand_total_metrics = {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0}
-
-    for s_data in sorted_students:
-        s_grade = str(s_data[4]) if len(s_data) > 4 and s_data[4] else "N/A"
-        s_monthly_fee = float(s_data[5]) if len(s_data) > 5 and s_data[5] else 0.0
-        s_months_paid_str = s_data[6] if len(s_data) > 6 and s_data[6] else ""
-        s_months_paid_count = len([m for m in s_months_paid_str.split(",") if m.strip()]) if s_months_paid_str else 0
-        s_paid_fee = float(s_data[7]) if len(s_data) > 7 and s_data[7] else 0.0
-        s_dues = float(s_data[8]) if len(s_data) > 8 and s_data[8] else 0.0
-        s_annual_charge = float(s_data[10]) if len(s_data) > 10 and s_data[10] else 0.0
-        s_paid_annual_charge = float(s_data[11]) if len(s_data) > 11 and s_data[11] else 0.0
-        s_admission_fee = float(s_data[12]) if len(s_data) > 12 and s_data[12] else 0.0
-        s_paid_admission_fee = float(s_data[13]) if len(s_data) > 13 and s_data[13] else 0.0
-        s_exam_charge = float(s_data[15]) if len(s_data) > 15 and s_data[15] else 0.0
-        s_paid_exam_charge = float(s_data[16]) if len(s_data) > 16 and s_data[16] else 0.0
-
-        student_total_expected = (s_monthly_fee * s_months_paid_count) + s_annual_charge + s_admission_fee + s_exam_charge
-        student_total_paid = s_paid_fee + s_paid_annual_charge + s_paid_admission_fee + s_paid_exam_charge
-        
+        def sort_key(s):
+            return (grade_order.index(s.grade) if s.grade in grade_order else len(grade_order), s.id)
+    sorted_students = sorted(filtered_students, key=sort_key)
+
+
+    # Totals cover every matching student, not just the ones on this page. Without a search or
+    # dues filter they are the running totals in student_accounts.
+    if search_query or dues_range:
+        grade_totals, grand_total_metrics = list_totals(student_accounts, datastores.student_account, sorted_students)
+    else:
+        grade_totals, grand_total_metrics = list_totals(
+            student_accounts, datastores.student_account,
+            groups=[grade_filter] if grade_filter else None)
+
+    page = paginate(sorted_students, sort_key)
+    categorized_students = {}
+    for s_data in page.items:
+        s_grade = s_data.grade or "N/A"
+        categorized_students.setdefault(s_grade, {'students': [], 'totals': grade_totals[s_grade]})
         categorized_students[s_grade]['students'].append(s_data)
-        categorized_students[s_grade]['totals']['fee'] += student_total_expected
-        categorized_students[s_grade]['totals']['paid_fee'] += student_total_paid
-        categorized_students[s_grade]['totals']['dues'] += s_dues 
 
-        grand_total_metrics['fee'] += student_total_expected
-        grand_total_metrics['paid_fee'] += student_total_paid
-        grand_total_metrics['dues'] += s_dues
-        
-    return render_template(
+    return render_page(
+        page,
         'students.html',
         categorized_students=categorized_students,
+        grades=sorted(student_accounts.groups(), key=lambda g: grade_sort_key.get(g, len(grade_order))),
         total_fee=grand_total_metrics['fee'],
         total_paid_fee=grand_total_metrics['paid_fee'],
         total_dues=grand_total_metrics['dues'],
@@ -260,107 +262,91 @@ def manage_students():
     )
 
 
-@app.route('/students/delete/<string:student_id>', methods=['POST'])
+@fee_pages.route('/students/bulk', methods=['GET', 'POST'])
+def bulk_students():
+    """
+    Enrolls students or posts fee payments from an uploaded CSV/Excel file in one save.
+    """
+    result = None
+    if request.method == 'POST':
+        kind = request.form.get('kind', 'students')
+        upload = request.files.get('file')
+        if not upload or upload.filename == "":
+            flash("Choose a CSV or Excel file to upload.", "error")
+            return redirect(url_for('.bulk_students'))
+        action = post_payments if kind == 'payments' else import_students
+        try:
+            result = action(students, upload, skip_errors=bool(request.form.get('skip_errors')))
+        except BulkFileError as e:
+            flash(str(e), "error")
+            return redirect(url_for('.bulk_students'))
+
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'rows': result.rows, 'applied': result.applied, 'saved': result.saved,
+                            'errors': [e._asdict() for e in result.errors]})
+        if result.saved:
+            done = "students enrolled" if kind == 'students' else "payment rows posted"
+            flash(f"{result.applied} of {result.rows} {done}.", "success")
+        else:
+            flash(f"Nothing was saved: {len(result.errors)} of {result.rows} rows have problems. "
+                  "Fix them, or tick the box to save the good rows only.", "error")
+    return render_template('bulk_import.html', result=result)
+
+
+@fee_pages.route('/students/bulk/template/<string:kind>.csv', methods=['GET'])
+def bulk_template(kind):
+    if kind not in ('students', 'payments'):
+        return redirect(url_for('.bulk_students'))
+    return Response(template_csv(kind), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={kind}_template.csv'})
+
+
+@fee_pages.route('/students/delete/<string:student_id>', methods=['POST'])
 def delete_student(student_id):
-    print(f"--- Starting deletion process for student_id: '{student_id}' ---") # Debug
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-    row_to_delete = None
-    picture_filename = None
     student_id_stripped = student_id.strip()
-    print(f"Stripped ID to search for: '{student_id_stripped}'") # Debug
-
-    # Find the student row and get picture filename
-    for row in ws.iter_rows(min_row=2):
-        # row[0] is the cell for ID, row[18] is the cell for Picture
-        cell_value = row[0].value
-        cell_id_str = str(cell_value).strip() if cell_value is not None else ""
-        
-        print(f"Checking row {row[0].row}: Found ID '{cell_id_str}'") # Debug
-
-        if cell_id_str == student_id_stripped:
-            print(f"MATCH FOUND: Student '{student_id_stripped}' found at Excel row {row[0].row}") # Debug
-            row_to_delete = row
-            if len(row) > 18 and row[18].value:
-                picture_filename = str(row[18].value)
-                print(f"Associated picture found: '{picture_filename}'") # Debug
-            else:
-                print("No associated picture found for this student.") # Debug
-            break  # Found the student, no need to search further
+    student = students.get(student_id_stripped)
 
-    if row_to_delete is None:
-        print(f"ERROR: Student with ID '{student_id_stripped}' was not found after checking all rows.") # Debug
+    if student is None:
+        print(f"ERROR: Student with ID '{student_id_stripped}' was not found.") # Debug
         flash("Student not found. Please check the ID.", "error")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
 
-    # Delete the picture file if it exists
-    if picture_filename:
-        try:
-            picture_path = os.path.join(app.config['UPLOAD_FOLDER'], picture_filename)
-            print(f"Attempting to delete picture file at: '{picture_path}'") # Debug
-            if os.path.exists(picture_path):
-                os.remove(picture_path)
-                print("Picture file deleted successfully.") # Debug
-            else:
-                print("Picture file not found at the specified path.") # Debug
-        except OSError as e:
-            # Log the error or flash a more specific message if needed
-            print(f"ERROR deleting picture file: {e}") # Debug
-            flash(f"Error deleting picture file: {e}", "error")
-
-    # Delete the row from the Excel sheet using its row index
-    row_index_to_delete = row_to_delete[0].row
-    print(f"Attempting to delete Excel row number: {row_index_to_delete}") # Debug
-    ws.delete_rows(row_index_to_delete)
-    print("Row deleted from worksheet object.") # Debug
-    
     try:
-        wb.save(students_file)
-        print("Excel file saved successfully.") # Debug
+        students.delete(student_id_stripped)
     except Exception as e:
         print(f"ERROR saving Excel file: {e}") # Debug
         flash(f"Could not save changes to the data file: {e}", "error")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
+
+    # Delete the picture file if no other student shares it
+    try:
+        release_picture(student.picture)
+    except OSError as e:
+        print(f"ERROR deleting picture file: {e}") # Debug
+        flash(f"Error deleting picture file: {e}", "error")
 
     flash("Student deleted successfully!", "success")
-    print(f"--- Finished deletion process for student_id: '{student_id}' ---") # Debug
-    return redirect(url_for('manage_students'))
+    return redirect(url_for('.manage_students'))
 
 
-@app.route('/students/modify/<string:student_id>', methods=['GET', 'POST'])
+@fee_pages.route('/students/modify/<string:student_id>', methods=['GET', 'POST'])
 def modify_student(student_id):
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-    student_row_cells = None
-    for row in ws.iter_rows(min_row=2, values_only=False):
-        if str(row[0].value).strip() == student_id:
-            student_row_cells = row
-            break
-    if student_row_cells is None:
+    student = students.get(student_id)
+    if student is None:
         flash("Student not found.", "error")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
 
     if request.method == 'POST':
-        # Existing numeric values (fallback to 0.0)
-        ex_monthly_fee = float(student_row_cells[5].value) if student_row_cells[5].value else 0.0
-        ex_paid_fee = float(student_row_cells[7].value) if student_row_cells[7].value else 0.0
-        ex_annual_charge = float(student_row_cells[10].value) if student_row_cells[10].value else 0.0
-        ex_paid_annual_charge = float(student_row_cells[11].value) if student_row_cells[11].value else 0.0
-        ex_admission_fee = float(student_row_cells[12].value) if student_row_cells[12].value else 0.0
-        ex_paid_admission_fee = float(student_row_cells[13].value) if student_row_cells[13].value else 0.0
-        ex_exam_charge = float(student_row_cells[15].value) if student_row_cells[15].value else 0.0
-        ex_paid_exam_charge = float(student_row_cells[16].value) if student_row_cells[16].value else 0.0
-
         # Form inputs (use existing values as fallback where appropriate)
-        new_monthly_fee = float(request.form['monthly_fee']) if request.form.get('monthly_fee', '').strip() else ex_monthly_fee
+        new_monthly_fee = float(request.form['monthly_fee']) if request.form.get('monthly_fee', '').strip() else student.monthly_fee
         additional_paid_fee = float(request.form['paid_fee']) if request.form.get('paid_fee', '').strip() else 0.0
-        new_annual_charge = float(request.form['annual_charge']) if request.form.get('annual_charge', '').strip() else ex_annual_charge
-        new_paid_annual_charge = float(request.form['paid_annual_charge']) if request.form.get('paid_annual_charge', '').strip() else ex_paid_annual_charge
-        new_admission_fee = float(request.form['admission_fee']) if request.form.get('admission_fee', '').strip() else ex_admission_fee
-        new_paid_admission_fee = float(request.form['paid_admission_fee']) if request.form.get('paid_admission_fee', '').strip() else ex_paid_admission_fee
-        new_admission_date = request.form.get('admission_date', '').strip() or (student_row_cells[14].value if student_row_cells[14].value else "")
-        new_exam_charge = float(request.form['exam_charge']) if request.form.get('exam_charge', '').strip() else ex_exam_charge
-        new_paid_exam_charge = float(request.form['paid_exam_charge']) if request.form.get('paid_exam_charge', '').strip() else ex_paid_exam_charge
+        new_annual_charge = float(request.form['annual_charge']) if request.form.get('annual_charge', '').strip() else student.annual_charge
+        new_paid_annual_charge = float(request.form['paid_annual_charge']) if request.form.get('paid_annual_charge', '').strip() else student.paid_annual_charge
+        new_admission_fee = float(request.form['admission_fee']) if request.form.get('admission_fee', '').strip() else student.admission_fee
+        new_paid_admission_fee = float(request.form['paid_admission_fee']) if request.form.get('paid_admission_fee', '').strip() else student.paid_admission_fee
+        new_admission_date = request.form.get('admission_date', '').strip() or student.admission_date
+        new_exam_charge = float(request.form['exam_charge']) if request.form.get('exam_charge', '').strip() else student.exam_charge
+        new_paid_exam_charge = float(request.form['paid_exam_charge']) if request.form.get('paid_exam_charge', '').strip() else student.paid_exam_charge
         new_payment_date_for_months = request.form.get('paid_date', '').strip()
 
         # Months handling
@@ -370,10 +356,8 @@ def modify_student(student_id):
                                'August', 'September', 'October', 'November', 'December']
 
         # Current stored months and dates
-        current_months_paid_str = student_row_cells[6].value or ""
-        current_months_paid_list = [m.strip() for m in current_months_paid_str.split(",") if m.strip()]
-        current_paid_dates_str = student_row_cells[9].value or ""
-        current_paid_dates_list = [d.strip() for d in current_paid_dates_str.split(",") if d.strip()]
+        current_months_paid_list = [m.strip() for m in student.months_paid.split(",") if m.strip()]
+        current_paid_dates_list = [d.strip() for d in student.paid_dates.split(",") if d.strip()]
 
         # Build a map month -> existing date (if present). We use indices to align.
         temp_paid_dates_map = {}
@@ -406,118 +390,106 @@ def modify_student(student_id):
             else:
                 final_paid_dates_list.append(temp_paid_dates_map.get(month_name, ""))
 
-        # Update Excel row cells
-        student_row_cells[5].value = new_monthly_fee
-        student_row_cells[6].value = ", ".join(final_months_paid_list)
-        student_row_cells[9].value = ", ".join(final_paid_dates_list)
-
         # Update paid amount (incremental)
-        updated_total_monthly_paid_fee = ex_paid_fee + additional_paid_fee
-        student_row_cells[7].value = updated_total_monthly_paid_fee
-
-        # Update other charges and payments
-        student_row_cells[10].value = new_annual_charge
-        student_row_cells[11].value = new_paid_annual_charge
-        student_row_cells[12].value = new_admission_fee
-        student_row_cells[13].value = new_paid_admission_fee
-        student_row_cells[14].value = new_admission_date
-        student_row_cells[15].value = new_exam_charge
-        student_row_cells[16].value = new_paid_exam_charge
+        updated_total_monthly_paid_fee = student.paid_fee + additional_paid_fee
 
         # Recalculate dues
         total_expected_monthly_fees = len([m for m in final_months_paid_list if m.strip()]) * new_monthly_fee
         total_expected_overall = total_expected_monthly_fees + new_annual_charge + new_admission_fee + new_exam_charge
         total_paid_overall = updated_total_monthly_paid_fee + new_paid_annual_charge + new_paid_admission_fee + new_paid_exam_charge
-        student_row_cells[8].value = total_expected_overall - total_paid_overall
 
         # Picture handling (optional)
+        new_picture_filename = student.picture
         picture_file = request.files.get('picture')
         if picture_file and picture_file.filename != "":
             if allowed_file(picture_file.filename):
-                old_picture_filename = student_row_cells[18].value
-                if old_picture_filename:
-                    try:
-                        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], str(old_picture_filename)))
-                    except OSError:
-                        pass
-                filename = secure_filename(picture_file.filename)
-                new_picture_filename = f"{student_id}_{filename}"
-                picture_file.save(os.path.join(app.config['UPLOAD_FOLDER'], new_picture_filename))
-                student_row_cells[18].value = new_picture_filename
+                new_picture_filename = pictures.save(picture_file)
             else:
                 flash("Invalid file type for picture. Allowed types: png, jpg, jpeg, gif", "error")
-                return redirect(url_for('modify_student', student_id=student_id))
-
-        wb.save(students_file)
+                return redirect(url_for('.modify_student', student_id=student_id))
+
+        students.update(student._replace(
+            monthly_fee=new_monthly_fee,
+            months_paid=", ".join(final_months_paid_list),
+            paid_dates=", ".join(final_paid_dates_list),
+            paid_fee=updated_total_monthly_paid_fee,
+            annual_charge=new_annual_charge,
+            paid_annual_charge=new_paid_annual_charge,
+            admission_fee=new_admission_fee,
+            paid_admission_fee=new_paid_admission_fee,
+            admission_date=new_admission_date,
+            exam_charge=new_exam_charge,
+            paid_exam_charge=new_paid_exam_charge,
+            dues=total_expected_overall - total_paid_overall,
+            picture=new_picture_filename,
+        ))
+        if new_picture_filename != student.picture:
+            try:
+                release_picture(student.picture)
+            except OSError:
+                pass
         flash("Student information updated successfully!", "success")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
 
     # GET: prepare data for rendering the form
     student_data = {
-        "id": student_row_cells[0].value, "name": student_row_cells[1].value,
-        "fathers_name": student_row_cells[2].value, "contact_number": student_row_cells[3].value,
-        "grade": student_row_cells[4].value, "monthly_fee": student_row_cells[5].value,
-        "paid_fee": student_row_cells[7].value, "annual_charge": student_row_cells[10].value,
-        "paid_annual_charge": student_row_cells[11].value, "admission_fee": student_row_cells[12].value,
-        "paid_admission_fee": student_row_cells[13].value, "admission_date": student_row_cells[14].value,
-        "exam_charge": student_row_cells[15].value, "paid_exam_charge": student_row_cells[16].value,
-        "months_paid": [m.strip() for m in (student_row_cells[6].value or "").split(",") if m.strip()],
-        "paid_dates_str": student_row_cells[9].value, "picture": student_row_cells[18].value
+        "id": student.id, "name": student.name,
+        "fathers_name": student.father_name, "contact_number": student.contact,
+        "grade": student.grade, "monthly_fee": student.monthly_fee,
+        "paid_fee": student.paid_fee, "annual_charge": student.annual_charge,
+        "paid_annual_charge": student.paid_annual_charge, "admission_fee": student.admission_fee,
+        "paid_admission_fee": student.paid_admission_fee, "admission_date": student.admission_date,
+        "exam_charge": student.exam_charge, "paid_exam_charge": student.paid_exam_charge,
+        "months_paid": [m.strip() for m in student.months_paid.split(",") if m.strip()],
+        "paid_dates_str": student.paid_dates, "picture": student.picture
     }
     all_possible_months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
                            'August', 'September', 'October', 'November', 'December']
     return render_template('test.html', student=student_data, months=all_possible_months)
 
-@app.route('/students/report/<string:student_id>', methods=['GET', 'POST'])
+@fee_pages.route('/students/report/<string:student_id>', methods=['GET', 'POST'])
 def student_report(student_id):
     student_id_stripped = student_id.strip()
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-    student_row_cells = None
-    for row in ws.iter_rows(min_row=2, values_only=False):
-        if row[0].value is not None and str(row[0].value).strip() == student_id_stripped:
-            student_row_cells = row
-            break
-    if student_row_cells is None:
+    student = students.get(student_id_stripped)
+    if student is None:
         flash("Student not found. Please check the ID.", "error")
-        return redirect(url_for('manage_students'))
+        return redirect(url_for('.manage_students'))
 
     if request.method == 'POST':
         submitted_remarks = request.form.getlist('remarks') 
-        student_row_cells[17].value = ", ".join(submitted_remarks) 
-        wb.save(students_file)
+        students.update(student._replace(remarks=", ".join(submitted_remarks)))
         flash("Remarks saved successfully!", "success")
-        return redirect(url_for('student_report', student_id=student_id_stripped))
+        return redirect(url_for('.student_report', student_id=student_id_stripped))
 
     s_data = {
-        "id": student_row_cells[0].value, "name": student_row_cells[1].value,
-        "father_name": student_row_cells[2].value, "contact_number": student_row_cells[3].value,
-        "grade": student_row_cells[4].value,
-        "monthly_fee": float(student_row_cells[5].value) if student_row_cells[5].value else 0.0,
-        "months_paid_str": student_row_cells[6].value if student_row_cells[6].value else "",
-        "paid_fee": float(student_row_cells[7].value) if student_row_cells[7].value else 0.0,
-        "dues": float(student_row_cells[8].value) if student_row_cells[8].value else 0.0,
-        "paid_dates_str": student_row_cells[9].value if student_row_cells[9].value else "",
-        "annual_charge": float(student_row_cells[10].value) if student_row_cells[10].value else 0.0,
-        "paid_annual_charge": float(student_row_cells[11].value) if student_row_cells[11].value else 0.0,
-        "admission_fee": float(student_row_cells[12].value) if student_row_cells[12].value else 0.0,
-        "paid_admission_fee": float(student_row_cells[13].value) if student_row_cells[13].value else 0.0,
-        "admission_date": student_row_cells[14].value if student_row_cells[14].value else "",
-        "exam_charge": float(student_row_cells[15].value) if student_row_cells[15].value else 0.0,
-        "paid_exam_charge": float(student_row_cells[16].value) if student_row_cells[16].value else 0.0,
-        "remarks_str": student_row_cells[17].value if student_row_cells[17].value else "",
-        "picture": student_row_cells[18].value if len(student_row_cells) > 18 and student_row_cells[18].value else ""
+        "id": student.id, "name": student.name,
+        "father_name": student.father_name, "contact_number": student.contact,
+        "grade": student.grade,
+        "monthly_fee": student.monthly_fee,
+        "months_paid_str": student.months_paid,
+        "paid_fee": student.paid_fee,
+        "dues": student.dues,
+        "paid_dates_str": student.paid_dates,
+        "annual_charge": student.annual_charge,
+        "paid_annual_charge": student.paid_annual_charge,
+        "admission_fee": student.admission_fee,
+        "paid_admission_fee": student.paid_admission_fee,
+        "admission_date": student.admission_date,
+        "exam_charge": student.exam_charge,
+        "paid_exam_charge": student.paid_exam_charge,
+        "remarks_str": student.remarks,
+        "picture": student.picture
     }
     s_data["months_paid"] = [m.strip() for m in s_data["months_paid_str"].split(',') if m.strip()]
     s_data["paid_dates"] = [d.strip() for d in s_data["paid_dates_str"].split(',') if d.strip()]
     s_data["remarks"] = [r.strip() for r in s_data["remarks_str"].split(',') if r.strip()]
 
     payment_history = []
-    for i, month in enumerate(s_data["months_paid"]):
+    for i, p in enumerate(payments.for_student(student.id)):
         payment_entry = {
-            "month": month,
-            "date_paid": s_data["paid_dates"][i] if i < len(s_data["paid_dates"]) else "N/A",
-            "amount": s_data["monthly_fee"], 
+            "month": p.month_name,
+            "date_paid": p.date_text or "N/A",
+            "amount": p.amount, 
             "remark": s_data["remarks"][i] if i < len(s_data["remarks"]) else "" 
         }
         payment_history.append(payment_entry)
@@ -541,17 +513,15 @@ grade_sort_key = {grade: i for i, grade in enumerate(grade_order)}
 academic_months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
                    'August', 'September', 'October', 'November', 'December']
 
-def parse_date(date_str):
-    if not date_str: return None
-    try:
-        return datetime.strptime(str(date_str).split(" ")[0], '%Y-%m-%d').date() 
-    except ValueError:
-        try: 
-            return datetime.strptime(str(date_str).split(" ")[0], '%d-%m-%Y').date()
-        except ValueError:
-            return None
+def parse_dues_range(text):
+    """(low, high) from "100-500" or "500+" (high is infinite); ValueError if unreadable."""
+    text = text.replace(' ', '')
+    if text.endswith('+'):
+        return float(text[:-1]), float('inf')
+    low, high = map(float, text.split('-'))
+    return low, high
 
-@app.route('/fee_collection', methods=['GET'])
+@fee_pages.route('/fee_collection', methods=['GET'])
 def fee_collection():
     # --- 1. Read query parameters ---
     start_date_str   = request.args.get('start_date', '').strip()
@@ -569,11 +539,11 @@ def fee_collection():
     raw_records = []
     all_grades = set()
     grand_total = 0.0
+    owed = None  # the defaulter projection, for the filtered unpaid view
 
-    # --- 3. Load workbook ---
+    # --- 3. Read the cached roster ---
     try:
-        wb = openpyxl.load_workbook(students_file, data_only=True)
-        ws = wb.active
+        roster = students.all()
     except Exception as e:
         flash(f"Could not open data file: {e}", 'error')
         return render_template('fee_collection.html', all_records=[], all_grades=[], months=academic_months,
@@ -583,146 +553,97 @@ def fee_collection():
                                dues_range=dues_range, search_student=search_q)
 
     # --- 4. Build raw per-month entries ---
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        sid   = str(row[0] or '').strip()
-        name  = str(row[1] or '').strip()
-        grade = str(row[4] or '').strip()
-        if not grade:
+    presummarized = view_type != 'paid' and not (start_date or end_date or month_filter or search_q)
+    roster_by_id = {}
+    for s in roster:
+        if not s.grade:
             continue
-        all_grades.add(grade)
-        if grade_filter and grade != grade_filter:
+        all_grades.add(s.grade)
+        if grade_filter and s.grade != grade_filter:
             continue
+        roster_by_id.setdefault(s.id, s)
 
-        fee         = float(row[5] or 0)
-        admit_dt    = parse_date(str(row[14] or ''))
-        paid_months = [m.strip() for m in str(row[6] or '').split(',') if m.strip()]
-        paid_dates  = [d.strip() for d in str(row[9] or '').split(',') if d.strip()]
-
-        if view_type == 'paid':
-            for i, m in enumerate(paid_months):
-                if month_filter and month_filter.lower() != m.lower():
-                    continue
-                dt_str = paid_dates[i] if i < len(paid_dates) else ''
-                dt_obj = parse_date(dt_str)
-                # If user asked date range, exclude entries that have no parsed paid date
-                if start_date and (dt_obj is None or dt_obj < start_date):
-                    continue
-                if end_date and (dt_obj is None or dt_obj > end_date):
-                    continue
-                rec = {
-                    'student_id': sid,
-                    'student':    name,
-                    'grade':      grade,
-                    'parsed_date': dt_obj,
-                    'display_date': dt_obj.isoformat() if dt_obj else dt_str,
-                    'month':       m,
-                    'amount':      fee,
-                    'type':        'paid'
-                }
-                raw_records.append(rec)
-                grand_total += fee
-
+    if view_type == 'paid':
+        # Date range and month filters are answered by the ledger's indexes.
+        for p in payments.query(start=start_date, end=end_date, month=month_filter):
+            s = roster_by_id.get(p.student_id)
+            if s is None:
+                continue
+            rec = {
+                'student_id': s.id,
+                'student':    s.name,
+                'grade':      s.grade,
+                'parsed_date': p.paid_on,
+                'display_date': p.paid_on.isoformat() if p.paid_on else p.date_text,
+                'month':       p.month_name,
+                'amount':      p.amount,
+                'type':        'paid'
+            }
+            raw_records.append(rec)
+            grand_total += p.amount
+
+    elif presummarized:
+        # The unfiltered unpaid summary is maintained incrementally; no month loops needed.
+        raw_records = fee_totals.unpaid_summary(grade_filter)
 
-        else:
-            # build paid set
-            paid_set = {}
-            for i, m in enumerate(paid_months):
-                if i < len(paid_dates):
-                    pd = parse_date(paid_dates[i])
-                    if pd:
-                        paid_set[(pd.year, m.lower())] = True
-            # determine years
-            current_year = datetime.now().year
-            if start_date and end_date:
-                years = range(start_date.year, end_date.year + 1)
-            elif start_date:
-                years = range(start_date.year, current_year + 1)
-            elif end_date:
-                sy = admit_dt.year if admit_dt else current_year
-                years = range(sy, end_date.year + 1)
-            else:
-                sy = admit_dt.year if admit_dt else current_year
-                years = range(sy, current_year + 1)
-            # generate unpaid
-            for y in years:
-                for idx, mn in enumerate(academic_months):
-                    m_date = date(y, idx + 1, 1)
-                    if admit_dt and m_date < date(admit_dt.year, admit_dt.month, 1):
-                        continue
-                    if not end_date and m_date > date.today():
-                        continue
-                    if start_date and m_date < date(start_date.year, start_date.month, 1):
-                        continue
-                    if end_date and m_date > date(end_date.year, end_date.month, 1):
-                        continue
-                    if month_filter and month_filter.lower() != mn.lower():
-                        continue
-                    if not paid_set.get((y, mn.lower()), False):
-                        rec = {
-                            'student_id': sid,
-                            'student':    name,
-                            'grade':      grade,
-                            'parsed_date': m_date,
-                            'display_month': f"{mn} {y}",
-                            'amount':       fee,
-                            'type':        'unpaid'
-                        }
-                        raw_records.append(rec)
-                        grand_total += fee
+    else:
+        # Months owed in the window, for every student at once (see defaulters.py).
+        owed = defaulter_grid.project(start_date, end_date, month_filter, grade_filter or None)
+        raw_records = owed.rows
+        grand_total = owed.total
 
     # --- 5. Apply student search filter ---
     if search_q:
         raw_records = [r for r in raw_records
                        if r['student_id'].lower() == search_q
                           or search_q in r['student'].lower()]
+        if owed is not None:
+            # A searched student's unpaid months are listed one per row.
+            raw_records = [{'student_id': r['student_id'], 'student': r['student'], 'grade': r['grade'],
+                            'parsed_date': date(y, m, 1), 'display_month': f"{academic_months[m - 1]} {y}",
+                            'amount': r['monthly_fee'], 'type': 'unpaid'}
+                           for r in raw_records for y, m in owed.months(r['student_id'])]
+            grand_total = sum(r['amount'] for r in raw_records)
         if not raw_records:
             flash(f"No {view_type} records for '{search_q}'", 'info')
 
     # --- 6. Aggregate unpaid summary ---
     unpaid_summary = (view_type == 'unpaid' and not search_q)
     if unpaid_summary:
-        summary = {}
-        for r in raw_records:
-            sid = r['student_id']
-            summary.setdefault(sid, {'student':r['student'],'grade':r['grade'],'months':[],'total_due':0.0})
-            summary[sid]['months'].append(r['display_month'])
-            summary[sid]['total_due'] += r['amount']
-        raw_records = [
-            {'student_id':sid,'student':v['student'],'grade':v['grade'],'count':len(v['months']),'months_list':v['months'],'total_due':v['total_due']}
-            for sid,v in summary.items()
-        ]
+        # Both sources already give one row per student (the grid fills in months_list per page below).
         grand_total = sum(v['total_due'] for v in raw_records)
         # filter by dues_range
         if dues_range:
-            dr = dues_range.replace(' ', '')
-            filtered = []
             try:
-                if dr.endswith('+'):
-                    min_due = float(dr[:-1])
-                    filtered = [r for r in raw_records if r['total_due'] >= min_due]
-                else:
-                    low, high = map(float, dr.split('-'))
-                    filtered = [r for r in raw_records if low <= r['total_due'] < high]
-                raw_records = filtered
+                low, high = parse_dues_range(dues_range)
+                raw_records = [r for r in raw_records if low <= r['total_due'] < high]
             except ValueError:
                 flash(f"Invalid dues range: {dues_range}", 'error')
 
     # --- 7. Sort ---
+    # The trailing ID/month fields make each row's key unique, so it can serve as the page cursor.
     def sort_key(r):
         dt = r.get('parsed_date')
         if dt is None:
             dt = date.min if r.get('type') == 'paid' else date.max
         return (
             grade_sort_key.get(r.get('grade', ''), len(grade_order)),
-            dt,
-            r.get('student', '').lower()
+            dt.toordinal(),
+            r.get('student', '').lower(),
+            r.get('student_id', ''),
+            r.get('display_month') or r.get('month') or '',
+            r.get('display_date') or '',
         )
     final = sorted(raw_records, key=sort_key)
     sorted_grades = sorted(all_grades, key=lambda g: grade_sort_key.get(g, len(grade_order)))
+    page = paginate(final, sort_key)
+    if unpaid_summary and owed is not None:
+        for rec in page.items:
+            rec['months_list'] = owed.months_list(rec['student_id'])
 
     # --- 8. Render template ---
-    return render_template('fee_collection.html',
-                            all_records=final,
+    return render_page(page, 'fee_collection.html',
+                            all_records=page.items,
                             all_grades=sorted_grades,
                             months=academic_months,
                             start_date=start_date_str,
@@ -742,52 +663,16 @@ def fee_collection():
 #     # webview.start()
 #     app.run(debug=True) # Standard Flask debug mode
 
-  # For secure file names
-app.secret_key = "secret_key"  
-data_dir = "data"
-
-if not os.path.exists(data_dir):
-    os.makedirs(data_dir)
-
-# Define upload folder for pictures (stored in static/uploads)
-UPLOAD_FOLDER = os.path.join(app.root_path, 'static', 'uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Allowed file extensions for student pictures.
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
 # Paths for Excel files
-comp_file = os.path.join(data_dir, "comp.xlsx")
-
-# Initialize Excel file with updated headers including "Admission Date" and "Picture"
-def initialize_excel_file(file_path, headers):
-    if not os.path.exists(file_path):
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.append(headers)  # Add header row
-        wb.save(file_path)
+comp_file = datastores.COMP_FILE
 
-# Updated header for computer academy: Removed "Grade", "Annual Charge", "Exam Charge"
-# Kept "Admission Date" and "Picture".
-initialize_excel_file(comp_file, [
-    "ID", "Name", "Father Name", "Contact Number", "Course", "Monthly Fee", "Months Paid",
-    "Paid Fee", "Dues", "Paid Dates", "Admission Fee", "Paid Admission Fee", "Admission Date", "Remarks", "Picture"
-])
+# Computer academy roster; its fee totals are grouped by course instead of grade.
+# comp_daily: count, total and student IDs per paid date, for the daily collection page.
+comp_students, comp_payments, comp_totals, comp_search, comp_defaulters, comp_accounts, comp_daily = \
+    datastores.comp_roster()
 
 
-
-
-
-def start_flask():
-    app.run(host='127.0.0.1', port=5000)
-
-
-@app.route('/add_comp', methods=['GET', 'POST'])
+@fee_pages.route('/add_comp', methods=['GET', 'POST'])
 def add_comp():
     if request.method == 'POST':
         # Get required fields; ID and Name cannot be empty.
@@ -795,7 +680,7 @@ def add_comp():
         name = request.form.get('name', '').strip()
         if not student_id or not name:
             flash("ID and Name are required.", "error")
-            return redirect(url_for('add_student'))
+            return redirect(url_for('.add_student'))
 
         # Get optional fields (if empty, use empty string or 0.0 for numbers)
         fathers_name = request.form.get('fathers_name', '').strip()
@@ -824,29 +709,24 @@ def add_comp():
         picture_filename = ""
         if picture_file and picture_file.filename != "":
             if allowed_file(picture_file.filename):
-                filename = secure_filename(picture_file.filename)
-                picture_filename = f"{student_id}_{filename}"
-                picture_file.save(os.path.join(app.config['UPLOAD_FOLDER'], picture_filename))
+                picture_filename = pictures.save(picture_file)
             else:
                 flash("Invalid file type for picture. Allowed types: png, jpg, jpeg, gif", "error")
-                return redirect(url_for('add_student'))
+                return redirect(url_for('.add_student'))
 
         # Save data to Excel (note the new order of fields; the new "Picture" field is last)
-        wb = openpyxl.load_workbook(comp_file)
-        ws = wb.active
-        ws.append([
+        comp_students.add(CompStudent(
             student_id, name, fathers_name, contact_number, course, monthly_fee, months_paid_str,
             paid_fee, dues, paid_date, admission_fee, paid_admission_fee, admission_date, "", picture_filename
-        ])
-        wb.save(comp_file)
+        ))
 
         flash("Student added successfully!", "success")
-        return redirect(url_for('comp'))
+        return redirect(url_for('.comp'))
 
     return render_template('add_comp.html')
 
 
-@app.route('/comp', methods=['GET', 'POST'])
+@fee_pages.route('/comp', methods=['GET', 'POST'])
 def comp():
     # Get query parameters (only available on GET requests)
     search_query = request.args.get('search', '').lower().strip()
@@ -860,7 +740,7 @@ def comp():
         name = request.form.get('name', '').strip()
         if not student_id or not name:
             flash("ID and Name are required.", "error")
-            return redirect(url_for('comp'))
+            return redirect(url_for('.comp'))
 
         fathers_name = request.form.get('fathers_name', '').strip()
         contact_number = request.form.get('contact_number', '').strip()
@@ -878,33 +758,22 @@ def comp():
 
         dues = (total_months_fee + admission_fee) - (paid_fee + paid_admission_fee)
 
-        wb = openpyxl.load_workbook(comp_file)
-        ws = wb.active
-        ws.append([
+        comp_students.add(CompStudent(
             student_id, name, fathers_name, contact_number, course, monthly_fee, months_paid_str,
             paid_fee, dues, paid_date, admission_fee, paid_admission_fee, admission_date, "", ""
-        ])
-        wb.save(comp_file)
+        ))
 
         flash("Student added successfully!", "success")
-        return redirect(url_for('comp'))
-
-    # Load student data from Excel (for GET requests)
-    wb = openpyxl.load_workbook(comp_file)
-    ws = wb.active
-    all_students = list(ws.iter_rows(min_row=2, values_only=True))
+        return redirect(url_for('.comp'))
 
     # --- SEARCH FILTERING ---
-    # Look for the search term in Student ID, Name, or Father's Name
+    # Look for the search term in Student ID, Name, or Father's Name (via the search index)
     if search_query:
-        filtered_students = [
-            student for student in all_students
-            if search_query in str(student[0]).lower() or
-               search_query in str(student[1]).lower() or
-               search_query in str(student[2]).lower()
-        ]
+        filtered_students = comp_search.search(search_query, fields=('id', 'name', 'father_name'))
+    elif course_filter:
+        filtered_students = comp_students.lookup('course', course_filter)
     else:
-        filtered_students = all_students
+        filtered_students = comp_students.all()
 
     # --- COURSE FILTERING ---
     if course_filter:
@@ -924,115 +793,85 @@ def comp():
             flash("Invalid dues range format.", "error")
 
     # --- SORTING ---
+    # Keys end with the ID so each row has a unique position for paging.
     if sort_by == 'dues':
-        sorted_students = sorted(filtered_students, key=lambda student: float(student[8]), reverse=True)
+        def sort_key(student):
+            return (-float(student[8]), str(student[0]))
     else:
-        sorted_students = filtered_students  # No grade to sort by
+        def sort_key(student):
+            return (str(student[4]), str(student[0]))  # No grade to sort by; group by course
+    sorted_students = sorted(filtered_students, key=sort_key)
 
     # --- CATEGORIZING BY COURSE & Totals Calculation ---
-    # Indexes: 5: Monthly Fee, 6: Months Paid, 7: Paid Fee, 8: Dues, 9: Paid Dates,
-    # 10: Admission Fee, 11: Paid Admission Fee, 12: Admission Date, 13: Remarks, 14: Picture.
-    categorized_students = defaultdict(lambda: {'students': [], 'totals': {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0}})
-    for student in sorted_students:
+    # Course totals cover every matching student; only the current page's rows are listed.
+    # Without a search or dues filter they are the running totals in comp_accounts.
+    if search_query or dues_range:
+        course_totals, overall = list_totals(comp_accounts, datastores.comp_account, sorted_students)
+    else:
+        course_totals, overall = list_totals(
+            comp_accounts, datastores.comp_account,
+            groups=[g for g in comp_accounts.groups() if g.strip() == course_filter] if course_filter else None)
+
+    page = paginate(sorted_students, sort_key)
+    categorized_students = {}
+    for student in page.items:
         course = str(student[4])
+        categorized_students.setdefault(course, {'students': [], 'totals': course_totals[course]})
         categorized_students[course]['students'].append(student)
 
-        monthly_fee = student[5] if student[5] else 0.0
-        months_paid_count = len((student[6] or "").split(", ")) if student[6] else 0
-        admission_fee = student[10] if student[10] else 0.0
-        paid_fee = student[7] if student[7] else 0.0
-        paid_admission_fee = student[11] if student[11] else 0.0
-        dues = student[8] if student[8] else 0.0
-
-        categorized_students[course]['totals']['fee'] += (monthly_fee * months_paid_count) + admission_fee
-        categorized_students[course]['totals']['paid_fee'] += paid_fee + paid_admission_fee
-        categorized_students[course]['totals']['dues'] += dues
-
-    total_fee = sum(
-        (student[5] if student[5] else 0.0) * len((student[6] or "").split(", ")) +
-        (student[10] if student[10] else 0.0)
-        for student in sorted_students
-    )
-    total_paid_fee = sum(
-        (student[7] if student[7] else 0.0) +
-        (student[11] if student[11] else 0.0)
-        for student in sorted_students
-    )
-    total_dues = sum(student[8] if student[8] else 0.0 for student in sorted_students)
-
-    return render_template(
+    return render_page(
+        page,
         'comp.html',
         categorized_students=categorized_students,
-        total_fee=total_fee,
-        total_paid_fee=total_paid_fee,
-        total_dues=total_dues,
+        courses=sorted(comp_accounts.groups()),
+        total_fee=overall['fee'],
+        total_paid_fee=overall['paid_fee'],
+        total_dues=overall['dues'],
         search_query=request.args.get('search', ''),
         course_filter=course_filter,
-        dues_range=dues_range
+        dues_range=dues_range,
+        sort_by=sort_by
     )
 
 
 
-@app.route('/comp/delete/<string:student_id>', methods=['POST'])
+@fee_pages.route('/comp/delete/<string:student_id>', methods=['POST'])
 def delete_comp(student_id):
-    wb = openpyxl.load_workbook(comp_file)
-    ws = wb.active
-
-    student_row_index = None
     student_id_stripped = student_id.strip() # Ensure no leading/trailing spaces
-    picture_filename = None
+    student = comp_students.get(student_id_stripped)
 
-    for idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-        if str(row[0]).strip() == student_id_stripped:
-            student_row_index = idx
-            # Picture is in the 15th column (index 14)
-            if len(row) > 14 and row[14]:
-                picture_filename = str(row[14])
-            break
-
-    if student_row_index is None:
+    if student is None:
         flash("Student not found. Please check the ID.", "error")
-        return redirect(url_for('comp'))
-
-    # Delete picture file if it exists
-    if picture_filename:
-        try:
-            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], picture_filename))
-        except OSError as e:
-            flash(f"Error deleting picture file {picture_filename}: {e}", "error")
+        return redirect(url_for('.comp'))
+    comp_students.delete(student_id_stripped)
 
-    ws.delete_rows(student_row_index)
-    wb.save(comp_file)
+    # Delete picture file if no other student shares it
+    try:
+        release_picture(student.picture)
+    except OSError as e:
+        flash(f"Error deleting picture file {student.picture}: {e}", "error")
 
     flash("Student deleted successfully!", "success")
-    return redirect(url_for('comp'))
+    return redirect(url_for('.comp'))
 
 
-@app.route('/comp/modify/<string:student_id>', methods=['GET', 'POST'])
+@fee_pages.route('/comp/modify/<string:student_id>', methods=['GET', 'POST'])
 def modify_comp(student_id):
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-
-    # Locate the student's row
-    student_row = None
-    for row in ws.iter_rows(min_row=2, values_only=False):
-        if str(row[0].value).strip() == student_id:
-            student_row = row
-            break
-    else:
+    student = comp_students.get(student_id.strip())
+    if student is None:
         flash("Student not found.", "error")
-        return redirect(url_for('comp'))
+        return redirect(url_for('.comp'))
 
     if request.method == 'POST':
         # Retrieve updated values from the form.
         # Make sure your form includes an input field named "monthly_fee"
         new_monthly_fee = (
             float(request.form['monthly_fee'])
-            if request.form.get('monthly_fee', '').strip() else (student_row[5].value or 0.0)
+            if request.form.get('monthly_fee', '').strip() else (student.monthly_fee or 0.0)
         )
         new_paid_fee = float(request.form['paid_fee']) if request.form.get('paid_fee', '').strip() else 0.0
-        new_admission_fee = float(request.form['admission_fee']) if request.form.get('admission_fee', '').strip() else (student_row[10].value or 0.0)
-        paid_admission_fee = float(request.form['paid_admission_fee']) if request.form.get('paid_admission_fee', '').strip() else (student_row[11].value or 0.0)
+        new_admission_fee = float(request.form['admission_fee']) if request.form.get('admission_fee', '').strip() else (student.admission_fee or 0.0)
+        paid_admission_fee = float(request.form['paid_admission_fee']) if request.form.get('paid_admission_fee', '').strip() else (student.paid_admission_fee or 0.0)
         new_admission_date = request.form.get('admission_date', '').strip()  # New field
         new_paid_date = request.form.get('paid_date', '').strip()
 
@@ -1042,8 +881,7 @@ def modify_comp(student_id):
         months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
                   'August', 'September', 'October', 'November', 'December']
         # Split the stored months string and combine with new ones.
-        current_months = (student_row[6].value or "").split(", ")
-        current_months = [m for m in current_months if m.strip()]
+        current_months = [m for m in (student.months_paid or "").split(", ") if m.strip()]
         combined_months = current_months + new_months_paid
 
         # Remove duplicates by using set, sort them according to our months order.
@@ -1053,63 +891,57 @@ def modify_comp(student_id):
         updated_months_paid = [month for month in updated_months_paid if month.strip()]
 
         # Update paid dates.
-        current_paid_dates = (student_row[9].value or "").split(", ")
-        current_paid_dates = [d for d in current_paid_dates if d.strip()]
+        current_paid_dates = [d for d in (student.paid_dates or "").split(", ") if d.strip()]
         updated_paid_dates = current_paid_dates + [new_paid_date] * len(new_months_paid)
         aligned_paid_dates = updated_paid_dates[:len(updated_months_paid)]
 
-        # Update the Excel row.
-        # Column indexes based on our header:
-        # 0: ID, 1: Name, 2: Father Name, 3: Contact Number, 4: Course,
-        # 5: Monthly Fee, 6: Months Paid, 7: Paid Fee, 8: Dues, 9: Paid Dates,
-        # 10: Admission Fee, 11: Paid Admission Fee, 12: Admission Date, 13: Remarks, 14: Picture.
-        student_row[5].value = new_monthly_fee                # Update monthly fee.
-        student_row[6].value = ", ".join(updated_months_paid)
-        student_row[9].value = ", ".join(aligned_paid_dates)
-
         total_months_fee = len(updated_months_paid) * new_monthly_fee
 
-        student_row[7].value = new_paid_fee
-        student_row[10].value = new_admission_fee
-        student_row[11].value = paid_admission_fee
-        student_row[12].value = new_admission_date  # Admission Date.
-
-        # Recalculate dues:
-        student_row[8].value = (total_months_fee + new_admission_fee) - (
-            new_paid_fee + paid_admission_fee
-        )
-
         # Process picture file upload (optional update)
+        new_picture = student.picture
         picture_file = request.files.get('picture')
         if picture_file and picture_file.filename != "":
             if allowed_file(picture_file.filename):
-                filename = secure_filename(picture_file.filename)
-                picture_filename = f"{student_id}_{filename}"
-                picture_file.save(os.path.join(app.config['UPLOAD_FOLDER'], picture_filename))
-                student_row[14].value = picture_filename
+                new_picture = pictures.save(picture_file)
             else:
                 flash("Invalid file type for picture. Allowed types: png, jpg, jpeg, gif", "error")
-                return redirect(url_for('modify_comp', student_id=student_id))
-
-        wb.save(students_file)
+                return redirect(url_for('.modify_comp', student_id=student_id))
+
+        comp_students.update(student._replace(
+            monthly_fee=new_monthly_fee,
+            months_paid=", ".join(updated_months_paid),
+            paid_dates=", ".join(aligned_paid_dates),
+            paid_fee=new_paid_fee,
+            admission_fee=new_admission_fee,
+            paid_admission_fee=paid_admission_fee,
+            admission_date=new_admission_date,
+            # Dues: (monthly fee * months paid) + admission fee, minus what was paid.
+            dues=(total_months_fee + new_admission_fee) - (new_paid_fee + paid_admission_fee),
+            picture=new_picture,
+        ))
+        if new_picture != student.picture:
+            try:
+                release_picture(student.picture)
+            except OSError:
+                pass
         flash("Student information updated successfully!", "success")
-        return redirect(url_for('comp'))
+        return redirect(url_for('.comp'))
 
     # For GET, prepare the student data to populate the form.
     student_data = {
-        "id": student_row[0].value,
-        "name": student_row[1].value,
-        "fathers_name": student_row[2].value,
-        "contact_number": student_row[3].value,
-        "course": student_row[4].value,
-        "monthly_fee": student_row[5].value,
-        "admission_fee": student_row[10].value,
-        "paid_fee": student_row[7].value,
-        "paid_admission_fee": student_row[11].value,
-        "admission_date": student_row[12].value,  # New field
-        "months_paid": [m for m in (student_row[6].value or "").split(", ") if m.strip()],
-        "paid_date": student_row[9].value,
-        "picture": student_row[14].value  # Include picture filename (if any)
+        "id": student.id,
+        "name": student.name,
+        "fathers_name": student.father_name,
+        "contact_number": student.contact,
+        "course": student.course,
+        "monthly_fee": student.monthly_fee,
+        "admission_fee": student.admission_fee,
+        "paid_fee": student.paid_fee,
+        "paid_admission_fee": student.paid_admission_fee,
+        "admission_date": student.admission_date,  # New field
+        "months_paid": [m for m in (student.months_paid or "").split(", ") if m.strip()],
+        "paid_date": student.paid_dates,
+        "picture": student.picture  # Include picture filename (if any)
     }
 
     months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
@@ -1118,50 +950,42 @@ def modify_comp(student_id):
     return render_template('comp_manage.html', student=student_data, months=months)
 
 
-@app.route('/comp/report/<string:student_id>', methods=['GET', 'POST'])
+@fee_pages.route('/comp/report/<string:student_id>', methods=['GET', 'POST'])
 def comp_report(student_id):
     student_id = student_id.strip()
-    wb = openpyxl.load_workbook(comp_file)
-    ws = wb.active
-
-    student_row = None
-    for row in ws.iter_rows(min_row=2, values_only=False):
-        if row[0].value is not None and str(row[0].value).strip() == student_id:
-            student_row = row
-            break
+    student = comp_students.get(student_id)
 
-    if student_row is None:
+    if student is None:
         flash("Student not found. Please check the ID.", "error")
-        return redirect(url_for('comp'))
+        return redirect(url_for('.comp'))
 
     if request.method == 'POST':
         submitted_remarks = request.form.getlist('remarks')
-        existing_remarks = student_row[13].value.split(", ") if student_row[13].value else []
+        existing_remarks = student.remarks.split(", ") if student.remarks else []
         updated_remarks = [
             remark if i < len(submitted_remarks) else existing_remarks[i]
             for i, remark in enumerate(submitted_remarks)
         ]
-        student_row[13].value = ", ".join(updated_remarks)
-        wb.save(comp_file)
+        comp_students.update(student._replace(remarks=", ".join(updated_remarks)))
         flash("Remarks saved successfully!", "success")
-        return redirect(url_for('comp_report', student_id=student_id))
+        return redirect(url_for('.comp_report', student_id=student_id))
 
     student_data = {
-        "id": student_row[0].value,
-        "name": student_row[1].value,
-        "father_name": student_row[2].value,
-        "contact_number": student_row[3].value,
-        "course": student_row[4].value,
-        "monthly_fee": float(student_row[5].value) if student_row[5].value else 0.0,
-        "months_paid": student_row[6].value.split(", ") if student_row[6].value else [],
-        "paid_fee": float(student_row[7].value) if student_row[7].value else 0.0,
-        "dues": float(student_row[8].value) if student_row[8].value else 0.0,
-        "paid_dates": student_row[9].value.split(", ") if student_row[9].value else [],
-        "admission_fee": float(student_row[10].value) if student_row[10].value else 0.0,
-        "paid_admission_fee": float(student_row[11].value) if student_row[11].value else 0.0,
-        "admission_date": student_row[12].value,  # New field
-        "remarks": student_row[13].value.split(", ") if student_row[13].value else [],
-        "picture": student_row[14].value if len(student_row) > 14 else ""
+        "id": student.id,
+        "name": student.name,
+        "father_name": student.father_name,
+        "contact_number": student.contact,
+        "course": student.course,
+        "monthly_fee": student.monthly_fee,
+        "months_paid": student.months_paid.split(", ") if student.months_paid else [],
+        "paid_fee": student.paid_fee,
+        "dues": student.dues,
+        "paid_dates": student.paid_dates.split(", ") if student.paid_dates else [],
+        "admission_fee": student.admission_fee,
+        "paid_admission_fee": student.paid_admission_fee,
+        "admission_date": student.admission_date,  # New field
+        "remarks": student.remarks.split(", ") if student.remarks else [],
+        "picture": student.picture
 
     }
 
@@ -1185,48 +1009,273 @@ def comp_report(student_id):
     )
 
 
-@app.route('/comp_fee', methods=['GET'])
+def collection_window():
+    """(start, end) dates asked for on the daily collection pages: ?period=week|month (the current
+    one), or ?start_date / ?end_date. (None, None) when no range was given."""
+    today = date.today()
+    period = request.args.get('period', '').strip()
+    if period in ('week', 'month'):
+        start = period_start(today, period)
+        return start, next_period(start, period) - timedelta(days=1)
+    return (parse_date(request.args.get('start_date', '').strip()),
+            parse_date(request.args.get('end_date', '').strip()))
+
+@fee_pages.route('/comp_fee', methods=['GET'])
 def comp_fee():
     """
     Displays fee collection data date-wise.
+    A single date (filter_date) is one lookup in comp_daily; ranges are bisected from its sorted days.
     """
     filter_date = request.args.get('filter_date', '').strip()
+    start, end = collection_window()
+
+    if filter_date:
+        day = parse_date(filter_date)
+        days = [(day, comp_daily.day(day))] if day else []
+        days = [(d, entry) for d, entry in days if entry['count']]
+    elif start or end:
+        days = comp_daily.between(start, end)
+    else:
+        days = comp_daily.between() + comp_daily.undated()
 
-    fee_collection_summary = defaultdict(lambda: {'count': 0, 'total_fee': 0.0, 'students': []})
-
-    wb = openpyxl.load_workbook(students_file)
-    ws = wb.active
-
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        monthly_fee = float(row[5]) if row[5] else 0.0
-        paid_dates_str = row[9] if row[9] else ''
-        paid_dates = [date.strip() for date in paid_dates_str.split(",") if date.strip()]
-
-        for date in paid_dates:
-            if filter_date and date != filter_date:
-                continue
-            fee_collection_summary[date]['count'] += 1
-            fee_collection_summary[date]['total_fee'] += monthly_fee
-            fee_collection_summary[date]['students'].append(row[1])
-
-    summary_list = sorted(fee_collection_summary.items(), key=lambda x: x[0])
+    summary_list = []
+    for d, entry in days:
+        names = []
+        for student_id in entry['student_ids']:
+            s = comp_students.get(student_id)
+            names.append(s.name if s else student_id)
+        summary_list.append((d.isoformat() if isinstance(d, date) else d,
+                             {'count': entry['count'], 'total_fee': entry['total'], 'students': names}))
 
     return render_template(
         'comp_fee.html',
         summary_list=summary_list,
         filter_date=filter_date,
+        start_date=start.isoformat() if start else '',
+        end_date=end.isoformat() if end else '',
+        period=request.args.get('period', ''),
+        grand_total=sum(entry['total_fee'] for _, entry in summary_list),
     )
 
+@fee_pages.route('/comp_fee/series.json', methods=['GET'])
+def comp_fee_series():
+    """
+    Computer academy collections per day, week or month (?step=) as JSON, for charts.
+    Same range parameters as /comp_fee; every period in the range is listed, empty ones with zeros.
+    """
+    step = request.args.get('step', 'day')
+    if step not in ('day', 'week', 'month'):
+        return jsonify({'error': f"Unknown step: {step} (use day, week or month)"}), 400
+    start, end = collection_window()
+    series = comp_daily.series(start, end, step)
+    return jsonify({
+        'step': step,
+        'start': series[0]['date'] if series else None,
+        'end': end.isoformat() if end else (series[-1]['date'] if series else None),
+        'count': sum(point['count'] for point in series),
+        'total': round(sum(point['total'] for point in series), 2),
+        'series': series,
+    })
+
+@fee_pages.route('/pictures/<string:size>/<path:filename>', methods=['GET'])
+def student_picture(size, filename):
+    """
+    Serves a student picture thumbnail ('small' or 'medium'); the reports link the original.
+    """
+    filename = secure_filename(filename)
+    path = pictures.thumbnail(filename, size) if size in THUMB_SIZES else None
+    if path is None:
+        abort(404)
+    if path == pictures.original(filename):
+        # No thumbnail (yet): the browser must come back for it instead of keeping the original.
+        response = send_file(path, conditional=True, etag=True, max_age=0)
+        response.cache_control.no_cache = True
+        return response
+    # File names are content hashes, so a given thumbnail URL never changes content.
+    response = send_file(path, conditional=True, etag=True, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@fee_pages.route('/export/<string:roster>.xlsx', methods=['GET'])
+def export_roster(roster):
+    """
+    Downloads an up-to-date Excel copy of the students or computer academy roster.
+    """
+    stores = {'students': students, 'comp': comp_students}
+    if roster not in stores:
+        flash("Unknown roster.", "error")
+        return redirect(url_for('.index'))
+    export_path = os.path.abspath(os.path.join(data_dir, f"{roster}_export.xlsx"))
+    stores[roster].export_workbook(export_path)
+    return send_file(export_path, as_attachment=True,
+                     download_name=f"{roster}_{date.today().isoformat()}.xlsx")
+
+@fee_pages.route('/fee_collection/summary', methods=['GET'])
+def fee_collection_summary():
+    """
+    Collected and outstanding monthly fees as JSON, for dashboards.
+    Optional filters: grade, year, month (1-12). Served from fee_totals without a scan.
+    """
+    grade = request.args.get('grade', '').strip() or None
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    grades = [grade] if grade else sorted(fee_totals.grades(),
+                                          key=lambda g: grade_sort_key.get(g, len(grade_order)))
+    by_grade = {g: fee_totals.totals(g, year, month) for g in grades}
+    return jsonify({
+        'grade': grade, 'year': year, 'month': month,
+        'totals': fee_totals.totals(grade, year, month),
+        'by_grade': by_grade,
+    })
+
+@fee_pages.route('/fee_collection/defaulters.<string:fmt>', methods=['GET'])
+def defaulter_export(fmt):
+    """
+    Students owing monthly fees, highest dues first, as xlsx, pdf or json.
+    Same filters as the unpaid view: start_date, end_date (an end date in the future projects
+    dues up to it), grade, month and dues_range.
+    """
+    if fmt not in ('xlsx', 'pdf', 'json'):
+        abort(404)
+    dues_range = request.args.get('dues_range', '').strip()
+    try:
+        low, high = parse_dues_range(dues_range) if dues_range else (0, float('inf'))
+    except ValueError:
+        low, high = 0, float('inf')
+        flash(f"Invalid dues range: {dues_range}", 'error')
+    owed = defaulter_grid.project(parse_date(request.args.get('start_date', '').strip()),
+                                  parse_date(request.args.get('end_date', '').strip()),
+                                  request.args.get('month', '').strip(),
+                                  request.args.get('grade', '').strip() or None)
+    owed.rows = [r for r in owed.rows if low <= r['total_due'] < high]
+
+    if fmt == 'json':
+        return jsonify({'total_due': owed.total,
+                        'defaulters': [dict(r, rank=i, months=owed.months_list(r['student_id']))
+                                       for i, r in enumerate(owed.rows, start=1)]})
+    buffer = BytesIO()
+    if fmt == 'pdf':
+        try:
+            write_pdf(owed, buffer, title=f"Fee Defaulters - {date.today().isoformat()}")
+        except ImportError:
+            flash("PDF export needs the reportlab package (pip install reportlab).", "error")
+            return redirect(url_for('.fee_collection', **{**request.args.to_dict(), 'view_type': 'unpaid'}))
+        mimetype = 'application/pdf'
+    else:
+        write_xlsx(owed, buffer)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    buffer.seek(0)
+    return send_file(buffer, mimetype=mimetype, as_attachment=True,
+                     download_name=f"defaulters_{date.today().isoformat()}.{fmt}")
+
+def print_sheets(roster, group=None, ids=None):
+    """The receipts.sheet() of every student of a roster, optionally one grade/course or a list of IDs."""
+    if roster == 'comp':
+        records, ledger, label = comp_students.all(), comp_payments, 'Course'
+    else:
+        records = students.lookup('grade', group) if group and not ids else students.all()
+        ledger, label = payments, 'Grade'
+    if ids:
+        wanted = set(ids)
+        records = [r for r in records if r.id in wanted]
+    elif group:
+        records = [r for r in records if getattr(r, label.lower()) == group]
+    sheets = []
+    for r in records:
+        if roster == 'comp':
+            charges = [("Admission Fee", r.admission_fee, r.paid_admission_fee)]
+            remarks = r.remarks.split(", ") if r.remarks else []
+        else:
+            charges = [("Annual Charge", r.annual_charge, r.paid_annual_charge),
+                       ("Admission Fee", r.admission_fee, r.paid_admission_fee),
+                       ("Exam Charge", r.exam_charge, r.paid_exam_charge)]
+            remarks = [x.strip() for x in r.remarks.split(',') if x.strip()]
+        sheets.append(receipts.sheet(r, ledger.for_student(r.id), label, charges, remarks,
+                                     pictures.print_path(r.picture)))
+    return sheets
+
+@fee_pages.route('/print', methods=['GET', 'POST'])
+def print_batch():
+    """
+    Prints fee receipts or student reports for a whole grade/course in the background.
+    POST starts a job (roster, grade, ids, kind, output, start_date, end_date) and shows its progress.
+    """
+    roster = request.values.get('roster', 'students')
+    if roster not in ('students', 'comp'):
+        roster = 'students'
+    groups = sorted((comp_totals if roster == 'comp' else fee_totals).grades(),
+                    key=lambda g: grade_sort_key.get(g, len(grade_order)))
+    if request.method == 'GET':
+        return render_template('print_batch.html', roster=roster, groups=groups,
+                               group=request.args.get('grade', '').strip(), job=None)
+
+    group = request.form.get('grade', '').strip() or None
+    ids = [i.strip() for i in request.form.get('ids', '').split(',') if i.strip()]
+    kind = request.form.get('kind', 'receipt')
+    output = request.form.get('output', 'pdf')
+    if kind not in receipts.KINDS or output not in receipts.OUTPUTS:
+        abort(400)
+    if output == 'pdf' and not receipts.can_merge():
+        output = 'zip'
+        flash("One merged PDF needs the pypdf package (pip install pypdf); you will get a ZIP instead.", "error")
+    sheets = print_sheets(roster, group, ids)
+    if not sheets:
+        flash("No students to print.", "error")
+        return redirect(url_for('.print_batch', roster=roster, grade=group or ''))
+    name = f"{kind}s_{roster}_{group or 'all'}_{date.today().isoformat()}"
+    job = print_queue.start(sheets, kind, output, name=name,
+                            start=parse_date(request.form.get('start_date', '').strip()),
+                            end=parse_date(request.form.get('end_date', '').strip()))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(dict(job.as_dict(), status_url=url_for('.print_job', job_id=job.id)))
+    return render_template('print_batch.html', roster=roster, groups=groups, group=group or '', job=job)
+
+@fee_pages.route('/print/jobs/<string:job_id>', methods=['GET'])
+def print_job(job_id):
+    """Progress of a print job as JSON; download_url is set once it is done."""
+    job = print_queue.get(job_id)
+    if job is None:
+        abort(404)
+    status = job.as_dict()
+    if job.status == 'done':
+        status['download_url'] = url_for('.print_download', job_id=job.id)
+    return jsonify(status)
+
+@fee_pages.route('/print/jobs/<string:job_id>/download', methods=['GET'])
+def print_download(job_id):
+    job = print_queue.get(job_id)
+    if job is None or job.status != 'done':
+        abort(404)
+    mimetype = 'application/pdf' if job.output == 'pdf' else 'application/zip'
+    return send_file(BytesIO(job.data), mimetype=mimetype, as_attachment=True, download_name=job.filename)
+
+def warm_up():
+    """Load both rosters (and their indexes) while the window is still opening."""
+    datastores.warm_up('students', 'comp')
+    timer.mark('data loaded')
+
+# The fee app on its own; school_app.py runs it together with transport and payroll.
+app = create_app(fee_pages)
+timer.mark('app imported')
+
 # Function to start the Flask server
 def start_flask():
     app.run()
 
 if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()  # lets the packaged .exe start its print workers
+    import webview  # only the desktop window needs it
+
     # Start Flask in a separate thread
     flask_thread = threading.Thread(target=start_flask)
     flask_thread.daemon = True
     flask_thread.start()
+    # The home page needs no data, so it renders while the rosters load in the background.
+    threading.Thread(target=warm_up, daemon=True).start()
 
     # Create a webview window
     webview.create_window('School Software', 'http://127.0.0.1:5000')
+    timer.mark('window created')
     webview.start()
\ No newline at end of file
@@ -0,0 +1,369 @@
+"""
+Bulk enrollment and fee posting from CSV or Excel uploads.
+
+import_students() adds one student per row. post_payments() records paid
+months for existing students, one or more rows per student. Both check the
+whole file first, one column at a time. Rows that pass are written with a
+single store.write_batch() call, which means one journal entry and one
+workbook save (or one SQLite transaction). The per-row problems are returned
+as RowError tuples for the report page.
+
+close_payroll_month() opens a payroll month for every teacher in one save,
+taking leaves and deductions from an optional attendance sheet.
+
+By default a file with any bad row is not applied at all. With
+skip_errors=True the good rows are applied and the bad ones reported.
+"""
+import csv
+import io
+import re
+from collections import namedtuple
+from datetime import date
+
+from ledger import MONTHS, MONTH_NUMBERS, parse_date, split_list
+from payroll import PayEntry, days_in_month, month_number, salary_for
+from store import STUDENT_HEADERS, STUDENT_NUMERIC_FIELDS, Student
+
+# row is the line number in the uploaded sheet (the header is line 1).
+RowError = namedtuple('RowError', ['row', 'student_id', 'message'])
+BulkResult = namedtuple('BulkResult', ['rows', 'applied', 'errors', 'saved'])
+
+# entries are the month's PayEntry rows for every teacher; changed counts the ones this run wrote.
+PayrollRun = namedtuple('PayrollRun', ['year', 'month', 'rows', 'entries', 'changed', 'errors', 'saved'])
+
+PAYMENT_COLUMNS = ['ID', 'Months', 'Paid Date', 'Amount']
+ATTENDANCE_COLUMNS = ['Teacher Name', 'Attendance Days', 'Leaves', 'Deduction']
+
+
+def _column_key(name):
+    return re.sub(r'[^a-z0-9]', '', str(name or '').lower())
+
+
+# Accept both the workbook's headers ("Father's Name") and field names ("father_name").
+STUDENT_ALIASES = {}
+for _header, _field in zip(STUDENT_HEADERS, Student._fields):
+    STUDENT_ALIASES[_column_key(_header)] = _field
+    STUDENT_ALIASES[_column_key(_field)] = _field
+STUDENT_ALIASES.update({'fathersname': 'father_name', 'contactnumber': 'contact', 'class': 'grade'})
+
+PAYMENT_ALIASES = {
+    'id': 'id', 'studentid': 'id', 'regno': 'id',
+    'month': 'months', 'months': 'months', 'monthspaid': 'months',
+    'paiddate': 'paid_date', 'date': 'paid_date', 'paiddates': 'paid_date',
+    'amount': 'amount', 'paidfee': 'amount',
+}
+
+ATTENDANCE_ALIASES = {
+    'teachername': 'name', 'teacher': 'name', 'name': 'name',
+    'attendancedays': 'attendance_days', 'attendance': 'attendance_days', 'presentdays': 'attendance_days',
+    'dayspresent': 'attendance_days',
+    'leaves': 'leaves', 'leave': 'leaves', 'leavedays': 'leaves',
+    'deduction': 'deduction', 'deductions': 'deduction',
+}
+
+
+class BulkFileError(ValueError):
+    """The upload cannot be read at all (wrong type, no header, missing columns)."""
+
+
+def read_table(upload):
+    """(header, rows) from an uploaded .csv or .xlsx file; cells are strings or numbers."""
+    filename = (upload.filename or '').lower()
+    data = upload.read()
+    if filename.endswith('.csv'):
+        try:
+            text = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = data.decode('cp1252')
+        rows = list(csv.reader(io.StringIO(text)))
+    elif filename.endswith('.xlsx'):
+        import openpyxl  # only needed for Excel uploads
+        try:
+            wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        except Exception as e:
+            raise BulkFileError(f"Could not read {upload.filename}: {e}")
+        try:
+            rows = [list(row) for row in wb.active.iter_rows(values_only=True)]
+        finally:
+            wb.close()
+    else:
+        raise BulkFileError("Upload a .csv or .xlsx file.")
+    # Blank lines (and trailing blank rows Excel leaves behind) are not data.
+    numbered = [(i, row) for i, row in enumerate(rows, start=1)
+                if any(v not in (None, '') and str(v).strip() for v in row)]
+    if not numbered:
+        raise BulkFileError("The file is empty.")
+    (_, header), body = numbered[0], numbered[1:]
+    return header, body
+
+
+def _columns(header, body, aliases, required):
+    """{field: [cell text per row]} for the columns the header maps to."""
+    positions = {}
+    for i, name in enumerate(header):
+        field = aliases.get(_column_key(name))
+        if field and field not in positions:
+            positions[field] = i
+    missing = [name for name, field in required if field not in positions]
+    if missing:
+        raise BulkFileError("Missing column(s): " + ", ".join(missing))
+    columns = {}
+    for field, i in positions.items():
+        columns[field] = [_cell_text(row[i]) if i < len(row) else '' for _, row in body]
+    return columns
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _numbers(column, label, errors):
+    """Parse a column of amounts; blanks are 0, bad cells are reported and left as None."""
+    values = []
+    for i, text in enumerate(column):
+        try:
+            values.append(float(text.replace(',', '')) if text else 0.0)
+        except ValueError:
+            errors[i].append(f"{label} is not a number: {text!r}")
+            values.append(None)
+    return values
+
+
+def _months(column, errors):
+    values = []
+    for i, text in enumerate(column):
+        months = split_list(text)
+        unknown = [m for m in months if m.lower() not in MONTH_NUMBERS]
+        if unknown:
+            errors[i].append("Unknown month(s): " + ", ".join(unknown))
+        values.append([MONTHS[MONTH_NUMBERS[m.lower()] - 1] for m in months if m.lower() in MONTH_NUMBERS])
+    return values
+
+
+def _dates(column, label, errors):
+    """ISO date text per row ('' for blanks); unreadable dates are reported."""
+    values = []
+    for i, text in enumerate(column):
+        parsed = parse_date(text) if text else None
+        if text and parsed is None:
+            errors[i].append(f"{label} is not a date (use YYYY-MM-DD): {text!r}")
+        values.append(parsed.isoformat() if parsed else '')
+    return values
+
+
+def _collect(body, ids, errors):
+    return [RowError(line, ids[i], "; ".join(errors[i]))
+            for i, (line, _) in enumerate(body) if errors[i]]
+
+
+def import_students(store, upload, skip_errors=False):
+    """Add every student in the uploaded roster with one batched write."""
+    header, body = read_table(upload)
+    columns = _columns(header, body, STUDENT_ALIASES, [('ID', 'id'), ('Name', 'name')])
+    n = len(body)
+    blank = [''] * n
+    errors = [[] for _ in range(n)]
+    ids = columns['id']
+
+    existing = set(store.keys('id'))
+    seen = set()
+    for i, (student_id, name) in enumerate(zip(ids, columns['name'])):
+        if not student_id:
+            errors[i].append("ID is required")
+        elif student_id.lower() in existing:
+            errors[i].append(f"ID {student_id} is already enrolled")
+        elif student_id.lower() in seen:
+            errors[i].append(f"ID {student_id} appears more than once in the file")
+        seen.add(student_id.lower())
+        if not name:
+            errors[i].append("Name is required")
+
+    numbers = {field: _numbers(columns.get(field, blank), field.replace('_', ' ').title(), errors)
+               for field in STUDENT_NUMERIC_FIELDS}
+    months = _months(columns.get('months_paid', blank), errors)
+    admission = _dates(columns.get('admission_date', blank), "Admission Date", errors)
+    paid_dates = []
+    for i, text in enumerate(columns.get('paid_dates', blank)):
+        dates = []
+        for value in split_list(text):
+            parsed = parse_date(value)
+            if parsed is None:
+                errors[i].append(f"Paid Date is not a date (use YYYY-MM-DD): {value!r}")
+            dates.append(parsed.isoformat() if parsed else value)
+        if len(dates) == 1 and len(months[i]) > 1:
+            dates = dates * len(months[i])  # one date for all months, as on the add form
+        paid_dates.append(dates)
+
+    records = []
+    for i in range(n):
+        if errors[i]:
+            continue
+        fields = {f: columns[f][i] for f in ('id', 'name', 'father_name', 'contact', 'grade', 'remarks', 'picture')
+                  if f in columns}
+        fields.update({f: numbers[f][i] for f in STUDENT_NUMERIC_FIELDS})
+        fields['months_paid'] = ", ".join(months[i])
+        fields['paid_dates'] = ", ".join(paid_dates[i])
+        fields['admission_date'] = admission[i]
+        if not columns.get('dues', blank)[i]:
+            fields['dues'] = (len(months[i]) * fields['monthly_fee'] + fields['annual_charge'] +
+                              fields['admission_fee'] + fields['exam_charge']) - (
+                fields['paid_fee'] + fields['paid_annual_charge'] +
+                fields['paid_admission_fee'] + fields['paid_exam_charge'])
+        records.append(store.make_record(**fields))
+
+    report = _collect(body, ids, errors)
+    if report and not skip_errors:
+        return BulkResult(n, 0, report, False)
+    store.write_batch(adds=records)
+    return BulkResult(n, len(records), report, True)
+
+
+def post_payments(store, upload, skip_errors=False):
+    """Record paid months for existing students with one batched write.
+
+    Each row names a student, the month(s) paid, the date (today if blank)
+    and the amount received (the monthly fee times the months if blank).
+    Dues are recalculated the same way the modify form does it.
+    """
+    header, body = read_table(upload)
+    columns = _columns(header, body, PAYMENT_ALIASES, [('ID', 'id'), ('Months', 'months')])
+    n = len(body)
+    blank = [''] * n
+    errors = [[] for _ in range(n)]
+    ids = columns['id']
+
+    months = _months(columns['months'], errors)
+    paid_on = _dates(columns.get('paid_date', blank), "Paid Date", errors)
+    amounts = _numbers(columns.get('amount', blank), "Amount", errors)
+    given = [bool(text) for text in columns.get('amount', blank)]
+    today = date.today().isoformat()
+
+    updated = {}  # student ID -> record with this file's payments applied so far
+    for i in range(n):
+        student_id = ids[i]
+        student = updated.get(student_id) or (store.get(student_id) if student_id else None)
+        if not student_id:
+            errors[i].append("ID is required")
+        elif student is None:
+            errors[i].append(f"No student with ID {student_id}")
+        if not months[i] and not errors[i]:
+            errors[i].append("No month given")
+        if errors[i]:
+            continue
+
+        current = split_list(student.months_paid)
+        current_dates = split_list(student.paid_dates)
+        already = [m for m in months[i] if m in current]
+        if already:
+            errors[i].append("Already paid: " + ", ".join(already))
+            continue
+        date_of = {m: current_dates[k] if k < len(current_dates) else '' for k, m in enumerate(current)}
+        date_of.update({m: paid_on[i] or today for m in months[i]})
+        final_months = sorted(date_of, key=lambda m: MONTHS.index(m) if m in MONTHS else 99)
+        amount = amounts[i] if given[i] else student.monthly_fee * len(months[i])
+        paid_fee = student.paid_fee + amount
+        expected = (len(final_months) * student.monthly_fee + student.annual_charge +
+                    student.admission_fee + student.exam_charge)
+        paid = paid_fee + student.paid_annual_charge + student.paid_admission_fee + student.paid_exam_charge
+        updated[student_id] = student._replace(
+            months_paid=", ".join(final_months),
+            paid_dates=", ".join(date_of[m] for m in final_months),
+            paid_fee=paid_fee,
+            dues=expected - paid,
+        )
+
+    report = _collect(body, ids, errors)
+    if report and not skip_errors:
+        return BulkResult(n, 0, report, False)
+    store.write_batch(updates=list(updated.values()))
+    return BulkResult(n, n - len(report), report, True)
+
+
+def close_payroll_month(book, year, month, upload=None, skip_errors=False):
+    """Open `month` of `year` for every teacher with one save.
+
+    Teachers on the attendance sheet get their leaves (given directly, or as
+    the days in the month minus Attendance Days) and a deduction (given, or
+    the usual 4% of salary per leave). Teachers whose row is rejected are
+    left alone. Teachers not on the sheet keep any
+    entry they already have for the month and are otherwise opened at full
+    salary, as next_month does. Every entry is worked out from the sheet
+    and the salary, so running the same close twice changes nothing.
+    """
+    month = month_number(month)
+    days = days_in_month(year, month)
+    teachers = {t.name: t for t in book.teachers()}
+    rows, errors, entries, rejected = 0, [], {}, set()
+
+    if upload is not None:
+        header, body = read_table(upload)
+        columns = _columns(header, body, ATTENDANCE_ALIASES, [('Teacher Name', 'name')])
+        if 'attendance_days' not in columns and 'leaves' not in columns:
+            raise BulkFileError("Missing column(s): Attendance Days or Leaves")
+        rows = len(body)
+        blank = [''] * rows
+        problems = [[] for _ in range(rows)]
+        names = columns['name']
+        attended = _numbers(columns.get('attendance_days', blank), "Attendance Days", problems)
+        leaves = _numbers(columns.get('leaves', blank), "Leaves", problems)
+        deductions = _numbers(columns.get('deduction', blank), "Deduction", problems)
+        seen = set()
+        for i, name in enumerate(names):
+            teacher = teachers.get(name)
+            if not name:
+                problems[i].append("Teacher Name is required")
+            elif teacher is None:
+                problems[i].append(f"No teacher named {name}")
+            elif name in seen:
+                problems[i].append(f"{name} appears more than once in the file")
+            seen.add(name)
+            if problems[i]:
+                continue
+            if columns.get('leaves', blank)[i]:
+                taken = leaves[i]
+            elif columns.get('attendance_days', blank)[i]:
+                taken = days - attended[i]
+            else:
+                taken = 0
+            if not 0 <= taken <= days:
+                problems[i].append(f"Leaves must be between 0 and {days}, got {taken:g}")
+                continue
+            salary = teacher.monthly_salary or 0
+            deduction, paid = salary_for(salary, taken)
+            if columns.get('deduction', blank)[i]:
+                deduction, paid = deductions[i], max(0, salary - deductions[i])
+            entries[name] = PayEntry(name, year, month, deduction, taken, paid)
+        errors = _collect(body, names, problems)
+        rejected = {name for name, problem in zip(names, problems) if problem} - set(entries)
+        if errors and not skip_errors:
+            return PayrollRun(year, month, rows, [], 0, errors, False)
+
+    for name, teacher in teachers.items():
+        if name not in entries and name not in rejected:  # a skipped row leaves its teacher as is
+            entries[name] = (book.entry(name, year, month) or
+                             PayEntry(name, year, month, 0, 0, teacher.monthly_salary or 0))
+    changed = book.set_months(entries.values())
+    return PayrollRun(year, month, rows, [entries[name] for name in teachers if name in entries],
+                      changed, errors, True)
+
+
+def template_csv(kind):
+    """Header line (and one sample row) for the downloadable upload templates."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if kind == 'students':
+        writer.writerow(STUDENT_HEADERS[:5] + ['Monthly Fee', 'Admission Date'])
+        writer.writerow(['S101', 'Ali Khan', 'Imran Khan', '03001234567', '5', '1500', date.today().isoformat()])
+    elif kind == 'attendance':
+        writer.writerow(ATTENDANCE_COLUMNS)
+        writer.writerow(['Sana Ahmed', '28', '', ''])
+    else:
+        writer.writerow(PAYMENT_COLUMNS)
+        writer.writerow(['S101', 'March, April', date.today().isoformat(), '3000'])
+    return out.getvalue()
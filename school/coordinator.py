@@ -0,0 +1,202 @@
+"""
+One writer thread for every save the school apps make.
+
+The rosters, the transport ledger and the payroll book each used to save
+from their own background thread (or from the request thread), so two saves
+could hit the disk at once and a slow workbook save of one file could
+overlap an edit of another. StorageCoordinator runs them all, one at a
+time, on a single thread fed by a queue:
+
+* Jobs may be delayed (to let a burst of edits pile up into one save) and
+  may carry a key. A job submitted while another job with the same key is
+  still waiting is merged into it. The waiting job reads the data when it
+  runs, so it saves the later edit too.
+* Callers that need their save on disk before replying (the payroll book)
+  wait on the returned Future. Everyone else just submits.
+* Pending jobs are run at interpreter exit.
+
+Readers never go through the coordinator. The stores keep their in-memory
+copy readable while a save is in progress and only hold their own lock for
+the copy and the final rename.
+
+metrics() reports the queue depth, the job running now, and how long jobs
+waited and ran, for the /api/storage pages.
+"""
+import atexit
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+
+# How many recent jobs the latency figures are computed over.
+METRICS_WINDOW = 200
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'key', 'due', 'future', 'submitted')
+
+    def __init__(self, fn, args, key, due):
+        self.fn, self.args, self.key, self.due = fn, args, key, due
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+
+class StorageCoordinator:
+    """A queue of save jobs and the one thread that runs them."""
+
+    def __init__(self, name="storage-writer"):
+        self.name = name
+        self._cond = threading.Condition()
+        self._heap = []            # (due, seq, job); stale entries are skipped
+        self._waiting = {}         # key -> job not started yet
+        self._seq = itertools.count()
+        self._thread = None
+        self._running = None
+        self._done = 0
+        self._failed = 0
+        self._merged = 0
+        self._waits = deque(maxlen=METRICS_WINDOW)
+        self._runs = deque(maxlen=METRICS_WINDOW)
+        self._last_error = None
+
+    def submit(self, fn, *args, key=None, delay=0.0):
+        """Queue fn(*args) to run on the writer thread; returns a Future for its result.
+
+        With a key, a job that is already waiting under that key is reused
+        (its due time moved up if this one is due sooner).
+        """
+        due = time.monotonic() + delay
+        with self._cond:
+            job = self._waiting.get(key) if key is not None else None
+            if job is not None:
+                self._merged += 1
+                if due < job.due:
+                    job.due = due
+                    heapq.heappush(self._heap, (due, next(self._seq), job))
+                    self._cond.notify()
+                return job.future
+            job = _Job(fn, args, key, due)
+            if key is not None:
+                self._waiting[key] = job
+            heapq.heappush(self._heap, (due, next(self._seq), job))
+            self._start()
+            self._cond.notify()
+            return job.future
+
+    def run(self, fn, *args, key=None):
+        """Run fn(*args) on the writer thread and wait for its result."""
+        if threading.current_thread() is self._thread:
+            return fn(*args)  # already on the writer thread (a job submitting another)
+        return self.submit(fn, *args, key=key).result()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name=self.name)
+            self._thread.start()
+            atexit.register(self.drain)
+
+    def _next_job(self):
+        """Block until a job is due; returns it. Called with the condition held."""
+        while True:
+            while self._heap and (self._heap[0][2].future.done() or
+                                  self._heap[0][2].future.running() or
+                                  self._heap[0][0] != self._heap[0][2].due):
+                heapq.heappop(self._heap)  # finished, started, or re-queued sooner
+            if not self._heap:
+                self._cond.wait()
+                continue
+            due, _, job = self._heap[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._cond.wait(delay)
+                continue
+            heapq.heappop(self._heap)
+            if job.key is not None:
+                self._waiting.pop(job.key, None)
+            job.future.set_running_or_notify_cancel()
+            self._running = job
+            return job
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            started = time.monotonic()
+            try:
+                result = job.fn(*job.args)
+            except BaseException as e:
+                error = e
+                result = None
+            else:
+                error = None
+            finished = time.monotonic()
+            with self._cond:
+                self._running = None
+                self._waits.append(max(0.0, started - max(job.submitted, job.due)))
+                self._runs.append(finished - started)
+                if error is None:
+                    self._done += 1
+                else:
+                    self._failed += 1
+                    self._last_error = f"{_job_name(job)}: {error}"
+                self._cond.notify_all()
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def drain(self, timeout=30.0):
+        """Run the jobs queued right now without their delays and wait for them (used at exit)."""
+        with self._cond:
+            now = time.monotonic()
+            jobs = {id(job): job for _, _, job in self._heap if not job.future.done()}
+            if self._running is not None:
+                jobs[id(self._running)] = self._running
+            for job in jobs.values():
+                if not job.future.running() and job.due > now:
+                    job.due = now
+                    heapq.heappush(self._heap, (now, next(self._seq), job))
+            self._cond.notify_all()
+        wait([job.future for job in jobs.values()], timeout)
+
+    def metrics(self):
+        """Queue depth, the running job and wait/run times (seconds) of recent jobs."""
+        with self._cond:
+            queued = {id(job): job for _, _, job in self._heap
+                      if not job.future.done() and not job.future.running()}
+            return {
+                'queue_depth': len(queued),
+                'queued': sorted(_job_name(job) for job in queued.values()),
+                'running': _job_name(self._running) if self._running else None,
+                'jobs_done': self._done,
+                'jobs_failed': self._failed,
+                'jobs_merged': self._merged,
+                'last_error': self._last_error,
+                'wait_seconds': _summary(self._waits),
+                'run_seconds': _summary(self._runs),
+            }
+
+
+def _job_name(job):
+    if job.key is not None:
+        return " ".join(str(part) for part in job.key) if isinstance(job.key, tuple) else str(job.key)
+    return getattr(job.fn, '__qualname__', repr(job.fn))
+
+
+def _summary(samples):
+    if not samples:
+        return {'count': 0, 'last': None, 'mean': None, 'p95': None, 'max': None}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'last': round(samples[-1], 4),
+        'mean': round(sum(ordered) / len(ordered), 4),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        'max': round(ordered[-1], 4),
+    }
+
+
+# The one coordinator of this process; every store submits its saves here.
+coordinator = StorageCoordinator()
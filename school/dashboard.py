@@ -0,0 +1,116 @@
+"""
+The principal's dashboard and the pages every school app shares.
+
+create_app() builds the Flask app for app2.py, index.py, teachers.py and
+school_app.py (all of them in one process). It registers the given page
+blueprints next to this one, which serves:
+
+* /dashboard and /api/summary: fees collected, computer academy fees,
+  transport charges and dues, and salaries paid for a year or one month of
+  it. Every figure is a lookup in the aggregates the stores keep up to date
+  on each edit, so neither page reads a workbook once the data is loaded.
+* /api/storage and /api/startup: save queue and startup timing figures.
+"""
+from datetime import date
+
+from flask import Blueprint, Flask, current_app, jsonify, render_template, request, url_for
+
+import datastores
+from coordinator import coordinator
+from ledger import MONTHS
+from payroll import month_number
+from startup import timer
+
+dashboard_pages = Blueprint('dashboard', __name__)
+
+# Links on the dashboard, shown when their app is part of this process.
+SECTIONS = [
+    ("Students", 'fees.manage_students'),
+    ("Fee Collection", 'fees.fee_collection'),
+    ("Computer Academy", 'fees.comp'),
+    ("Transport", 'transport.index'),
+    ("Teachers", 'payroll.show_teachers'),
+]
+
+
+def create_app(*blueprints):
+    """A Flask app with the shared pages and `blueprints`, each at the url_prefix it was made with."""
+    app = Flask(__name__)
+    app.secret_key = "secret_key"  # For flashing messages
+    app.register_blueprint(dashboard_pages)
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+    timer.watch(app)
+    return app
+
+
+def period_summary(year, month=None):
+    """Cross-domain totals for `year`, or for one month (1-12) of it."""
+    fees = datastores.school_roster().totals.totals(year=year, month=month)
+    comp = datastores.comp_roster().totals.totals(year=year, month=month)
+    transport = datastores.transport_ledger().period_totals(year, month)
+    deductions, leaves, paid = datastores.payroll_book().period_totals(year, month)
+    return {
+        'year': year,
+        'month': month,
+        'month_name': MONTHS[month - 1] if month else None,
+        'fees': fees,
+        'comp_fees': comp,
+        'transport': transport,
+        'salaries': {'paid': paid, 'deductions': deductions, 'leaves': leaves},
+        # Money in (monthly fees, course fees, transport charges) less salaries paid.
+        'net': fees['collected'] + comp['collected'] + transport['paid'] - paid,
+    }
+
+
+def selected_period():
+    """(year, month) from ?year= and ?month= (a number or a month name); ValueError if unreadable."""
+    year = request.args.get('year', date.today().year, type=int)
+    month = request.args.get('month', '').strip()
+    try:
+        return year, month_number(int(month) if month.isdigit() else month) if month else None
+    except KeyError:
+        raise ValueError(f"Unknown month: {month}")
+
+
+@dashboard_pages.route('/dashboard', methods=['GET'])
+def dashboard():
+    try:
+        year, month = selected_period()
+    except ValueError as e:
+        return render_template('dashboard.html', error=str(e), summary=None, sections=[],
+                               months=MONTHS, years=[date.today().year])
+    sections = [(label, url_for(endpoint)) for label, endpoint in SECTIONS
+                if endpoint.split('.')[0] in current_app.blueprints]
+    years = datastores.payroll_book().years()
+    return render_template('dashboard.html', error=None, summary=period_summary(year, month),
+                           sections=sections, months=MONTHS, years=sorted(set(years) | {year}))
+
+
+@dashboard_pages.route('/api/summary', methods=['GET'])
+def summary():
+    """
+    Fees collected, transport dues and salaries paid as JSON.
+    Optional filters: year (default this year), month (1-12 or a month name).
+    """
+    try:
+        year, month = selected_period()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(period_summary(year, month))
+
+
+@dashboard_pages.route('/api/storage', methods=['GET'])
+def storage_metrics():
+    """
+    Save queue depth and save timings of the storage writer thread, as JSON.
+    """
+    return jsonify(coordinator.metrics())
+
+
+@dashboard_pages.route('/api/startup', methods=['GET'])
+def startup_timing():
+    """
+    How long each step of this start took (see startup.py), as JSON.
+    """
+    return jsonify(timer.report())
@@ -0,0 +1,130 @@
+"""
+The data behind every school page, opened once per process.
+
+app2.py, index.py and teachers.py each used to open their own workbooks at
+import. They now take their stores from here. When all their pages run in
+one process (school_app.py), each workbook is therefore held in memory once.
+The dashboard reads the same aggregates that the pages keep up to date.
+
+Each domain is opened the first time it is asked for, so the fee app alone
+never imports pandas for the transport ledger. Opening a domain reads
+nothing yet: the stores load on their first read.
+"""
+import os
+import threading
+from collections import namedtuple
+
+from defaulters import DefaulterGrid
+from ledger import PaymentLedger, FeeAggregates, AccountTotals, DailyCollections
+from search import SearchIndex
+from store import (open_store, Student, STUDENT_HEADERS, STUDENT_NUMERIC_FIELDS,
+                   CompStudent, COMP_HEADERS, COMP_NUMERIC_FIELDS)
+
+DATA_DIR = "data"
+STUDENTS_FILE = os.path.join(DATA_DIR, "students.xlsx")
+COMP_FILE = os.path.join(DATA_DIR, "comp.xlsx")
+TRANSPORT_FILE = os.path.join(DATA_DIR, "transport_data.xlsx")
+PAYROLL_FILE = os.path.join(DATA_DIR, "school_data.xlsx")
+
+# Storage backend of the rosters: "xlsx" (default) keeps the workbooks as the database,
+# "sqlite" moves the records into data/school.db (imported from the workbooks once).
+STORAGE_BACKEND = os.environ.get('SCHOOL_STORAGE', 'xlsx').strip().lower()
+
+# A roster store and the indexes kept up to date from it.
+Roster = namedtuple('Roster', ['store', 'payments', 'totals', 'search', 'defaulters', 'accounts', 'daily'])
+
+os.makedirs(DATA_DIR, exist_ok=True)
+
+_lock = threading.Lock()
+_opened = {}
+
+
+def _open(name, opener):
+    # Under the lock, so a warm-up thread and the first request never open a file twice.
+    with _lock:
+        if name not in _opened:
+            _opened[name] = opener()
+        return _opened[name]
+
+
+def initialize_excel_file(file_path, headers):
+    """Create a workbook with just a header row if `file_path` does not exist yet."""
+    if not os.path.exists(file_path):
+        import openpyxl  # only needed on the very first run
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(headers)  # Add header row
+        wb.save(file_path)
+
+
+def student_account(s):
+    """(grade, expected, paid) of a student, as the student list totals them."""
+    months = len([m for m in s.months_paid.split(",") if m.strip()])
+    return (s.grade or "N/A",
+            s.monthly_fee * months + s.annual_charge + s.admission_fee + s.exam_charge,
+            s.paid_fee + s.paid_annual_charge + s.paid_admission_fee + s.paid_exam_charge)
+
+
+def comp_account(s):
+    """(course, expected, paid) of a computer academy student, as the /comp list totals them."""
+    months = len(s.months_paid.split(", ")) if s.months_paid else 0
+    return (str(s.course), (s.monthly_fee or 0.0) * months + (s.admission_fee or 0.0),
+            (s.paid_fee or 0.0) + (s.paid_admission_fee or 0.0))
+
+
+def school_roster():
+    """students.xlsx: the store, its payment ledger, fee totals per grade, the search index, the defaulter grid,
+    the fee/paid/dues totals of the student list and the collections per paid date."""
+    def open_roster():
+        initialize_excel_file(STUDENTS_FILE, STUDENT_HEADERS)
+        students = open_store(STORAGE_BACKEND, STUDENTS_FILE, Student, STUDENT_HEADERS, STUDENT_NUMERIC_FIELDS,
+                              index_fields=('id', 'grade', 'father_name', 'contact'))
+        payments = PaymentLedger(students)
+        return Roster(students, payments, FeeAggregates(payments), SearchIndex(students), DefaulterGrid(payments),
+                      AccountTotals(students, student_account), DailyCollections(payments))
+    return _open('students', open_roster)
+
+
+def comp_roster():
+    """comp.xlsx (computer academy): the same as school_roster(), with totals per course."""
+    def open_roster():
+        initialize_excel_file(COMP_FILE, COMP_HEADERS)
+        comp_students = open_store(STORAGE_BACKEND, COMP_FILE, CompStudent, COMP_HEADERS, COMP_NUMERIC_FIELDS,
+                                   index_fields=('id', 'course', 'father_name', 'contact'))
+        payments = PaymentLedger(comp_students)
+        return Roster(comp_students, payments, FeeAggregates(payments, group_field='course'),
+                      SearchIndex(comp_students), DefaulterGrid(payments, group_field='course'),
+                      AccountTotals(comp_students, comp_account), DailyCollections(payments))
+    return _open('comp', open_roster)
+
+
+def transport_ledger():
+    """The transport sheet (transport_data.TransportLedger)."""
+    def open_ledger():
+        import pandas as pd
+        from transport_data import TransportLedger, COLUMNS
+        if not os.path.exists(TRANSPORT_FILE):
+            pd.DataFrame(columns=COLUMNS).to_excel(TRANSPORT_FILE, index=False)
+        return TransportLedger(TRANSPORT_FILE)
+    return _open('transport', open_ledger)
+
+
+def payroll_book():
+    """Teachers and their monthly pay (payroll.PayrollBook)."""
+    def open_book():
+        from payroll import PayrollBook
+        return PayrollBook(PAYROLL_FILE)
+    return _open('payroll', open_book)
+
+
+def warm_up(*domains):
+    """Load the given domains ('students', 'comp', 'transport', 'payroll') into memory."""
+    for domain in domains:
+        if domain == 'students':
+            school_roster().store.all()
+        elif domain == 'comp':
+            comp_roster().store.all()
+        elif domain == 'transport':
+            transport_ledger().frame()
+        elif domain == 'payroll':
+            payroll_book().teachers()
@@ -0,0 +1,288 @@
+"""
+Defaulters: the months each student owes in any date window, as NumPy bitmasks.
+
+The unpaid view of the fee collection report used to walk every month of
+every year for every student in Python, and then group the months it found
+back into one row per student. DefaulterGrid keeps a year x month grid per
+student instead: one 12-bit mask per (student, year) with a bit set for
+each month that has a dated payment (bit 0 is January). A date window is a
+mask of the same shape. It runs from the later of the admission month and
+the window start up to the window end (the current month when open-ended),
+the same months the report always counted. The months owed are then
+`window & ~paid`, and the amount owed is their count times the monthly fee.
+This is computed for all students in one pass, so windows that run into the
+future project dues too.
+
+The grid listens to the roster store like FeeAggregates. Edits update
+single rows; a reload marks the grid for a rebuild from the payment ledger
+on its next query.
+
+write_xlsx() and write_pdf() export a projection as a ranked list, highest
+dues first. PDF export needs reportlab.
+"""
+import threading
+from datetime import date
+
+from ledger import MONTHS, MONTH_NUMBERS, parse_date
+
+EXPORT_HEADERS = ["Rank", "ID", "Name", "Grade", "Monthly Fee", "Months Owed", "Total Due", "Months"]
+
+_popcount = None
+
+
+def _numpy():
+    # Imported on first use; the fee pages do not need NumPy to start.
+    import numpy as np
+    global _popcount
+    if _popcount is None:
+        _popcount = np.array([bin(mask).count('1') for mask in range(1 << 12)], dtype=np.int64)
+    return np
+
+
+def month_index(day):
+    """Months since year 0 (year * 12 + month - 1), the grid's column arithmetic."""
+    return day.year * 12 + day.month - 1
+
+
+class Projection:
+    """Students owing anything in one window, highest dues first (see DefaulterGrid.project)."""
+
+    def __init__(self, rows, masks, first_year):
+        self.rows = rows  # dicts: student_id, student, grade, monthly_fee, count, total_due
+        self._masks = masks  # student_id -> due mask per year, from first_year on
+        self._first_year = first_year
+
+    @property
+    def total(self):
+        return sum(row['total_due'] for row in self.rows)
+
+    def months(self, student_id):
+        """[(year, month)] the student owes in the window, oldest first."""
+        masks = self._masks.get(student_id, ())
+        return [(self._first_year + i, m + 1) for i, bits in enumerate(masks) if bits
+                for m in range(12) if bits >> m & 1]
+
+    def months_list(self, student_id):
+        return [f"{MONTHS[m - 1]} {y}" for y, m in self.months(student_id)]
+
+
+class DefaulterGrid:
+    """Paid-month bitmasks per student and year for a roster, kept in step with its store."""
+
+    def __init__(self, ledger, group_field='grade'):
+        self.ledger = ledger
+        self.group_field = group_field
+        self._lock = threading.RLock()
+        self._built = False
+        self._generation = 0  # bumped on every reset or change, so a build can tell its records went stale
+        ledger.store.subscribe(self)
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._generation += 1
+            self._built = False  # rebuilt from the ledger on the next query
+
+    def change(self, old, new):
+        with self._lock:
+            self._generation += 1
+            if not self._built:
+                return
+            if old is not None:
+                row = self._index.pop(old.id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._dead += 1
+            if new is not None:
+                self._append(new)
+            if self._dead > 1000 and self._dead > len(self._ids) // 2:
+                self._built = False  # the rebuild drops the dead rows
+
+    # --- building ------------------------------------------------------------
+
+    def _build(self, records):
+        np = _numpy()
+        self._index, self._ids, self._names = {}, [], []
+        groups, fees, admits = [], [], []
+        for record in records:
+            group = getattr(record, self.group_field)
+            if not group or record.id in self._index:
+                continue  # the fee report ignores students without a grade; first row wins for duplicate IDs
+            self._index[record.id] = len(self._ids)
+            self._ids.append(record.id)
+            self._names.append(record.name)
+            groups.append(group)
+            fees.append(record.monthly_fee or 0)
+            admit = parse_date(record.admission_date)
+            admits.append(month_index(admit) if admit else -1)
+        student_ids, years, months = self.ledger.dated_months()
+        rows = np.fromiter((self._index.get(s, -1) for s in student_ids), dtype=np.int64, count=len(student_ids))
+        years = np.asarray(years, dtype=np.int64)
+        months = np.asarray(months, dtype=np.int64)
+        known = rows >= 0
+        rows, years, months = rows[known], years[known], months[known]
+
+        self._groups = np.array(groups, dtype=object)
+        self._fee = np.array(fees, dtype=np.float64)
+        self._admit = np.array(admits, dtype=np.int64)
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._dead = 0
+        today = date.today().year
+        self._first_year = int(min(years.min(), today)) if len(years) else today
+        last_year = int(max(years.max(), today)) if len(years) else today
+        self._paid = np.zeros((len(self._ids), last_year - self._first_year + 1), dtype=np.int64)
+        np.bitwise_or.at(self._paid, (rows, years - self._first_year), 1 << (months - 1))
+        self._built = True
+
+    def _append(self, record):
+        np = _numpy()
+        group = getattr(record, self.group_field)
+        if not group or record.id in self._index:
+            return
+        paid = {(p.year, p.month) for p in self.ledger._entries_for(record.id) if p.year is not None and p.month}
+        years = [year for year, _ in paid]
+        if years:
+            self._widen(min(years), max(years))
+        row = np.zeros((1, self._paid.shape[1]), dtype=np.int64)
+        for year, month in paid:
+            row[0, year - self._first_year] |= 1 << (month - 1)
+        admit = parse_date(record.admission_date)
+        self._index[record.id] = len(self._ids)
+        self._ids.append(record.id)
+        self._names.append(record.name)
+        self._groups = np.append(self._groups, np.array([group], dtype=object))
+        self._fee = np.append(self._fee, record.monthly_fee or 0)
+        self._admit = np.append(self._admit, month_index(admit) if admit else -1)
+        self._alive = np.append(self._alive, True)
+        self._paid = np.vstack([self._paid, row])
+
+    def _widen(self, first_year, last_year):
+        # Add zero columns so the grid covers first_year..last_year.
+        np = _numpy()
+        before = max(0, self._first_year - first_year)
+        after = max(0, last_year - (self._first_year + self._paid.shape[1] - 1))
+        if before or after:
+            self._paid = np.pad(self._paid, ((0, 0), (before, after)))
+            self._first_year -= before
+
+    # --- queries -------------------------------------------------------------
+
+    def project(self, start=None, end=None, month=None, group=None):
+        """Months owed between `start` and `end` (dates; None = open), optionally one calendar month
+        (a name or 1-12) and one grade. Returns a Projection.
+        """
+        self.ledger.store.refresh()
+        today = date.today()
+        if isinstance(month, str):
+            month = MONTH_NUMBERS.get(month.strip().lower(), -1) if month.strip() else None
+        while True:
+            # The records are read before taking self._lock: reading may reload the store, which
+            # takes the store lock, and writers hold that lock while they call change().
+            generation = self._generation
+            records = None if self._built else self.ledger.store.all()
+            with self._lock:
+                if not self._built:
+                    if records is None or generation != self._generation:
+                        continue  # the store changed since the records were read
+                    self._build(records)
+                return self._project(start, end, month, group, today)
+
+    def _project(self, start, end, month, group, today):
+        # Under self._lock, with the grid built.
+        np = _numpy()
+        selected = self._alive & (self._groups == group) if group else self._alive
+        rows = np.flatnonzero(selected)
+        admit = self._admit[rows]
+        # First month counted: the later of admission and the window start; January of this year if neither.
+        if start is not None:
+            first = np.maximum(admit, month_index(start))
+        else:
+            first = np.where(admit >= 0, admit, today.year * 12)
+        last = month_index(end or today)
+        if not len(rows) or first.min() > last or month == -1:  # -1: a month name nobody pays for
+            return Projection([], {}, today.year)
+        first_year, last_year = int(first.min()) // 12, last // 12
+        base = np.arange(first_year, last_year + 1, dtype=np.int64) * 12
+        # Bits first..last of each year's 12, per student (rows) and year (columns).
+        lo = np.clip(first[:, None] - base[None, :], 0, 12)
+        hi = np.clip(last - base + 1, 0, 12)[None, :]
+        window = ((1 << hi) - 1) & ~((1 << lo) - 1)
+        if month:
+            window &= 1 << (month - 1)
+        due = window & ~self._paid_between(rows, first_year, last_year)
+        counts = _popcount[due].sum(axis=1)
+        owing = np.flatnonzero(counts)
+        totals = counts[owing] * self._fee[rows[owing]]
+        order = owing[np.argsort(-totals, kind='stable')]
+        result, masks = [], {}
+        for i in order:
+            r = rows[i]
+            student_id = self._ids[r]
+            result.append({'student_id': student_id, 'student': self._names[r], 'grade': self._groups[r],
+                           'monthly_fee': float(self._fee[r]), 'count': int(counts[i]),
+                           'total_due': float(counts[i] * self._fee[r])})
+            masks[student_id] = due[i].tolist()
+        return Projection(result, masks, first_year)
+
+    def _paid_between(self, rows, first_year, last_year):
+        """Paid masks of `rows` for first_year..last_year, zeros outside the grid."""
+        np = _numpy()
+        out = np.zeros((len(rows), last_year - first_year + 1), dtype=np.int64)
+        grid_last = self._first_year + self._paid.shape[1] - 1
+        lo, hi = max(first_year, self._first_year), min(last_year, grid_last)
+        if lo <= hi:
+            out[:, lo - first_year:hi - first_year + 1] = \
+                self._paid[rows][:, lo - self._first_year:hi - self._first_year + 1]
+        return out
+
+
+def export_rows(projection):
+    """The projection as EXPORT_HEADERS rows, ranked."""
+    for rank, row in enumerate(projection.rows, start=1):
+        yield [rank, row['student_id'], row['student'], row['grade'], row['monthly_fee'], row['count'],
+               row['total_due'], ", ".join(projection.months_list(row['student_id']))]
+
+
+def write_xlsx(projection, target, title="Defaulters"):
+    """Write the ranked list to an Excel workbook (`target` is a path or a binary file object)."""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title[:31])
+    ws.append(EXPORT_HEADERS)
+    for row in export_rows(projection):
+        ws.append(row)
+    ws.append([None, None, None, None, None, "Total", projection.total])
+    wb.save(target)
+
+
+def write_pdf(projection, target, title="Defaulters"):
+    """Write the ranked list to a PDF (needs reportlab; ImportError without it)."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    small = styles['BodyText'].clone('small', fontSize=8, leading=10)
+    doc = SimpleDocTemplate(target, pagesize=landscape(A4), title=title,
+                            leftMargin=28, rightMargin=28, topMargin=28, bottomMargin=28)
+    style = TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (4, 1), (6, -1), 'RIGHT'),
+    ])
+    widths = [34, 60, 120, 40, 60, 50, 70, None]
+    story = [Paragraph(title, styles['Title'])]
+    rows = [[rank, sid, name, grade, f"{fee:,.0f}", count, f"{due:,.2f}", Paragraph(months, small)]
+            for rank, sid, name, grade, fee, count, due, months in export_rows(projection)]
+    # Several tables with a repeated header lay out much faster than one table of thousands of rows.
+    for i in range(0, max(len(rows), 1), 500):
+        table = Table([EXPORT_HEADERS] + rows[i:i + 500], colWidths=widths, repeatRows=1)
+        table.setStyle(style)
+        story.append(table)
+    story.append(Paragraph(f"Total due: {projection.total:,.2f}", styles['Heading3']))
+    doc.build(story)
@@ -1,62 +1,46 @@
-from flask import Flask, render_template, request, redirect, url_for
-import pandas as pd
+from startup import timer  # first, so the startup report covers the other imports
+from flask import Blueprint, render_template, request, redirect, url_for, abort
 from datetime import datetime
 import os
-import os
 import threading
-import webview
+import datastores
+from dashboard import create_app
+
+# Transport pages; school_app.py serves them under /transport next to the fee and payroll pages.
+transport_pages = Blueprint('transport', __name__)
 
-app = Flask(__name__)
+# Path to the Excel file (created empty on first run, see datastores.py)
+file_path = datastores.TRANSPORT_FILE
 
-# Path to the Excel file
-file_path = 'data/transport_data.xlsx'
+# In-memory copy of the sheet (with a Feather cache next to it), shared with the dashboard;
+# edits are saved in the background.
+ledger = datastores.transport_ledger()
 
-# Function to create an Excel file if it doesn't exist
 def load_data():
-    if not os.path.exists(file_path):
-        df = pd.DataFrame(columns=["Student Name", "Father's Name", "Contact", "Location", "Grade", "Monthly Charges", "Month", "Paid Charges", "Paid Date", "Dues"])
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        df.to_excel(file_path, index=False)
-    else:
-        df = pd.read_excel(file_path)
-    return df
+    return ledger.frame()
 
 # Home page that displays student list with total paid and unpaid charges
-@app.route('/', methods=["GET", "POST"])
+@transport_pages.route('/', methods=["GET", "POST"])
 def index():
-    df = load_data()
-    
     # Get search query from form if any
     search_query = request.args.get('search', '')
     
-    # Filter the dataframe if there is a search query
-    if search_query:
-        df = df[df['Student Name'].str.contains(search_query, case=False, na=False)]
-    
-    # Group by Student Name and aggregate
-    student_grouped = df.groupby('Student Name').agg({
-        'Father\'s Name': 'first',
-        'Contact': 'first',
-        'Location': 'first',
-        'Grade': 'first',
-        'Monthly Charges': 'sum',
-        'Paid Charges': 'sum',
-        'Dues': 'sum',
-        'Month': 'first',
-    }).reset_index()
+    # Per-student totals (first Father's Name/Contact/Location/Grade/Month, summed charges),
+    # kept up to date by the ledger instead of a groupby on every hit
+    students = ledger.summary(search_query)
     
     # Calculate total paid and unpaid charges for display
-    total_paid = student_grouped['Paid Charges'].sum()
-    total_unpaid = student_grouped['Dues'].sum()
+    total_paid = sum(s['Paid Charges'] for s in students)
+    total_unpaid = sum(s['Dues'] for s in students)
 
-    return render_template('transport.html', students=student_grouped.to_dict(orient='records'), total_paid=total_paid, total_unpaid=total_unpaid, search_query=search_query)
+    return render_template('transport.html', students=students, total_paid=total_paid, total_unpaid=total_unpaid, search_query=search_query)
 
 def start_flask():
     app.run(host='127.0.0.1', port=5000)
 
 
 # Add student page
-@app.route('/add_student', methods=["GET", "POST"])
+@transport_pages.route('/add_student', methods=["GET", "POST"])
 def add_student():
     if request.method == "POST":
         student_name = request.form['student_name']
@@ -85,43 +69,35 @@ def add_student():
             "Dues": dues,
         }
 
-        df = load_data()
-        new_row = pd.DataFrame([new_data])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_excel(file_path, index=False)
+        ledger.append(new_data)
 
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
 
     return render_template('trs.html')
 
 # Delete student route
-@app.route('/delete_student/<student_name>', methods=["POST"])
+@transport_pages.route('/delete_student/<student_name>', methods=["POST"])
 def delete_student(student_name):
-    df = load_data()
-
-    # Remove student records based on Student Name
-    df = df[df['Student Name'] != student_name]
-
-    # Save the updated DataFrame back to the Excel file
-    df.to_excel(file_path, index=False)
+    # Remove student records based on Student Name (saved to the Excel file in the background)
+    ledger.delete_student(student_name)
 
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
 # Route to view a student's full report
-@app.route('/report/<student_name>')
+@transport_pages.route('/report/<student_name>')
 def student_report(student_name):
-    df = load_data()
-
-    # Filter the records for the selected student
-    student_data = df[df['Student Name'] == student_name]
+    # The selected student's records, looked up by name
+    student_data = ledger.rows_for(student_name)
     return render_template('transport_report.html', student_name=student_name, student_data=student_data.to_dict(orient='records'))
 
 
-# Update charges page
-@app.route('/update_charges/<int:student_id>', methods=["GET", "POST"])
-def update_charges(student_id):
-    df = load_data()
-    student_data = df.iloc[student_id]
+# Update charges page (record_id is the row's "Record ID"; the index page links to each student's latest row)
+@transport_pages.route('/update_charges/<record_id>', methods=["GET", "POST"])
+def update_charges(record_id):
+    try:
+        student_data = ledger.row(record_id)
+    except KeyError:
+        abort(404)
     
     if request.method == "POST":
         if "next_month" in request.form:
@@ -138,35 +114,40 @@ def update_charges(student_id):
                 "Dues": float(request.form['monthly_charges']) - float(request.form['paid_charges']),
             }
 
-            df = load_data()
-            next_month_data = pd.DataFrame([new_data])
-            df = pd.concat([df, next_month_data], ignore_index=True)
-            df.to_excel(file_path, index=False)
-            return redirect(url_for('index'))
+            ledger.append(new_data)
+            return redirect(url_for('.index'))
 
         new_monthly_charges = request.form['monthly_charges']
         new_paid_charges = request.form['paid_charges']
         new_paid_date = request.form['paid_date']
 
-        df.at[student_id, "Monthly Charges"] = new_monthly_charges
-        df.at[student_id, "Paid Charges"] = new_paid_charges
-        df.at[student_id, "Paid Date"] = new_paid_date
-
         dues = float(new_monthly_charges) - float(new_paid_charges)
-        df.at[student_id, "Dues"] = dues
-
-        df.to_excel(file_path, index=False)
+        ledger.update(record_id, {
+            "Monthly Charges": new_monthly_charges,
+            "Paid Charges": new_paid_charges,
+            "Paid Date": new_paid_date,
+            "Dues": dues,
+        })
 
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
 
     return render_template('update_charges.html', student=student_data)
 
+# The transport app on its own; school_app.py runs it together with the fee and payroll pages.
+app = create_app(transport_pages)
+timer.mark('app imported')
+
 if __name__ == '__main__':
+    import webview  # only the desktop window needs it
+
     # Start Flask in a separate thread
     flask_thread = threading.Thread(target=start_flask)
     flask_thread.daemon = True
     flask_thread.start()
+    # Read the ledger (and build its summary) while the window is opening.
+    threading.Thread(target=lambda: (datastores.warm_up('transport'), timer.mark('data loaded')), daemon=True).start()
 
     # Create a webview window
     webview.create_window('School Software', 'http://127.0.0.1:5000')
+    timer.mark('window created')
     webview.start()
@@ -0,0 +1,560 @@
+"""
+Payment ledger derived from the "Months Paid" / "Paid Dates" columns.
+
+The fee pages used to split both strings and run parse_date() for every
+payment of every student on every request. PaymentLedger subscribes to a
+roster store and keeps one entry per paid month in column lists, with the
+paid date parsed once when the record is written. A sorted date index and a
+month index turn date-range and month filters into bisect/dictionary lookups.
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple, defaultdict
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+MONTH_NUMBERS = {m.lower(): i for i, m in enumerate(MONTHS, start=1)}
+
+# month is 1-12 (0 if the sheet has an unknown month name), year comes from
+# the paid date and is None when the date is missing or unreadable.
+Payment = namedtuple('Payment', [
+    'student_id', 'month', 'month_name', 'year', 'amount', 'paid_on', 'date_text', 'type'
+])
+
+
+def parse_date(date_str):
+    if not date_str: return None
+    return _parse_day(str(date_str).split(" ")[0])
+
+
+@lru_cache(maxsize=4096)
+def _parse_day(text):
+    # A roster repeats the same few hundred dates many times over; strptime is the
+    # slow part of building the ledger at startup, so each distinct date is parsed once.
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        try:
+            return datetime.strptime(text, '%d-%m-%Y').date()
+        except ValueError:
+            return None
+
+
+def split_list(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+class PaymentLedger:
+    """Columnar list of paid months for every student in a roster store."""
+
+    def __init__(self, store, payment_type='monthly'):
+        self.store = store
+        self.payment_type = payment_type
+        self._lock = threading.RLock()
+        self._clear()
+        store.subscribe(self)
+
+    def _clear(self):
+        # One list per column; row i of the ledger is (student_id[i], month[i], ...).
+        self._student_id = []
+        self._month = []
+        self._month_name = []
+        self._year = []
+        self._amount = []
+        self._paid_on = []
+        self._date_text = []
+        self._type = []
+        self._live = []
+        self._dead = 0
+        self._by_student = defaultdict(list)
+        self._by_month = defaultdict(set)
+        self._by_date = []  # sorted (date ordinal, row) for rows with a readable date
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._clear()
+            for record in records:
+                self._add_record(record, bulk=True)
+            self._by_date.sort()
+
+    def change(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove_student(old.id)
+            if new is not None:
+                self._add_record(new)
+            if self._dead > 1000 and self._dead > len(self._live) // 2:
+                self._compact()
+
+    def _add_record(self, record, bulk=False):
+        months = split_list(record.months_paid)
+        dates = split_list(record.paid_dates)
+        for i, month_name in enumerate(months):
+            date_text = dates[i] if i < len(dates) else ''
+            paid_on = parse_date(date_text)
+            self._append(Payment(
+                record.id, MONTH_NUMBERS.get(month_name.lower(), 0), month_name,
+                paid_on.year if paid_on else None, record.monthly_fee, paid_on, date_text,
+                self.payment_type), bulk)
+
+    def _append(self, payment, bulk=False):
+        # bulk: the caller sorts _by_date once at the end (insort per row is quadratic on a full load).
+        row = len(self._live)
+        self._student_id.append(payment.student_id)
+        self._month.append(payment.month)
+        self._month_name.append(payment.month_name)
+        self._year.append(payment.year)
+        self._amount.append(payment.amount)
+        self._paid_on.append(payment.paid_on)
+        self._date_text.append(payment.date_text)
+        self._type.append(payment.type)
+        self._live.append(True)
+        self._by_student[payment.student_id].append(row)
+        self._by_month[payment.month_name.lower()].add(row)
+        if payment.paid_on is not None:
+            if bulk:
+                self._by_date.append((payment.paid_on.toordinal(), row))
+            else:
+                insort(self._by_date, (payment.paid_on.toordinal(), row))
+
+    def _remove_student(self, student_id):
+        for row in self._by_student.pop(student_id, []):
+            self._live[row] = False
+            self._dead += 1
+            self._by_month[self._month_name[row].lower()].discard(row)
+            if self._paid_on[row] is not None:
+                key = (self._paid_on[row].toordinal(), row)
+                i = bisect_left(self._by_date, key)
+                if i < len(self._by_date) and self._by_date[i] == key:
+                    del self._by_date[i]
+
+    def _compact(self):
+        live = [self._row(i) for i in range(len(self._live)) if self._live[i]]
+        self._clear()
+        for payment in live:
+            self._append(payment, bulk=True)
+        self._by_date.sort()
+
+    def _row(self, i):
+        return Payment(self._student_id[i], self._month[i], self._month_name[i], self._year[i],
+                       self._amount[i], self._paid_on[i], self._date_text[i], self._type[i])
+
+    # --- queries -------------------------------------------------------------
+
+    def for_student(self, student_id):
+        """The student's payments in the order they appear in the sheet."""
+        self.store.refresh()
+        return self._entries_for(student_id)
+
+    def _entries_for(self, student_id):
+        # No refresh: also called from other listeners while the store is reloading.
+        with self._lock:
+            return [self._row(i) for i in self._by_student.get(student_id, [])]
+
+    def entries(self):
+        """Every live payment, in ledger order."""
+        # No refresh: read by other listeners' rebuilds, which refresh the store themselves.
+        with self._lock:
+            return [self._row(i) for i in range(len(self._live)) if self._live[i]]
+
+    def dated_months(self):
+        """(student_ids, years, months) of every payment with a readable date and a known month, as lists."""
+        # No refresh: read by other listeners' rebuilds, which refresh the store themselves.
+        with self._lock:
+            rows = [row for _, row in self._by_date if self._month[row]]
+            return ([self._student_id[row] for row in rows], [self._year[row] for row in rows],
+                    [self._month[row] for row in rows])
+
+    def paid_months(self, student_id):
+        """Set of (year, month) the student has a dated payment for."""
+        return {(p.year, p.month) for p in self.for_student(student_id) if p.year is not None}
+
+    def query(self, start=None, end=None, month=None):
+        """Payments paid within [start, end] (inclusive dates) and/or for a month name.
+
+        With a date bound, payments without a readable date are left out, as the
+        fee collection report always did.
+        """
+        self.store.refresh()
+        with self._lock:
+            if start is not None or end is not None:
+                lo = bisect_left(self._by_date, (start.toordinal(),)) if start else 0
+                hi = bisect_right(self._by_date, (end.toordinal() + 1,)) if end else len(self._by_date)
+                rows = [row for _, row in self._by_date[lo:hi]]
+                if month:
+                    wanted = self._by_month.get(month.lower(), set())
+                    rows = [row for row in rows if row in wanted]
+            elif month:
+                rows = sorted(self._by_month.get(month.lower(), ()))
+            else:
+                rows = [i for i in range(len(self._live)) if self._live[i]]
+            return [self._row(i) for i in rows]
+
+
+class FeeAggregates:
+    """Collected and outstanding monthly fees, kept up to date edit by edit.
+
+    Totals are held per (grade, year, month) cell and for every combination
+    with parts of the key left out (None), so a dashboard total for "grade 5",
+    "March 2025" or "everything" is a single dictionary lookup. The "grade" is
+    the record field named by `group_field`: the grade for the school roster,
+    the course for the computer academy. Outstanding
+    months run from the admission month up to the current month, exactly as
+    the unpaid view of the fee collection report counts them; the tables are
+    rebuilt when the calendar month rolls over.
+    """
+
+    def __init__(self, ledger, group_field='grade'):
+        self.ledger = ledger
+        self.group_field = group_field
+        self._lock = threading.RLock()
+        self._as_of = None
+        self._clear()
+        ledger.store.subscribe(self)
+
+    def _clear(self):
+        self._collected = defaultdict(float)
+        self._outstanding = defaultdict(float)
+        self._students = {}
+        self._grade_counts = defaultdict(int)
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._clear()
+            today = date.today()
+            self._as_of = (today.year, today.month)
+            for record in records:
+                self._add(record)
+
+    def change(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._remove(old.id)
+            if new is not None:
+                self._add(new)
+
+    def _add(self, record):
+        grade = getattr(record, self.group_field)
+        if not grade or record.id in self._students:
+            return  # the fee report ignores students without a grade; first row wins for duplicate IDs
+        payments = self.ledger._entries_for(record.id)
+        paid = {(p.year, p.month) for p in payments if p.year is not None}
+        admit = parse_date(record.admission_date)
+        # Months counted as year * 12 + (month - 1), from admission (or January) to now.
+        first = admit.year * 12 + admit.month - 1 if admit else self._as_of[0] * 12
+        last = self._as_of[0] * 12 + self._as_of[1] - 1
+        due = [ym for ym in ((k // 12, k % 12 + 1) for k in range(first, last + 1)) if ym not in paid]
+        entry = {
+            'student_id': record.id, 'student': record.name, 'grade': grade,
+            'fee': record.monthly_fee, 'due': due, 'payments': payments,
+            'collected': sum(p.amount for p in payments),
+            'outstanding': record.monthly_fee * len(due),
+        }
+        self._students[record.id] = entry
+        self._grade_counts[grade] += 1
+        self._apply(entry, 1)
+
+    def _remove(self, student_id):
+        entry = self._students.pop(student_id, None)
+        if entry is not None:
+            self._grade_counts[entry['grade']] -= 1
+            self._apply(entry, -1)
+
+    def _apply(self, entry, sign):
+        grade = entry['grade']
+        self._bump(self._collected, grade, [(p.year, p.month, sign * p.amount) for p in entry['payments']])
+        self._bump(self._outstanding, grade, [(y, m, sign * entry['fee']) for y, m in entry['due']])
+
+    @staticmethod
+    def _bump(table, grade, items):
+        # Each (year, month, amount) counts towards its own cell and every rollup
+        # of it; the rollups are summed here first so they are touched once.
+        # Undated payments (year None) only count towards the all-years totals.
+        by_year = defaultdict(float)
+        by_month = defaultdict(float)
+        total = 0.0
+        for year, month, amount in items:
+            if year is not None:
+                table[(grade, year, month)] += amount
+                table[(None, year, month)] += amount
+                by_year[year] += amount
+            by_month[month] += amount
+            total += amount
+        for year, amount in by_year.items():
+            table[(grade, year, None)] += amount
+            table[(None, year, None)] += amount
+        for month, amount in by_month.items():
+            table[(grade, None, month)] += amount
+            table[(None, None, month)] += amount
+        if items:
+            table[(grade, None, None)] += total
+            table[(None, None, None)] += total
+
+    def _check_month(self):
+        today = date.today()
+        if self._as_of != (today.year, today.month):
+            self.reset(self.ledger.store.all())
+
+    # --- queries -------------------------------------------------------------
+
+    def totals(self, grade=None, year=None, month=None):
+        """{'collected': ..., 'outstanding': ...} for a grade/year/month (None = all)."""
+        self.ledger.store.refresh()
+        self._check_month()
+        with self._lock:
+            key = (grade or None, year or None, month or None)
+            return {'collected': self._collected.get(key, 0.0),
+                    'outstanding': self._outstanding.get(key, 0.0)}
+
+    def grades(self):
+        """Grades that currently have at least one student."""
+        self.ledger.store.refresh()
+        self._check_month()
+        with self._lock:
+            return [g for g, n in self._grade_counts.items() if n > 0]
+
+    def student(self, student_id):
+        self.ledger.store.refresh()
+        self._check_month()
+        with self._lock:
+            entry = self._students.get(student_id)
+            return dict(entry) if entry else None
+
+    def unpaid_summary(self, grade=None):
+        """Per-student rows of the fee report's unpaid summary, without its month loops."""
+        self.ledger.store.refresh()
+        self._check_month()
+        with self._lock:
+            return [
+                {'student_id': e['student_id'], 'student': e['student'], 'grade': e['grade'],
+                 'count': len(e['due']),
+                 'months_list': [f"{MONTHS[m - 1]} {y}" for y, m in e['due']],
+                 'total_due': e['outstanding']}
+                for e in self._students.values()
+                if e['due'] and (not grade or e['grade'] == grade)
+            ]
+
+
+class AccountTotals:
+    """Expected fee, amount paid and dues per grade (or course), kept up to date edit by edit.
+
+    The student and computer academy lists used to add these up over every
+    student on every request. `account(record)` returns the record's
+    (group, expected, paid); dues come from the record's Dues column. Amounts
+    are kept rounded to the paisa so adding and removing an edit leaves no
+    float residue in the totals shown.
+    """
+
+    def __init__(self, store, account):
+        self.store = store
+        self.account = account
+        self._lock = threading.RLock()
+        self._clear()
+        store.subscribe(self)
+
+    def _clear(self):
+        self._groups = defaultdict(lambda: {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0, 'count': 0})
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._clear()
+            for record in records:
+                self._apply(record, 1)
+
+    def change(self, old, new):
+        with self._lock:
+            if old is not None:
+                self._apply(old, -1)
+            if new is not None:
+                self._apply(new, 1)
+
+    def _apply(self, record, sign):
+        group, expected, paid = self.account(record)
+        totals = self._groups[group]
+        totals['fee'] = round(totals['fee'] + sign * expected, 2)
+        totals['paid_fee'] = round(totals['paid_fee'] + sign * paid, 2)
+        totals['dues'] = round(totals['dues'] + sign * (record.dues or 0.0), 2)
+        totals['count'] += sign
+
+    # --- queries -------------------------------------------------------------
+
+    def totals(self, group=None):
+        """{'fee', 'paid_fee', 'dues', 'count'} of one group, or of the whole roster."""
+        self.store.refresh()
+        with self._lock:
+            if group is not None:
+                return dict(self._groups.get(group) or {'fee': 0.0, 'paid_fee': 0.0, 'dues': 0.0, 'count': 0})
+            groups = [t for t in self._groups.values() if t['count'] > 0]
+            return {'fee': round(sum(t['fee'] for t in groups), 2),
+                    'paid_fee': round(sum(t['paid_fee'] for t in groups), 2),
+                    'dues': round(sum(t['dues'] for t in groups), 2),
+                    'count': sum(t['count'] for t in groups)}
+
+    def groups(self):
+        """Groups that currently have at least one student."""
+        self.store.refresh()
+        with self._lock:
+            return [g for g, t in self._groups.items() if t['count'] > 0]
+
+
+class DailyCollections:
+    """Monthly fees collected per paid date: count, total and student IDs for each day.
+
+    The daily collection page used to split every student's "Paid Dates" on
+    every request, even to show a single day. Days are kept in a dictionary
+    (one lookup for a date) and a sorted list of the days that have payments
+    (bisect for a week, a month or any range). Built from the payment ledger
+    on the first query after a reload, then updated edit by edit. Paid dates
+    that cannot be read are kept apart under their text, and are only shown
+    when no date is asked for.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._lock = threading.RLock()
+        self._built = False
+        ledger.store.subscribe(self)
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._built = False  # rebuilt from the ledger on the next query
+
+    def change(self, old, new):
+        with self._lock:
+            if not self._built:
+                return
+            for record in (old, new):
+                if record is not None:
+                    for key, amount in self._by_student.pop(record.id, []):
+                        self._bump(key, record.id, amount, -1)
+            if new is not None:
+                # Every payment the ledger now files under this ID (a duplicate ID keeps the earlier rows).
+                for p in self.ledger._entries_for(new.id):
+                    self._add(p)
+
+    # --- building ------------------------------------------------------------
+
+    def _build(self):
+        self._days = {}        # date -> {'count', 'total', 'student_ids'}
+        self._order = []       # sorted dates in _days
+        self._undated = {}     # unreadable paid date text -> same dict
+        self._by_student = defaultdict(list)  # student ID -> [(date or text, amount)]
+        for p in self.ledger.entries():
+            self._add(p)
+        self._built = True
+
+    def _add(self, p):
+        key = p.paid_on or p.date_text
+        if not key:
+            return  # no paid date at all: not a collection
+        self._by_student[p.student_id].append((key, p.amount))
+        self._bump(key, p.student_id, p.amount, 1)
+
+    def _bump(self, key, student_id, amount, sign):
+        table = self._days if isinstance(key, date) else self._undated
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = {'count': 0, 'total': 0.0, 'student_ids': []}
+            if table is self._days:
+                insort(self._order, key)
+        entry['count'] += sign
+        entry['total'] = round(entry['total'] + sign * amount, 2)
+        if sign > 0:
+            entry['student_ids'].append(student_id)
+        else:
+            entry['student_ids'].remove(student_id)
+        if entry['count'] <= 0:
+            del table[key]
+            if table is self._days:
+                del self._order[bisect_left(self._order, key)]
+
+    def _ready(self):
+        # Callers refresh the store before taking self._lock: a reload takes the store lock,
+        # and writers hold that lock while they call change(), which takes self._lock.
+        if not self._built:
+            self._build()
+
+    # --- queries -------------------------------------------------------------
+
+    def day(self, when):
+        """{'count', 'total', 'student_ids'} collected on one date (zeros if nothing was)."""
+        self.ledger.store.refresh()
+        with self._lock:
+            self._ready()
+            entry = self._days.get(when)
+            return {'count': entry['count'], 'total': entry['total'], 'student_ids': list(entry['student_ids'])} \
+                if entry else {'count': 0, 'total': 0.0, 'student_ids': []}
+
+    def between(self, start=None, end=None):
+        """[(date, entry)] for the days with payments in [start, end] (inclusive; None = open), oldest first."""
+        self.ledger.store.refresh()
+        with self._lock:
+            self._ready()
+            return [(d, dict(self._days[d], student_ids=list(self._days[d]['student_ids'])))
+                    for d in self._days_between(start, end)]
+
+    def _days_between(self, start, end):
+        lo = bisect_left(self._order, start) if start else 0
+        hi = bisect_right(self._order, end) if end else len(self._order)
+        return self._order[lo:hi]
+
+    def undated(self):
+        """[(paid date text, entry)] for payments whose date could not be read."""
+        self.ledger.store.refresh()
+        with self._lock:
+            self._ready()
+            return sorted((text, dict(e, student_ids=list(e['student_ids']))) for text, e in self._undated.items())
+
+    def series(self, start=None, end=None, step='day'):
+        """Collections per day, week (from Monday) or month between start and end, empty periods included.
+
+        Returns [{'date': first day of the period, 'count', 'total'}]; open ends
+        default to the first and last day with payments.
+        """
+        self.ledger.store.refresh()
+        with self._lock:
+            self._ready()
+            if not self._order:
+                return []
+            start = start or self._order[0]
+            end = end or self._order[-1]
+            buckets = {}
+            for d in self._days_between(start, end):
+                entry = self._days[d]
+                bucket = buckets.setdefault(period_start(d, step), {'count': 0, 'total': 0.0})
+                bucket['count'] += entry['count']
+                bucket['total'] = round(bucket['total'] + entry['total'], 2)
+        series = []
+        current = period_start(start, step)
+        while current <= end:
+            bucket = buckets.get(current, {'count': 0, 'total': 0.0})
+            series.append({'date': current.isoformat(), 'count': bucket['count'], 'total': bucket['total']})
+            current = next_period(current, step)
+        return series
+
+
+def period_start(day, step):
+    """First day of the day/week (Monday)/month that `day` falls in."""
+    if step == 'week':
+        return day - timedelta(days=day.weekday())
+    if step == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, step):
+    if step == 'week':
+        return start + timedelta(days=7)
+    if step == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
@@ -0,0 +1,89 @@
+"""
+Cursor pagination and streamed rendering for the long list pages.
+
+/students, /comp and /fee_collection used to render every matching row in a
+single render_template() call. They now show one page at a time: the rows are
+sorted by a key that is unique per row, and the "next" link carries the key of
+the last row shown (the cursor), so a page starts right after it even if rows
+were added or deleted in the meantime.
+
+?print=all renders every row for printing, streamed to the browser with
+Template.generate() so the first rows arrive before the last ones are built.
+"""
+import base64
+import json
+from bisect import bisect_right
+from collections import namedtuple
+
+from flask import Response, current_app, render_template, request, stream_with_context, url_for
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# offset: number of rows before this page (for row numbering);
+# streamed: True in print-all mode, where items holds every row.
+Page = namedtuple('Page', [
+    'items', 'offset', 'total', 'next_url', 'first_url', 'print_url', 'streamed'
+])
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Sort key from a cursor token, or None if the token is not one of ours."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        return None
+    return tuple(key) if isinstance(key, list) else None
+
+
+def _page_url(**changes):
+    args = request.args.to_dict()
+    for name, value in changes.items():
+        if value is None:
+            args.pop(name, None)
+        else:
+            args[name] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def paginate(items, sort_key, page_size=PAGE_SIZE):
+    """One page of `items`, which must already be sorted by `sort_key`.
+
+    sort_key(item) must return a flat tuple of str/int/float that is unique
+    per item, so it can be used as the cursor. Reads ?cursor=, ?page_size=
+    and ?print=all from the current request.
+    """
+    print_url = _page_url(cursor=None, print='all')
+    if request.args.get('print') == 'all':
+        return Page(items, 0, len(items), None, None, print_url, True)
+
+    size = request.args.get('page_size', type=int) or page_size
+    size = max(1, min(size, MAX_PAGE_SIZE))
+    start = 0
+    cursor = request.args.get('cursor', '')
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        try:
+            start = bisect_right([sort_key(item) for item in items], after)
+        except TypeError:
+            start = 0  # cursor from a different sort order
+
+    end = start + size
+    page_items = items[start:end]
+    next_url = _page_url(cursor=encode_cursor(sort_key(page_items[-1]))) if end < len(items) else None
+    first_url = _page_url(cursor=None) if start else None
+    return Page(page_items, start, len(items), next_url, first_url, print_url, False)
+
+
+def render_page(page, template_name, **context):
+    """render_template() for a normal page; a streamed response for print-all."""
+    if not page.streamed:
+        return render_template(template_name, page=page, **context)
+    context['page'] = page
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.generate(context)))
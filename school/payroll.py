@@ -0,0 +1,317 @@
+"""
+Teacher payroll kept in long format: one row per (teacher, year, month).
+
+school_data.xlsx used to hold twelve months x three columns (deduction,
+leaves, paid) in each teacher's row, so it could only ever hold one year, and
+every update also appended a copy of the month to a "Report" sheet through a
+second load-and-save of the workbook. PayrollBook keeps
+
+* a "Teachers" sheet with the teacher details only, and
+* a "Payroll" sheet with Teacher Name, Year, Month, Deductions, Leaves and
+  Paid Salary, one row per teacher and month, for any number of years.
+
+Both are held in memory: teachers by name, pay entries in a dict keyed by
+(teacher, year, month), and yearly totals per teacher (and per month and
+year across all teachers, for the dashboard) that are adjusted as entries
+change instead of summed on every page view. Each edit saves the
+workbook once (temp file and rename) on the storage writer thread
+(coordinator.py) and waits for that save before returning; pages keep
+reading the in-memory copy meanwhile. Other sheets in the file, such as the
+old "Report" log, are carried over untouched.
+
+A workbook in the old wide layout is converted on first load. The wide rows
+have no year, so their months are filed under the year the workbook was last
+modified; months that were never filled in (all zeros) are left out.
+"""
+import calendar
+import os
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+
+from coordinator import coordinator
+from ledger import MONTHS, MONTH_NUMBERS
+
+TEACHER_HEADERS = ["Teacher Name", "Qualification", "Contact Number", "Joining Date", "Monthly Salary"]
+PAYROLL_HEADERS = ["Teacher Name", "Year", "Month", "Deductions", "Leaves", "Paid Salary"]
+
+Teacher = namedtuple('Teacher', ['name', 'qualification', 'contact', 'joining_date', 'monthly_salary'])
+# month is 1-12; the sheet stores the month name.
+PayEntry = namedtuple('PayEntry', ['teacher', 'year', 'month', 'deduction', 'leaves', 'paid'])
+
+# A leave costs this share of the monthly salary.
+LEAVE_DEDUCTION_RATE = 0.04
+
+
+def month_number(month):
+    """1-12 for a month name or number (KeyError for anything else)."""
+    if isinstance(month, int) and 1 <= month <= 12:
+        return month
+    return MONTH_NUMBERS[str(month).strip().lower()]
+
+
+def days_in_month(year, month):
+    return calendar.monthrange(year, month_number(month))[1]
+
+
+def salary_for(monthly_salary, leaves):
+    """(deduction, paid salary) for a month with `leaves` days off."""
+    deduction = (monthly_salary * LEAVE_DEDUCTION_RATE) * leaves
+    return deduction, max(0, monthly_salary - deduction)
+
+
+def _number(value):
+    if value in (None, ''):
+        return 0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+
+class PayrollBook:
+    """Teachers and their monthly pay, loaded once from `path` and saved once per edit."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._teachers = {}
+        self._entries = {}        # (teacher, year, month) -> PayEntry
+        self._months_of = {}      # teacher -> set of (year, month) with an entry
+        self._totals = {}         # (teacher, year) -> [deduction, leaves, paid]
+        self._period_totals = {}  # (year, month) and (year, None) -> [deduction, leaves, paid], all teachers
+        self._other_sheets = []   # (title, rows) of sheets this class does not manage
+        if not os.path.exists(path):
+            coordinator.run(self._save)
+
+    # --- loading -----------------------------------------------------------
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        """Reload the workbook if the file changed since it was last read."""
+        if self._signature is not None and self._signature == self._file_signature():
+            return
+        with self._lock:
+            signature = self._file_signature()
+            if signature != self._signature:
+                self._load()
+
+    def _load(self):
+        self._teachers, self._entries, self._months_of, self._totals = {}, {}, {}, {}
+        self._period_totals = {}
+        self._other_sheets = []
+        self._signature = self._file_signature()
+        if self._signature is None:
+            return
+        import openpyxl  # imported on first use, not at startup
+        wb = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            sheets = {ws.title: [list(row) for row in ws.iter_rows(values_only=True)] for ws in wb.worksheets}
+        finally:
+            wb.close()
+        teacher_rows = sheets.pop("Teachers", [])
+        payroll_rows = sheets.pop("Payroll", None)
+        self._other_sheets = list(sheets.items())
+        legacy_year = datetime.fromtimestamp(os.path.getmtime(self.path)).year
+
+        for row in teacher_rows[1:]:
+            row = row + [None] * (len(TEACHER_HEADERS) - len(row))
+            if row[0] in (None, ''):
+                continue
+            teacher = Teacher(str(row[0]), _text(row[1]), _text(row[2]), _text(row[3]), _number(row[4]))
+            if teacher.name in self._teachers:
+                print(f"Skipping a second row for teacher {teacher.name}")
+                continue
+            self._teachers[teacher.name] = teacher
+            if payroll_rows is None:
+                # Old wide layout: deduction, leaves and paid for each month from column 5 on.
+                for i, month in enumerate(MONTHS):
+                    values = [_number(v) for v in row[5 + 3 * i:8 + 3 * i]]
+                    if any(values):
+                        values += [0] * (3 - len(values))
+                        self._put(PayEntry(teacher.name, legacy_year, i + 1, *values))
+
+        for row in (payroll_rows or [])[1:]:
+            row = row + [None] * (len(PAYROLL_HEADERS) - len(row))
+            if row[0] in (None, '') or str(row[0]) not in self._teachers:
+                continue
+            try:
+                key = (str(row[0]), int(_number(row[1])), month_number(row[2]))
+            except KeyError:
+                print(f"Skipping payroll row with unknown month {row[2]!r} for {row[0]}")
+                continue
+            self._put(PayEntry(*key, _number(row[3]), _number(row[4]), _number(row[5])))
+
+        if payroll_rows is None and teacher_rows:
+            self._submit_save()  # write the converted layout once
+
+    # --- index and rollups -------------------------------------------------
+
+    def _put(self, entry):
+        key = (entry.teacher, entry.year, entry.month)
+        old = self._entries.get(key)
+        if old is not None:
+            self._roll(old, -1)
+        self._entries[key] = entry
+        self._months_of.setdefault(entry.teacher, set()).add((entry.year, entry.month))
+        self._roll(entry, 1)
+
+    def _roll(self, entry, sign):
+        for totals, key in ((self._totals, (entry.teacher, entry.year)),
+                            (self._period_totals, (entry.year, entry.month)),
+                            (self._period_totals, (entry.year, None))):
+            totals = totals.setdefault(key, [0, 0, 0])
+            totals[0] += sign * entry.deduction
+            totals[1] += sign * entry.leaves
+            totals[2] += sign * entry.paid
+
+    # --- reads -------------------------------------------------------------
+
+    def teachers(self):
+        """All teachers in the order they were added."""
+        self.refresh()
+        with self._lock:
+            return list(self._teachers.values())
+
+    def teacher(self, name):
+        self.refresh()
+        with self._lock:
+            return self._teachers.get(name)
+
+    def entry(self, name, year, month):
+        self.refresh()
+        with self._lock:
+            return self._entries.get((name, year, month_number(month)))
+
+    def year_months(self, name, year):
+        """Twelve PayEntry rows for `year`, zeros where the month has no entry."""
+        self.refresh()
+        with self._lock:
+            return [self._entries.get((name, year, m)) or PayEntry(name, year, m, 0, 0, 0)
+                    for m in range(1, 13)]
+
+    def totals(self, name, year):
+        """(deductions, leaves, paid) for one teacher and year."""
+        self.refresh()
+        with self._lock:
+            return tuple(self._totals.get((name, year), (0, 0, 0)))
+
+    def yearly_totals(self, name):
+        """[(year, deductions, leaves, paid)] for every year the teacher has entries, oldest first."""
+        self.refresh()
+        with self._lock:
+            years = sorted({year for year, _ in self._months_of.get(name, ())})
+            return [(year, *self._totals[(name, year)]) for year in years]
+
+    def period_totals(self, year, month=None):
+        """(deductions, leaves, paid) over all teachers for a month of `year`, or the whole year."""
+        self.refresh()
+        with self._lock:
+            key = (year, month_number(month) if month else None)
+            return tuple(self._period_totals.get(key, (0, 0, 0)))
+
+    def years(self):
+        """Every year with at least one entry, plus the current year."""
+        self.refresh()
+        with self._lock:
+            return sorted({year for _, year in self._totals} | {date.today().year})
+
+    # --- writes ------------------------------------------------------------
+
+    def add_teacher(self, teacher):
+        """Add a teacher (ValueError if the name is taken)."""
+        with self._lock:
+            self.refresh()
+            if teacher.name in self._teachers:
+                raise ValueError(f"A teacher named {teacher.name} already exists.")
+            self._teachers[teacher.name] = teacher
+            saved = self._submit_save()
+        saved.result()
+
+    def delete_teacher(self, name):
+        """Remove a teacher and their pay history. Returns False if there is no such teacher."""
+        with self._lock:
+            self.refresh()
+            if self._teachers.pop(name, None) is None:
+                return False
+            for year, month in self._months_of.pop(name, ()):
+                self._roll(self._entries.pop((name, year, month)), -1)
+            for key in [key for key in self._totals if key[0] == name]:
+                del self._totals[key]
+            saved = self._submit_save()
+        saved.result()
+        return True
+
+    def set_month(self, name, year, month, deduction, leaves, paid):
+        """Record one month of pay. Returns the entry, or None if there is no such teacher."""
+        entry = PayEntry(name, year, month_number(month), deduction, leaves, paid)
+        if self.teacher(name) is None:
+            return None
+        self.set_months([entry])
+        return entry
+
+    def set_months(self, entries):
+        """Record many PayEntry rows with a single save.
+
+        Entries for unknown teachers are ignored, and entries identical to
+        what is already recorded are not counted, so running the same batch
+        twice saves nothing the second time. Returns how many entries changed.
+        """
+        with self._lock:
+            self.refresh()
+            changed = [entry for entry in entries if entry.teacher in self._teachers and
+                       self._entries.get((entry.teacher, entry.year, entry.month)) != entry]
+            for entry in changed:
+                self._put(entry)
+            saved = self._submit_save() if changed else None
+        if saved is not None:
+            saved.result()
+        return len(changed)
+
+    def _submit_save(self):
+        # Queued while the lock is held so saves follow edit order; never wait for it under the lock,
+        # because the save takes the lock itself.
+        return coordinator.submit(self._save, key=('save', self.path))
+
+    def _save(self):
+        """Write the book to the workbook (runs on the storage writer thread)."""
+        with self._lock:
+            teacher_rows = [list(teacher) for teacher in self._teachers.values()]
+            entries = sorted(self._entries.values(), key=lambda e: (e.teacher, e.year, e.month))
+            other_sheets = list(self._other_sheets)
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        teachers = wb.create_sheet("Teachers")
+        teachers.append(TEACHER_HEADERS)
+        for row in teacher_rows:
+            teachers.append(row)
+        payroll = wb.create_sheet("Payroll")
+        payroll.append(PAYROLL_HEADERS)
+        for entry in entries:
+            payroll.append([entry.teacher, entry.year, MONTHS[entry.month - 1],
+                            entry.deduction, entry.leaves, entry.paid])
+        for title, rows in other_sheets:
+            sheet = wb.create_sheet(title)
+            for row in rows:
+                sheet.append(row)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = os.path.splitext(self.path)[0] + ".tmp.xlsx"
+        wb.save(tmp_path)
+        with self._lock:
+            os.replace(tmp_path, self.path)
+            self._signature = self._file_signature()
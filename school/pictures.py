@@ -0,0 +1,150 @@
+"""
+Student pictures: content-addressed originals plus pre-sized thumbnails.
+
+Uploads used to be saved as "<id>_<original name>" at full resolution, and
+every page showed the original. PictureStore names each upload after the
+SHA-256 of its bytes, so the same photo uploaded twice (siblings, a re-upload)
+is stored once. After the original is saved, a small thread pool writes one
+thumbnail per size into uploads/thumbs. The list and modify pages use the
+thumbnails; the printed reports still use the original.
+
+Thumbnails need Pillow. Without it, thumbnail() returns the original file.
+Pillow is imported on first use rather than at startup.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Longest side in pixels; the image is scaled down to fit, never up.
+THUMB_SIZES = {'small': 64, 'medium': 200}
+
+_pil = None
+
+
+def pil():
+    """(Image, ImageOps, features) from Pillow, or None if it is not installed."""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image, ImageOps, features
+            _pil = (Image, ImageOps, features)
+        except ImportError:  # thumbnails are optional
+            _pil = ()
+    return _pil or None
+
+
+class PictureStore:
+    """Original pictures in `upload_dir`, thumbnails in `upload_dir`/thumbs."""
+
+    def __init__(self, upload_dir, workers=2):
+        self.upload_dir = upload_dir
+        self.thumb_dir = os.path.join(upload_dir, 'thumbs')
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbs')
+        self._pending = {}  # thumbnail path -> Future while it is being written
+        self._lock = threading.Lock()
+        self._format = None
+
+    @property
+    def thumb_format(self):
+        return self._thumb_format()[0]
+
+    @property
+    def thumb_ext(self):
+        return self._thumb_format()[1]
+
+    def _thumb_format(self):
+        if self._format is None:
+            modules = pil()
+            if modules is not None and modules[2].check('webp'):
+                self._format = ('WEBP', 'webp')
+            else:
+                self._format = ('JPEG', 'jpg')
+        return self._format
+
+    def save(self, file_storage):
+        """Store an upload under its content hash and queue its thumbnails.
+
+        Returns the file name to keep in the Picture column.
+        """
+        data = file_storage.read()
+        ext = os.path.splitext(file_storage.filename or '')[1].lower() or '.jpg'
+        filename = hashlib.sha256(data).hexdigest()[:32] + ext
+        path = os.path.join(self.upload_dir, filename)
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        if pil() is not None:
+            for size in THUMB_SIZES:
+                self._queue(filename, size)
+        return filename
+
+    def original(self, filename):
+        return os.path.join(self.upload_dir, filename)
+
+    def _thumb_path(self, filename, size):
+        return os.path.join(self.thumb_dir, f"{os.path.splitext(filename)[0]}_{size}.{self.thumb_ext}")
+
+    def _queue(self, filename, size):
+        path = self._thumb_path(filename, size)
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None and not os.path.exists(path):
+                future = self._pool.submit(self._make_thumb, filename, size, path)
+                self._pending[path] = future
+        return future
+
+    def _make_thumb(self, filename, size, path):
+        Image, ImageOps, _ = pil()
+        try:
+            with Image.open(self.original(filename)) as img:
+                img = ImageOps.exif_transpose(img)
+                if img.mode not in ('RGB', 'RGBA') or self.thumb_format == 'JPEG':
+                    img = img.convert('RGB')
+                img.thumbnail((THUMB_SIZES[size], THUMB_SIZES[size]))
+                tmp_path = path + '.tmp'
+                img.save(tmp_path, self.thumb_format, quality=80)
+            os.replace(tmp_path, path)
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def thumbnail(self, filename, size):
+        """Path of the `size` thumbnail of `filename`, made now if it is not ready yet.
+
+        Falls back to the original when Pillow is missing or the file is not
+        an image it can read. Returns None if the original does not exist.
+        """
+        if not os.path.exists(self.original(filename)):
+            return None
+        if pil() is None:
+            return self.original(filename)
+        path = self._thumb_path(filename, size)
+        if not os.path.exists(path):
+            # Pictures uploaded before thumbnails existed are done on first view.
+            future = self._queue(filename, size)
+            try:
+                if future is not None:
+                    future.result()
+            except Exception as e:
+                print(f"Could not make a thumbnail of {filename}: {e}")
+                return self.original(filename)
+        return path
+
+    def print_path(self, filename):
+        """The medium thumbnail if it is already made, else the original; None if there is no picture."""
+        if not filename or not os.path.exists(self.original(filename)):
+            return None
+        path = self._thumb_path(filename, 'medium') if pil() is not None else None
+        return path if path and os.path.exists(path) else self.original(filename)
+
+    def discard(self, filename):
+        """Delete a picture and its thumbnails. Callers check nobody else uses it."""
+        for path in [self.original(filename)] + [self._thumb_path(filename, s) for s in THUMB_SIZES]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,312 @@
+"""
+Fee receipts and student reports for a whole grade or course, as PDF.
+
+The report pages only render HTML, so printing a class meant opening every
+student's page by hand. PrintQueue takes the students to print as plain
+dicts (see sheet()), built on the web process from the in-memory rosters,
+so the workers never open a workbook. The dicts are handed out in chunks
+to a small process pool, which draws the pages with reportlab's canvas.
+Each job runs on its own background thread. A page that started one polls
+the job's progress and downloads the result once it is done: one merged PDF
+(chunks joined with pypdf) or a ZIP with one PDF per student.
+
+Needs reportlab; merging into one PDF also needs pypdf. The pool is
+started on the first job, with the "spawn" method so workers never inherit
+the web server's threads.
+"""
+import itertools
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+SCHOOL_NAME = "THE LITTLE ANGELS NEXT GEN MONTESSORI SCHOOL"
+KINDS = {'receipt': "Fee Receipt", 'report': "Student Report"}
+OUTPUTS = ('pdf', 'zip')
+
+# Finished jobs kept for download; older ones are dropped.
+KEEP_JOBS = 10
+# Students per task sent to a worker: enough to hide the pickling, small enough for steady progress.
+MAX_CHUNK = 25
+
+
+def can_merge():
+    """True if pypdf is installed, so a job can produce one merged PDF."""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def sheet(record, payments, group_label, charges, remarks=(), picture=None):
+    """Everything printed for one student, as a plain (picklable) dict.
+
+    payments are ledger Payment entries in sheet order; charges is a list of
+    (label, due, paid) besides the monthly fee.
+    """
+    history = [(p.month_name, p.date_text or "N/A", p.amount, p.paid_on.isoformat() if p.paid_on else None,
+                remarks[i] if i < len(remarks) else "")
+               for i, p in enumerate(payments)]
+    return {
+        'id': record.id, 'name': record.name, 'father_name': record.father_name, 'contact': record.contact,
+        'group_label': group_label, 'group': getattr(record, group_label.lower()),
+        'monthly_fee': record.monthly_fee, 'admission_date': record.admission_date,
+        'charges': list(charges), 'history': history,
+        'expected': len(history) * record.monthly_fee + sum(due for _, due, _ in charges),
+        'paid': record.paid_fee + sum(paid for _, _, paid in charges),
+        'dues': record.dues, 'picture': picture,
+    }
+
+
+# --- drawing (runs in the worker processes) -----------------------------------
+
+def render_chunk(sheets, kind, start=None, end=None, merged=True):
+    """PDFs of `sheets`: [(None, pdf)] with one page (or more) per student when merged,
+    else [(file name, pdf)] per student. start/end (ISO dates) limit the payments on a receipt.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    draw = _draw_receipt if kind == 'receipt' else _draw_report
+    printed = time.strftime('%Y-%m-%d')
+    out = []
+    buffer = c = None
+    for s in sheets:
+        if c is None:
+            buffer = BytesIO()
+            c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+            c.setTitle(f"{KINDS[kind]} - {s['name']}" if not merged else KINDS[kind])
+        draw(c, s, printed, start, end)
+        c.showPage()
+        if not merged:
+            c.save()
+            out.append((f"{kind}_{_safe_name(s['id'])}.pdf", buffer.getvalue()))
+            c = None
+    if c is not None:
+        c.save()
+        out.append((None, buffer.getvalue()))
+    return out
+
+
+def _safe_name(text):
+    return "".join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(text)) or 'student'
+
+
+def _money(amount):
+    return f"Rs. {amount:,.2f}"
+
+
+def _header(c, top, title, printed):
+    width = c._pagesize[0]
+    c.setFont('Helvetica-Bold', 13)
+    c.drawCentredString(width / 2, top, SCHOOL_NAME)
+    c.setFont('Helvetica-Bold', 11)
+    c.drawCentredString(width / 2, top - 16, title)
+    c.setFont('Helvetica', 8)
+    c.drawRightString(width - 40, top - 16, f"Printed {printed}")
+    c.line(40, top - 24, width - 40, top - 24)
+    return top - 40
+
+
+def _fields(c, y, pairs):
+    # Two label/value pairs per line.
+    for i in range(0, len(pairs), 2):
+        for col, (label, value) in enumerate(pairs[i:i + 2]):
+            x = 40 + col * 260
+            c.setFont('Helvetica-Bold', 9)
+            c.drawString(x, y, f"{label}:")
+            c.setFont('Helvetica', 9)
+            c.drawString(x + 90, y, str(value if value not in (None, "") else "-")[:40])
+        y -= 14
+    return y
+
+
+def _table(c, y, columns, rows, bottom):
+    """Draw rows under a header; returns (y, rows that did not fit above `bottom`)."""
+    widths = [w for _, w in columns]
+    c.setFont('Helvetica-Bold', 9)
+    x = 40
+    for (title, width) in columns:
+        c.drawString(x + 3, y, title)
+        x += width
+    c.line(40, y - 4, 40 + sum(widths), y - 4)
+    y -= 16
+    c.setFont('Helvetica', 9)
+    for n, row in enumerate(rows):
+        if y < bottom:
+            return y, rows[n:]
+        x = 40
+        for value, width in zip(row, widths):
+            c.drawString(x + 3, y, str(value)[:int(width / 5)])
+            x += width
+        y -= 13
+    return y, []
+
+
+def _in_window(iso, start, end):
+    if start is None and end is None:
+        return True
+    return iso is not None and (start is None or iso >= start) and (end is None or iso <= end)
+
+
+def _draw_receipt(c, s, printed, start, end):
+    # Two copies of the receipt on one page, for the parent and the office.
+    height = c._pagesize[1]
+    listed = [h for h in s['history'] if _in_window(h[3], start, end)]
+    for copy, top in (("Parent copy", height - 40), ("Office copy", height / 2 - 20)):
+        y = _header(c, top, f"{KINDS['receipt']} ({copy})", printed)
+        y = _fields(c, y, [("Reg.No", s['id']), ("Name", s['name']),
+                           ("Father's Name", s['father_name']), (s['group_label'], s['group']),
+                           ("Monthly Fee", _money(s['monthly_fee'])), ("Contact", s['contact'])])
+        bottom = top - (height / 2 - 70)
+        y, rest = _table(c, y - 6, [("Month", 140), ("Date Paid", 120), ("Amount", 120)],
+                         [(month, paid, _money(amount)) for month, paid, amount, _, _ in listed], bottom + 28)
+        if rest:
+            c.setFont('Helvetica-Oblique', 8)
+            c.drawString(43, y, f"... and {len(rest)} more payment(s)")
+        c.setFont('Helvetica-Bold', 9)
+        c.drawString(40, bottom, f"Received: {_money(sum(h[2] for h in listed))}")
+        c.drawString(220, bottom, f"Outstanding dues: {_money(s['dues'])}")
+        c.setFont('Helvetica', 8)
+        c.drawRightString(c._pagesize[0] - 40, bottom, "Signature: ____________________")
+    c.setDash(3, 3)
+    c.line(20, height / 2, c._pagesize[0] - 20, height / 2)
+    c.setDash()
+
+
+def _draw_report(c, s, printed, start, end):
+    width, height = c._pagesize
+    y = _header(c, height - 40, KINDS['report'], printed)
+    y = _fields(c, y, [("Reg.No", s['id']), ("Name", s['name']),
+                       ("Father's Name", s['father_name']), ("Contact", s['contact']),
+                       (s['group_label'], s['group']), ("Admission Date", s['admission_date'])])
+    y -= 8
+    if s['picture']:  # beside the charges table
+        try:
+            c.drawImage(s['picture'], width - 130, y - 80, width=90, height=90,
+                        preserveAspectRatio=True, anchor='n')
+        except Exception:
+            pass  # a missing or unreadable picture is left out
+    charges = [("Monthly Fee", _money(s['monthly_fee']), "")] + \
+              [(label, _money(due), _money(paid)) for label, due, paid in s['charges']]
+    y, _ = _table(c, y, [("Charge", 160), ("Amount", 120), ("Paid", 120)], charges, 0)
+    c.setFont('Helvetica-Bold', 9)
+    y -= 4
+    c.drawString(40, y, f"Total expected: {_money(s['expected'])}")
+    c.drawString(220, y, f"Total paid: {_money(s['paid'])}")
+    c.drawString(400, y, f"Dues: {_money(s['dues'])}")
+    y -= 26
+    c.setFont('Helvetica-Bold', 11)
+    c.drawString(40, y, "Payment History")
+    rows = [(month, paid, _money(amount), remark) for month, paid, amount, _, remark in s['history']]
+    columns = [("Month", 110), ("Date Paid", 100), ("Amount", 100), ("Remarks", 205)]
+    y, rest = _table(c, y - 18, columns, rows, 50)
+    while rest:  # long histories continue on further pages
+        c.showPage()
+        y = _header(c, height - 40, f"{KINDS['report']} - {s['name']} (continued)", printed)
+        y, rest = _table(c, y, columns, rest, 50)
+
+
+# --- jobs (web process) ---------------------------------------------------------
+
+class PrintJob:
+    """One batch being rendered; read by the progress endpoint while the job thread fills it in."""
+
+    def __init__(self, job_id, kind, output, total, name):
+        self.id = job_id
+        self.kind, self.output, self.total, self.name = kind, output, total, name
+        self.done = 0
+        self.status = 'queued'  # queued, running, done, failed
+        self.error = None
+        self.data = None
+        self.started = time.monotonic()
+        self.took = None
+
+    @property
+    def filename(self):
+        return f"{self.name}.{self.output}"
+
+    def as_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'output': self.output, 'status': self.status,
+                'done': self.done, 'total': self.total, 'error': self.error,
+                'seconds': round(self.took if self.took is not None else time.monotonic() - self.started, 2)}
+
+
+class PrintQueue:
+    """Print jobs rendered on a shared process pool."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._lock = threading.Lock()
+        self._pool = None
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                import multiprocessing
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def start(self, sheets, kind, output='pdf', name=None, start=None, end=None):
+        """Queue `sheets` for printing; returns the PrintJob. start/end (dates) limit receipt payments."""
+        if kind not in KINDS or output not in OUTPUTS:
+            raise ValueError(f"Unknown print job: {kind} as {output}")
+        with self._lock:
+            job = PrintJob(str(next(self._ids)), kind, output, len(sheets), name or f"{kind}s")
+            self._jobs[job.id] = job
+            while len(self._jobs) > KEEP_JOBS:
+                self._jobs.popitem(last=False)
+        window = (start.isoformat() if start else None, end.isoformat() if end else None)
+        threading.Thread(target=self._run, args=(job, sheets, window), daemon=True,
+                         name=f"print-{job.id}").start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, sheets, window):
+        job.status = 'running'
+        try:
+            merged = job.output == 'pdf'
+            size = max(1, min(MAX_CHUNK, -(-len(sheets) // (self.workers * 4))))
+            chunks = [sheets[i:i + size] for i in range(0, len(sheets), size)]
+            pool = self._executor()
+            futures = [pool.submit(render_chunk, chunk, job.kind, *window, merged) for chunk in chunks]
+            parts = []
+            for chunk, future in zip(chunks, futures):  # in order, so the pages stay in roster order
+                parts.extend(future.result())
+                job.done += len(chunk)
+            job.data = _merge(parts) if merged else _zip(parts)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+            job.status = 'failed'
+        finally:
+            job.took = time.monotonic() - job.started
+
+
+def _merge(parts):
+    if len(parts) == 1:
+        return parts[0][1]
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for _, pdf in parts:
+        writer.append(BytesIO(pdf))
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _zip(parts):
+    out = BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as archive:  # PDFs are compressed already
+        for filename, pdf in parts:
+            archive.writestr(filename, pdf)
+    return out.getvalue()
@@ -0,0 +1,49 @@
+"""
+Every school page in one process: students and fees, transport, and payroll.
+
+app2.py, index.py and teachers.py still run on their own. Started from here,
+their pages share one in-memory copy of each workbook (see datastores.py),
+and the principal's dashboard at /dashboard shows their figures side by
+side. The transport pages are served under /transport, because their URLs
+(/, /add_student) are taken by the fee pages.
+"""
+from startup import timer  # first, so the startup report covers the other imports
+import threading
+
+import datastores
+from dashboard import create_app
+from app2 import fee_pages
+from index import transport_pages
+from teachers import payroll_pages
+
+app = create_app(fee_pages, payroll_pages)
+app.register_blueprint(transport_pages, url_prefix='/transport')
+timer.mark('app imported')
+
+
+def warm_up():
+    """Load every domain while the window is still opening."""
+    datastores.warm_up('students', 'comp', 'transport', 'payroll')
+    timer.mark('data loaded')
+
+
+def start_flask():
+    app.run(host='127.0.0.1', port=5000)
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()  # lets the packaged .exe start its print workers
+    import webview  # only the desktop window needs it
+
+    # Start Flask in a separate thread
+    flask_thread = threading.Thread(target=start_flask)
+    flask_thread.daemon = True
+    flask_thread.start()
+    # The home page needs no data, so it renders while everything loads in the background.
+    threading.Thread(target=warm_up, daemon=True).start()
+
+    # Create a webview window
+    webview.create_window('School Software', 'http://127.0.0.1:5000')
+    timer.mark('window created')
+    webview.start()
@@ -0,0 +1,142 @@
+"""
+In-memory search index for the student search boxes.
+
+The search on /students and /comp used to lower-case and substring-match
+every row on every request, and the "similar students" step compared the
+father's name and contact of the match against the whole roster again.
+SearchIndex subscribes to a roster store and keeps, per field, a map from
+every 1-, 2- and 3-character piece of the lower-cased value to the rows that
+contain it. A query of up to three characters is one dictionary lookup;
+longer queries intersect the posting sets of their trigrams and then confirm
+the substring on the few rows left, so results match the old scan exactly.
+Siblings are found through hash maps on the normalized father's name and
+contact number.
+"""
+import re
+import threading
+from collections import defaultdict
+
+GRAM_SIZE = 3
+
+
+def normalize_name(value):
+    return " ".join(str(value or "").lower().split())
+
+
+def normalize_contact(value):
+    # "0300-1234567", "0300 1234567" and "03001234567" are the same number.
+    return re.sub(r"\D", "", str(value or ""))
+
+
+def grams(text):
+    """Every substring of `text` up to GRAM_SIZE characters long."""
+    return {text[i:i + n] for n in range(1, GRAM_SIZE + 1) for i in range(len(text) - n + 1)}
+
+
+class SearchIndex:
+    """Substring search over a few text fields of a roster store."""
+
+    def __init__(self, store, fields=('id', 'name', 'father_name', 'contact')):
+        self.store = store
+        self.fields = tuple(fields)
+        self._lock = threading.RLock()
+        self._clear()
+        store.subscribe(self)
+
+    def _clear(self):
+        # Rows get a serial number in sheet order; results are returned in that order.
+        self._records = {}
+        self._next_row = 0
+        self._rows_by_id = defaultdict(list)
+        self._postings = {field: defaultdict(set) for field in self.fields}
+        self._by_father = defaultdict(set)
+        self._by_contact = defaultdict(set)
+
+    # --- store listener ------------------------------------------------------
+
+    def reset(self, records):
+        with self._lock:
+            self._clear()
+            for record in records:
+                self._add(record)
+
+    def change(self, old, new):
+        with self._lock:
+            row = self._remove(old) if old is not None else None
+            if new is not None:
+                self._add(new, row)
+
+    def _add(self, record, row=None):
+        if row is None:
+            row = self._next_row
+            self._next_row += 1
+        self._records[row] = record
+        self._rows_by_id[record.id].append(row)
+        self._rows_by_id[record.id].sort()
+        for field in self.fields:
+            for gram in grams(str(getattr(record, field) or "").lower()):
+                self._postings[field][gram].add(row)
+        father, contact = normalize_name(record.father_name), normalize_contact(record.contact)
+        if father:
+            self._by_father[father].add(row)
+        if contact:
+            self._by_contact[contact].add(row)
+
+    def _remove(self, record):
+        # The store edits the first row with a given ID; keep its serial so the order is unchanged.
+        rows = self._rows_by_id.get(record.id)
+        if not rows:
+            return None
+        row = rows.pop(0)
+        if not rows:
+            del self._rows_by_id[record.id]
+        old = self._records.pop(row)
+        for field in self.fields:
+            postings = self._postings[field]
+            for gram in grams(str(getattr(old, field) or "").lower()):
+                postings[gram].discard(row)
+                if not postings[gram]:
+                    del postings[gram]
+        for table, key in ((self._by_father, normalize_name(old.father_name)),
+                           (self._by_contact, normalize_contact(old.contact))):
+            if key:
+                table[key].discard(row)
+                if not table[key]:
+                    del table[key]
+        return row
+
+    # --- queries -------------------------------------------------------------
+
+    def _matching_rows(self, field, query):
+        postings = self._postings[field]
+        if len(query) <= GRAM_SIZE:
+            return postings.get(query, set())
+        pieces = sorted((postings.get(query[i:i + GRAM_SIZE], set())
+                         for i in range(len(query) - GRAM_SIZE + 1)), key=len)
+        candidates = set.intersection(*pieces)
+        return {row for row in candidates
+                if query in str(getattr(self._records[row], field) or "").lower()}
+
+    def search(self, query, fields=None):
+        """Records whose `fields` (default: all indexed fields) contain `query`, case-insensitively."""
+        query = query.lower().strip()
+        if not query:
+            return []
+        self.store.refresh()
+        with self._lock:
+            rows = set()
+            for field in fields or self.fields:
+                rows |= self._matching_rows(field, query)
+            return [self._records[row] for row in sorted(rows)]
+
+    def siblings(self, record):
+        """Other students with the same father's name or contact number as `record`."""
+        self.store.refresh()
+        with self._lock:
+            rows = set()
+            father, contact = normalize_name(record.father_name), normalize_contact(record.contact)
+            if father:
+                rows |= self._by_father.get(father, set())
+            if contact:
+                rows |= self._by_contact.get(contact, set())
+            return [self._records[row] for row in sorted(rows) if self._records[row].id != record.id]
@@ -0,0 +1,325 @@
+"""
+SQLite engine for the school rosters, selected with SCHOOL_STORAGE=sqlite.
+
+SqliteStore has the same interface as store.WorkbookStore, so app2.py does not
+care which one it talks to. Each roster gets its own table with indexes on ID,
+the lookup fields (grade, father name, ...), dues and admission date. The
+"Months Paid" / "Paid Dates" strings are normalized into a <table>_payments
+table with one row per paid month.
+
+Data can be moved in and out of Excel from the command line:
+
+    python sqlite_store.py import data/students.xlsx
+    python sqlite_store.py export data/students.xlsx students_export.xlsx
+"""
+import argparse
+import os
+import sqlite3
+import threading
+
+from store import (WorkbookStore, build_record, save_workbook_atomic, normalize_key, BATCH_RESET_SIZE,
+                   Student, STUDENT_HEADERS, STUDENT_NUMERIC_FIELDS,
+                   CompStudent, COMP_HEADERS, COMP_NUMERIC_FIELDS)
+
+# Fields that are stored in the payments table instead of the roster table.
+PAYMENT_FIELDS = ('months_paid', 'paid_dates')
+
+# Always indexed when the record type has them, for range filters and sorting.
+RANGE_FIELDS = ('dues', 'admission_date')
+
+
+def split_list(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+class SqliteStore:
+    """A roster table (plus its payments table) in a SQLite database."""
+
+    def __init__(self, db_path, table, record_type, headers, numeric_fields=(), index_fields=()):
+        self.db_path = db_path
+        self.table = table
+        self.payments_table = f"{table}_payments"
+        self.record_type = record_type
+        self.headers = list(headers)
+        self.numeric_fields = set(numeric_fields)
+        self.index_fields = tuple(index_fields)
+        self.columns = [f for f in record_type._fields if f not in PAYMENT_FIELDS]
+        self._local = threading.local()
+        # Writes commit and notify listeners one at a time, so the derived indexes see them in commit order.
+        # Reads do not take it; WAL gives each one a consistent snapshot.
+        self._write_lock = threading.RLock()
+        self._listeners = []
+        self._create_schema()
+
+    # --- connection and schema --------------------------------------------
+
+    def _conn(self):
+        # One connection per thread; Flask's dev server handles each request in its own thread.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        column_defs = ", ".join(
+            f"{c} REAL NOT NULL DEFAULT 0" if c in self.numeric_fields else f"{c} TEXT NOT NULL DEFAULT ''"
+            for c in self.columns
+        )
+        conn = self._conn()
+        with conn:
+            # Which tables have had their workbook imported (key 'imported:<table>', value the workbook path).
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (pk INTEGER PRIMARY KEY, {column_defs})")
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS {self.payments_table} (
+                student_pk INTEGER NOT NULL REFERENCES {self.table}(pk) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                month TEXT NOT NULL DEFAULT '',
+                paid_date TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (student_pk, position))""")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.payments_table}_date "
+                         f"ON {self.payments_table}(paid_date)")
+            # get() matches IDs exactly; lookup() on text fields is case-insensitive.
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_id ON {self.table}(id)")
+            for field in self.index_fields:
+                if field in self.columns and field not in self.numeric_fields:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_{field}_nocase "
+                                 f"ON {self.table}({field} COLLATE NOCASE)")
+            for field in RANGE_FIELDS:
+                if field in self.columns:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_{field} "
+                                 f"ON {self.table}({field})")
+
+    # --- row <-> record ----------------------------------------------------
+
+    def _select(self, where="", params=()):
+        conn = self._conn()
+        rows = conn.execute(f"SELECT pk, {', '.join(self.columns)} FROM {self.table} {where} ORDER BY pk",
+                            params).fetchall()
+        if not rows:
+            return []
+        payments = {}
+        pks = [row[0] for row in rows]
+        # Chunked to stay under SQLite's bound-parameter limit.
+        for i in range(0, len(pks), 500):
+            chunk = pks[i:i + 500]
+            for student_pk, month, paid_date in conn.execute(
+                    f"SELECT student_pk, month, paid_date FROM {self.payments_table} "
+                    f"WHERE student_pk IN ({','.join('?' * len(chunk))}) ORDER BY student_pk, position", chunk):
+                months, dates = payments.setdefault(student_pk, ([], []))
+                if month:
+                    months.append(month)
+                if paid_date:
+                    dates.append(paid_date)
+        records = []
+        for row in rows:
+            values = dict(zip(self.columns, row[1:]))
+            months, dates = payments.get(row[0], ([], []))
+            values['months_paid'] = ", ".join(months)
+            values['paid_dates'] = ", ".join(dates)
+            records.append(self.record_type(**values))
+        return records
+
+    def _insert(self, conn, record):
+        cur = conn.execute(
+            f"INSERT INTO {self.table} ({', '.join(self.columns)}) VALUES ({', '.join('?' * len(self.columns))})",
+            [getattr(record, c) for c in self.columns])
+        self._insert_payments(conn, cur.lastrowid, record)
+
+    def _insert_payments(self, conn, pk, record):
+        months = split_list(record.months_paid)
+        dates = split_list(record.paid_dates)
+        rows = [
+            (pk, i, months[i] if i < len(months) else '', dates[i] if i < len(dates) else '')
+            for i in range(max(len(months), len(dates)))
+        ]
+        conn.executemany(f"INSERT INTO {self.payments_table} (student_pk, position, month, paid_date) "
+                         f"VALUES (?, ?, ?, ?)", rows)
+
+    def _first_pk(self, conn, record_id):
+        row = conn.execute(f"SELECT min(pk) FROM {self.table} WHERE id = ?", (record_id,)).fetchone()
+        return row[0] if row else None
+
+    # --- reads (same interface as WorkbookStore) ----------------------------
+
+    def refresh(self):
+        pass  # every read goes to the database
+
+    def all(self):
+        return self._select()
+
+    def count(self):
+        return self._conn().execute(f"SELECT count(*) FROM {self.table}").fetchone()[0]
+
+    def get(self, record_id):
+        records = self._select("WHERE pk = (SELECT min(pk) FROM {} WHERE id = ?)".format(self.table),
+                               (str(record_id).strip(),))
+        return records[0] if records else None
+
+    def lookup(self, field, value):
+        key = normalize_key(value)
+        if not key:
+            return []
+        return self._select(f"WHERE {field} = ? COLLATE NOCASE", (key,))
+
+    def keys(self, field):
+        rows = self._conn().execute(
+            f"SELECT DISTINCT lower({field}) FROM {self.table} WHERE {field} != ''").fetchall()
+        return [row[0] for row in rows]
+
+    def subscribe(self, listener):
+        """Same contract as WorkbookStore.subscribe()."""
+        self._listeners.append(listener)
+        listener.reset(self.all())
+
+    def _notify(self, old, new):
+        for listener in self._listeners:
+            listener.change(old, new)
+
+    # --- writes ------------------------------------------------------------
+
+    def make_record(self, **fields):
+        return build_record(self.record_type, self.numeric_fields,
+                            [fields.get(f) for f in self.record_type._fields])
+
+    def add(self, record):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._insert(conn, record)
+            self._notify(None, record)
+
+    def update(self, record):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                pk = self._first_pk(conn, record.id)
+                if pk is None:
+                    raise KeyError(record.id)
+                old = self.get(record.id)
+                conn.execute(f"UPDATE {self.table} SET {', '.join(c + ' = ?' for c in self.columns)} WHERE pk = ?",
+                             [getattr(record, c) for c in self.columns] + [pk])
+                conn.execute(f"DELETE FROM {self.payments_table} WHERE student_pk = ?", (pk,))
+                self._insert_payments(conn, pk, record)
+            self._notify(old, record)
+
+    def write_batch(self, adds=(), updates=()):
+        """Same contract as WorkbookStore.write_batch(): one transaction for the lot."""
+        changes = []
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for record in adds:
+                    self._insert(conn, record)
+                    changes.append((None, record))
+                for record in updates:
+                    pk = self._first_pk(conn, record.id)
+                    if pk is None:
+                        raise KeyError(record.id)
+                    changes.append((self.get(record.id), record))
+                    conn.execute(f"UPDATE {self.table} SET {', '.join(c + ' = ?' for c in self.columns)} "
+                                 f"WHERE pk = ?", [getattr(record, c) for c in self.columns] + [pk])
+                    conn.execute(f"DELETE FROM {self.payments_table} WHERE student_pk = ?", (pk,))
+                    self._insert_payments(conn, pk, record)
+            if len(changes) > BATCH_RESET_SIZE:
+                records = self.all()
+                for listener in self._listeners:
+                    listener.reset(records)
+            else:
+                for old, new in changes:
+                    self._notify(old, new)
+        return len(changes)
+
+    def delete(self, record_id):
+        with self._write_lock:
+            old = self.get(record_id)
+            if old is None:
+                raise KeyError(record_id)
+            conn = self._conn()
+            with conn:
+                conn.execute(f"DELETE FROM {self.table} WHERE pk = ?", (self._first_pk(conn, old.id),))
+            self._notify(old, None)
+            return old
+
+    def flush(self):
+        pass  # commits are immediate
+
+    # --- Excel import / export ---------------------------------------------
+
+    def import_workbook(self, xlsx_path):
+        """Replace the table with the rows of `xlsx_path` (journaled edits included)."""
+        records = WorkbookStore(xlsx_path, self.record_type, self.headers,
+                                self.numeric_fields).all()
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"DELETE FROM {self.table}")
+                for record in records:
+                    self._insert(conn, record)
+                self._mark_imported(conn, xlsx_path)
+            for listener in self._listeners:
+                listener.reset(records)
+        return len(records)
+
+    def imported(self):
+        """Whether a workbook was ever imported into this table (or it was marked as such)."""
+        row = self._conn().execute("SELECT 1 FROM meta WHERE key = ?", (f"imported:{self.table}",)).fetchone()
+        return row is not None
+
+    def mark_imported(self, xlsx_path):
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._mark_imported(conn, xlsx_path)
+
+    def _mark_imported(self, conn, xlsx_path):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"imported:{self.table}", xlsx_path))
+
+    def export_workbook(self, xlsx_path):
+        """Write the table out as an Excel workbook staff can open."""
+        records = self.all()
+        save_workbook_atomic(xlsx_path, self.headers, records)
+        return len(records)
+
+
+# Same layout and lookup fields app2.py opens the rosters with.
+ROSTERS = {
+    'students': (Student, STUDENT_HEADERS, STUDENT_NUMERIC_FIELDS, ('id', 'grade', 'father_name', 'contact')),
+    'comp': (CompStudent, COMP_HEADERS, COMP_NUMERIC_FIELDS, ('id', 'course', 'father_name', 'contact')),
+}
+
+
+def _store_for(xlsx_path):
+    table = os.path.splitext(os.path.basename(xlsx_path))[0]
+    if table not in ROSTERS:
+        raise SystemExit(f"Don't know how to map {xlsx_path}; expected one of: "
+                         + ", ".join(f"{t}.xlsx" for t in ROSTERS))
+    record_type, headers, numeric_fields, index_fields = ROSTERS[table]
+    db_path = os.path.join(os.path.dirname(xlsx_path) or ".", "school.db")
+    return SqliteStore(db_path, table, record_type, headers, numeric_fields, index_fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move school rosters between Excel and SQLite.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="load an .xlsx roster into school.db (replaces the table)")
+    p_import.add_argument('xlsx')
+    p_export = sub.add_parser('export', help="write a roster from school.db to an .xlsx file")
+    p_export.add_argument('xlsx', help="roster the table was imported from, e.g. data/students.xlsx")
+    p_export.add_argument('output')
+    args = parser.parse_args()
+
+    store = _store_for(args.xlsx)
+    if args.command == 'import':
+        print(f"Imported {store.import_workbook(args.xlsx)} rows into {store.db_path}:{store.table}")
+    else:
+        print(f"Exported {store.export_workbook(args.output)} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
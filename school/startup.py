@@ -0,0 +1,73 @@
+"""
+Startup timing for the desktop apps.
+
+Each app imports this module first and marks the steps of its start (imports
+done, data loaded, first page served). The report is printed when
+SCHOOL_STARTUP_REPORT=1 is set and served as JSON at /api/startup.
+
+Times are seconds since the process was created when psutil is installed
+(which includes the PyInstaller bootloader and interpreter start), otherwise
+since this module was imported.
+"""
+import os
+import threading
+import time
+
+_imported_at = time.time()
+_imported_perf = time.perf_counter()
+
+
+def _process_start():
+    try:
+        import psutil
+        return psutil.Process().create_time()
+    except Exception:  # psutil is optional
+        return None
+
+
+class StartupTimer:
+    """Named checkpoints of one start, in seconds from launch."""
+
+    def __init__(self):
+        created = _process_start()
+        # Offset of this module's import from the process start, when known.
+        self.origin = 'process' if created is not None else 'import'
+        self._offset = max(0.0, _imported_at - created) if created is not None else 0.0
+        self._marks = []
+        self._lock = threading.Lock()
+        self._first_response_seen = False
+
+    def now(self):
+        return self._offset + time.perf_counter() - _imported_perf
+
+    def mark(self, label):
+        with self._lock:
+            if all(name != label for name, _ in self._marks):
+                self._marks.append((label, round(self.now(), 4)))
+
+    def report(self):
+        with self._lock:
+            marks = list(self._marks)
+        steps, previous = [], 0.0
+        for label, at in marks:
+            steps.append({'step': label, 'at': at, 'took': round(at - previous, 4)})
+            previous = at
+        return {'measured_from': self.origin, 'steps': steps}
+
+    def print_report(self):
+        if os.environ.get('SCHOOL_STARTUP_REPORT', '').strip() not in ('', '0'):
+            lines = [f"  {s['at']:7.3f}s  (+{s['took']:.3f}s)  {s['step']}" for s in self.report()['steps']]
+            print(f"Startup timing (seconds since {self.origin}):\n" + "\n".join(lines))
+
+    def watch(self, app):
+        """Mark the first response `app` sends and print the report then."""
+        @app.after_request
+        def _first_response(response):
+            if not self._first_response_seen:
+                self._first_response_seen = True
+                self.mark('first response')
+                self.print_report()
+            return response
+
+
+timer = StartupTimer()
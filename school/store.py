@@ -0,0 +1,528 @@
+"""
+In-memory, indexed views of the school's Excel workbooks.
+
+The Flask routes used to call openpyxl.load_workbook() and walk every row on
+every request. A WorkbookStore parses the sheet once, keeps one typed record
+per ID (plus a few secondary indexes) and only re-reads the file when its
+modification time or size changes, e.g. after someone edits it in Excel.
+
+Edits are write-behind: each one is appended to a small JSON-lines journal
+next to the workbook (<file>.xlsx.journal) and applied in memory right away.
+The journal is merged into the workbook in batches by the process's storage
+writer thread (see coordinator.py), writing a temporary file and renaming it
+over the original, so a crash mid-save never leaves a half-written .xlsx
+behind. Any journal left over from a crash is replayed the next time the
+workbook is loaded.
+
+Readers get a snapshot: the record list is republished as a tuple after each
+edit (a batch counts as one edit), and reads neither take the store lock nor
+wait for a save in progress.
+
+Parsing a large workbook with openpyxl takes seconds on a slow PC, so after
+the workbook is read or saved its rows are also pickled to <file>.xlsx.snapshot
+together with the workbook's mtime and size. The next start loads the pickle
+instead when both still match. Nothing is loaded until the first read.
+"""
+import json
+import os
+import pickle
+import threading
+from collections import namedtuple, defaultdict
+from datetime import datetime, date
+
+from coordinator import coordinator
+
+# Bump when the snapshot layout changes; older snapshots are then ignored.
+SNAPSHOT_VERSION = 1
+
+
+# Column order of students.xlsx (see initialize_excel_file in app2.py).
+STUDENT_HEADERS = [
+    "ID", "Name", "Father Name", "Contact Number", "Grade", "Monthly Fee", "Months Paid",
+    "Paid Fee", "Dues", "Paid Dates", "Annual Charge", "Paid Annual Charge", "Admission Fee",
+    "Paid Admission Fee", "Admission Date", "Exam Charge", "Paid Exam Charge", "Remarks", "Picture"
+]
+
+# A namedtuple keeps the positional access (student[0], student[8], ...) the
+# templates already rely on, while the routes can use the field names.
+Student = namedtuple('Student', [
+    'id', 'name', 'father_name', 'contact', 'grade', 'monthly_fee', 'months_paid',
+    'paid_fee', 'dues', 'paid_dates', 'annual_charge', 'paid_annual_charge', 'admission_fee',
+    'paid_admission_fee', 'admission_date', 'exam_charge', 'paid_exam_charge', 'remarks', 'picture'
+])
+
+STUDENT_NUMERIC_FIELDS = {
+    'monthly_fee', 'paid_fee', 'dues', 'annual_charge', 'paid_annual_charge',
+    'admission_fee', 'paid_admission_fee', 'exam_charge', 'paid_exam_charge'
+}
+
+# Column order of comp.xlsx (computer academy).
+COMP_HEADERS = [
+    "ID", "Name", "Father Name", "Contact Number", "Course", "Monthly Fee", "Months Paid",
+    "Paid Fee", "Dues", "Paid Dates", "Admission Fee", "Paid Admission Fee", "Admission Date", "Remarks", "Picture"
+]
+
+CompStudent = namedtuple('CompStudent', [
+    'id', 'name', 'father_name', 'contact', 'course', 'monthly_fee', 'months_paid',
+    'paid_fee', 'dues', 'paid_dates', 'admission_fee', 'paid_admission_fee', 'admission_date',
+    'remarks', 'picture'
+])
+
+COMP_NUMERIC_FIELDS = {'monthly_fee', 'paid_fee', 'dues', 'admission_fee', 'paid_admission_fee'}
+
+# Batches that change more records than this rebuild the listeners' indexes
+# with reset() instead of sending one change() per record.
+BATCH_RESET_SIZE = 200
+
+
+def normalize_key(value):
+    """Key used by the secondary indexes: trimmed and case-insensitive."""
+    return str(value if value is not None else '').strip().lower()
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return 0
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0
+    # Whole numbers stay ints, as openpyxl reads them back from the sheet, so
+    # the pages keep showing "1500" rather than "1500.0".
+    return int(number) if number.is_integer() else number
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # IDs and phone numbers typed into Excel come back as floats.
+        return str(int(value))
+    return str(value).strip()
+
+
+def build_record(record_type, numeric_fields, values):
+    """Typed record from raw cell values: numbers as float, everything else as text."""
+    values = list(values)[:len(record_type._fields)]
+    values += [None] * (len(record_type._fields) - len(values))
+    return record_type(*[
+        _to_number(v) if field in numeric_fields else _to_text(v)
+        for field, v in zip(record_type._fields, values)
+    ])
+
+
+class WorkbookStore:
+    """Process-wide cache of one worksheet, keyed by the first column (ID)."""
+
+    def __init__(self, path, record_type, headers, numeric_fields=(), index_fields=(), flush_delay=2.0):
+        self.path = path
+        self.record_type = record_type
+        self.headers = list(headers)
+        self.numeric_fields = set(numeric_fields)
+        self.index_fields = tuple(index_fields)
+        self.flush_delay = flush_delay
+        self.journal_path = path + ".journal"
+        self.snapshot_path = path + ".snapshot"
+        # Journal entries taken by an in-progress (or failed) flush.
+        self._pending_path = path + ".journal.flushing"
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._listeners = []
+        self._signature = None
+        self._records = []
+        self._snapshot = ()  # self._records as of the last finished edit, for readers
+        self._loaded = False
+        self._by_id = {}
+        self._indexes = {}
+
+    # --- loading -----------------------------------------------------------
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _make_record(self, values):
+        return build_record(self.record_type, self.numeric_fields, values)
+
+    def _load(self):
+        signature = self._file_signature()
+        records = []
+        if signature is not None:
+            records = self._read_snapshot(signature)
+            if records is None:
+                records = self._read_workbook()
+                coordinator.submit(self._write_snapshot, signature, records)
+        self._records = list(records)
+        self._rebuild_indexes()
+        # Edits that were journaled but not yet merged into the workbook.
+        replayed = False
+        for journal in (self._pending_path, self.journal_path):
+            entries = self._read_journal(journal)
+            replayed = replayed or bool(entries)
+            if journal == self._pending_path:
+                entries = self._unmerged(entries, signature)
+            for entry in entries:
+                for item in self._expand(entry):
+                    self._apply(item)
+        self._snapshot = tuple(self._records)
+        self._signature = signature  # last, so lock-free readers wait for the load to finish
+        self._loaded = True
+        if replayed:
+            self._schedule_flush()
+        for listener in self._listeners:
+            listener.reset(list(self._records))
+
+    def subscribe(self, listener):
+        """Keep a derived index in sync with the records.
+
+        `listener.reset(records)` is called now and after every reload, and
+        `listener.change(old, new)` after each edit (old or new is None for
+        an add or a delete).
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._loaded:
+                listener.reset(list(self._records))
+            # Otherwise the first read loads the sheet and resets every listener.
+
+    def _read_workbook(self):
+        import openpyxl  # only needed when there is no usable snapshot
+        records = []
+        wb = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(min_row=2, values_only=True):
+                if not any(v not in (None, '') for v in row):
+                    continue  # skip blank rows left behind by Excel
+                records.append(self._make_record(row))
+        finally:
+            wb.close()
+        return records
+
+    def _read_snapshot(self, signature):
+        """The records pickled for the workbook as it is now, or None."""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+            return None
+        if (not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION or
+                snapshot.get('signature') != list(signature) or snapshot.get('headers') != self.headers):
+            return None
+        make = self.record_type._make
+        return [make(row) for row in snapshot['rows']]
+
+    def _write_snapshot(self, signature, records):
+        """Pickle `records`, which must be exactly what the workbook with `signature` holds."""
+        snapshot = {'version': SNAPSHOT_VERSION, 'signature': list(signature), 'headers': self.headers,
+                    'rows': [tuple(record) for record in records]}
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"Could not write {self.snapshot_path}: {e}")
+
+    def _rebuild_indexes(self):
+        # Built aside and swapped in, so readers never see a half-filled index.
+        by_id = {}
+        indexes = {field: defaultdict(list) for field in self.index_fields}
+        for record in self._records:
+            by_id.setdefault(record.id, record)
+            self._index_record(record, indexes)
+        self._by_id, self._indexes = by_id, indexes
+
+    def _index_record(self, record, indexes=None):
+        indexes = self._indexes if indexes is None else indexes
+        for field in self.index_fields:
+            key = normalize_key(getattr(record, field))
+            if key:
+                indexes[field][key].append(record.id)
+
+    def _unindex_record(self, record):
+        for field in self.index_fields:
+            key = normalize_key(getattr(record, field))
+            ids = self._indexes[field].get(key)
+            if ids and record.id in ids:
+                ids.remove(record.id)
+                if not ids:
+                    del self._indexes[field][key]
+
+    def refresh(self):
+        """Reload the sheet if the file changed since it was last read."""
+        if self._signature is not None and self._signature == self._file_signature():
+            return
+        with self._lock:
+            if self._signature is None or self._signature != self._file_signature():
+                self._load()
+
+    # --- reads -------------------------------------------------------------
+
+    def all(self):
+        self.refresh()
+        return list(self._snapshot)
+
+    def count(self):
+        self.refresh()
+        return len(self._snapshot)
+
+    def get(self, record_id):
+        self.refresh()
+        return self._by_id.get(str(record_id).strip())
+
+    def lookup(self, field, value):
+        """Records whose `field` matches `value` (case-insensitive), via the index."""
+        self.refresh()
+        ids = self._indexes[field].get(normalize_key(value), [])
+        return [self._by_id[i] for i in ids if i in self._by_id]
+
+    def keys(self, field):
+        """Distinct (normalized) values of an indexed field."""
+        self.refresh()
+        return list(self._indexes[field].keys())
+
+
+    def export_workbook(self, xlsx_path):
+        """Write the current records (journaled edits included) to another workbook."""
+        records = self.all()
+        save_workbook_atomic(xlsx_path, self.headers, records)
+        return len(records)
+
+    # --- writes ------------------------------------------------------------
+
+    def make_record(self, **fields):
+        """Build a typed record; missing fields default to '' or 0."""
+        return self._make_record([fields.get(f) for f in self.record_type._fields])
+
+    def add(self, record):
+        self._write({'op': 'add', 'record': list(record)})
+
+    def update(self, record):
+        if self.get(record.id) is None:
+            raise KeyError(record.id)
+        self._write({'op': 'put', 'record': list(record)})
+
+    def delete(self, record_id):
+        old = self.get(record_id)
+        if old is None:
+            raise KeyError(record_id)
+        self._write({'op': 'delete', 'id': old.id})
+        return old
+
+    def write_batch(self, adds=(), updates=()):
+        """Add and update many records with a single journal entry.
+
+        The batch is one journal line, so after a crash it is replayed either
+        completely or not at all. Raises KeyError (and writes nothing) if an
+        update is for an ID that does not exist.
+        """
+        with self._lock:
+            self.refresh()
+            for record in updates:
+                if record.id not in self._by_id:
+                    raise KeyError(record.id)
+            entries = ([{'op': 'add', 'record': list(r)} for r in adds] +
+                       [{'op': 'put', 'record': list(r)} for r in updates])
+            if entries:
+                self._write({'op': 'batch', 'entries': entries})
+        return len(entries)
+
+    def _write(self, entry):
+        with self._lock:
+            self.refresh()
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            items = self._expand(entry)
+            # Row positions for the batch, so each 'put' does not search the list.
+            positions = {id(r): i for i, r in enumerate(self._records)} if len(items) > 1 else None
+            changes = [c for c in (self._apply(item, positions) for item in items) if c != (None, None)]
+            if len(changes) > BATCH_RESET_SIZE:
+                # Rebuilding the derived indexes once beats thousands of single updates.
+                records = list(self._records)
+                for listener in self._listeners:
+                    listener.reset(records)
+            else:
+                for old, new in changes:
+                    for listener in self._listeners:
+                        listener.change(old, new)
+            self._snapshot = tuple(self._records)
+        self._schedule_flush()
+
+    @staticmethod
+    def _expand(entry):
+        return entry['entries'] if entry.get('op') == 'batch' else [entry]
+
+    def _apply(self, entry, positions=None):
+        """Apply one journal entry to the in-memory records.
+
+        Entries a finished flush already saved are dropped by _unmerged() before a replay.
+
+        Returns the (old, new) pair of records that changed, (None, None) if nothing did.
+        `positions` (id(record) -> index in self._records) is kept up to date when given.
+        """
+        op = entry.get('op')
+        if op == 'delete':
+            old = self._by_id.get(entry['id'])
+            if old is not None:
+                self._records.remove(old)
+                self._rebuild_indexes()
+            return old, None
+        record = self._make_record(entry['record'])
+        old = self._by_id.get(record.id)
+        if op == 'add':
+            if old == record:
+                return None, None  # already merged into the workbook before a crash
+            if positions is not None:
+                positions[id(record)] = len(self._records)
+            self._records.append(record)
+            self._by_id.setdefault(record.id, record)
+            self._index_record(record)
+            return None, record
+        if op == 'put' and old is not None:
+            i = positions.pop(id(old)) if positions is not None else self._records.index(old)
+            self._records[i] = record
+            if positions is not None:
+                positions[id(record)] = i
+            self._by_id[record.id] = record
+            self._unindex_record(old)
+            self._index_record(record)
+            return old, record
+        return None, None
+
+    @staticmethod
+    def _unmerged(entries, signature):
+        """The pending entries the workbook with `signature` does not hold yet.
+
+        A flush appends a 'merged' line with the signature of the workbook it is
+        about to rename into place. If the workbook on disk has that signature,
+        the flush got as far as the rename, and the entries before the line are
+        already in it.
+        """
+        start = 0
+        for i, entry in enumerate(entries):
+            if entry.get('op') == 'merged' and signature is not None and entry.get('signature') == list(signature):
+                start = i + 1
+        return [entry for entry in entries[start:] if entry.get('op') != 'merged']
+
+    def _read_journal(self, journal):
+        if not os.path.exists(journal):
+            return []
+        entries = []
+        with open(journal, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line from a crash mid-append
+        return entries
+
+    # --- background flushing -----------------------------------------------
+
+    def _schedule_flush(self):
+        coordinator.submit(self._background_flush, key=('flush', self.path), delay=self.flush_delay)
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Could not save {self.path}, will retry: {e}")
+            self._schedule_flush()
+            raise
+
+    def _take_journal(self):
+        """Move the live journal into the pending file the flush is about to merge."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as src, open(self._pending_path, 'ab') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(self.journal_path)
+
+    def _mark_merged(self, tmp_path):
+        # The commit point of a flush. The rename keeps the file's mtime and size, so after a
+        # crash _unmerged() can tell whether the pending entries reached the workbook.
+        st = os.stat(tmp_path)
+        with open(self._pending_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'merged', 'signature': [st.st_mtime_ns, st.st_size]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def flush(self):
+        """Merge all journaled edits into the workbook with one atomic save."""
+        with self._flush_lock:
+            with self._lock:
+                self.refresh()  # picks up edits made in Excel meanwhile
+                self._take_journal()
+                if not os.path.exists(self._pending_path):
+                    return
+                records = list(self._records)
+            # The workbook is written outside the lock, so pages keep reading the cache.
+            # Only the rename happens under it, so no reader reloads a half-saved file.
+            tmp_path = write_temp_workbook(self.path, self.headers, records)
+            with self._lock:
+                self._mark_merged(tmp_path)
+                os.replace(tmp_path, self.path)
+                self._signature = self._file_signature()
+                os.remove(self._pending_path)
+                signature = self._signature
+            self._write_snapshot(signature, records)
+
+
+def save_workbook_atomic(path, headers, records):
+    """Write `records` under `headers` to a temp file, then rename it over `path`."""
+    os.replace(write_temp_workbook(path, headers, records), path)
+
+
+def write_temp_workbook(path, headers, records):
+    """Write what `path` should contain to <path>.tmp and return that name.
+
+    An existing workbook is used as the template, so its formatting survives.
+    """
+    import openpyxl  # imported on first save, not at startup
+    if os.path.exists(path):
+        wb = openpyxl.load_workbook(path)
+        ws = wb.active
+        if ws.max_row > 1:
+            ws.delete_rows(2, ws.max_row - 1)
+    else:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(headers)
+    for record in records:
+        ws.append(list(record))
+    tmp_path = path + ".tmp"
+    wb.save(tmp_path)
+    return tmp_path
+
+
+def open_store(backend, path, record_type, headers, numeric_fields=(), index_fields=()):
+    """Open the roster stored in `path` with the configured backend ('xlsx' or 'sqlite').
+
+    With 'sqlite' the records live in school.db next to the workbook; the
+    workbook is imported once, the first time the table is opened. The
+    workbook is never written back, so an emptied table stays empty.
+    """
+    if backend == 'sqlite':
+        from sqlite_store import SqliteStore
+        table = os.path.splitext(os.path.basename(path))[0]
+        store = SqliteStore(os.path.join(os.path.dirname(path), "school.db"), table,
+                            record_type, headers, numeric_fields, index_fields)
+        if not store.imported():
+            if store.count() == 0 and os.path.exists(path):
+                store.import_workbook(path)
+            else:
+                store.mark_imported(path)  # databases filled before the import was recorded
+        return store
+    if backend != 'xlsx':
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return WorkbookStore(path, record_type, headers, numeric_fields, index_fields)
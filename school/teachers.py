@@ -1,105 +1,63 @@
-import os
-import openpyxl
+from startup import timer  # first, so the startup report covers the other imports
 import threading
-from flask import Flask, render_template, request, redirect, url_for
-import webview
-
-app = Flask(__name__)
-
-# Set directory and database file
-data_dir = "data"
-if not os.path.exists(data_dir):
-    os.makedirs(data_dir)
-
-DATABASE = os.path.join(data_dir, "school_data.xlsx")
-
-# Initialize Excel file if it does not exist
-if not os.path.exists(DATABASE):
-    workbook = openpyxl.Workbook()
-    # Teachers sheet with extra fields: Qualification and Contact Number.
-    teachers_sheet = workbook.active
-    teachers_sheet.title = "Teachers"
-    teachers_sheet.append([
-        "Teacher Name", "Qualification", "Contact Number", "Joining Date", "Monthly Salary",
-        "January Deduction", "January Leaves", "January Paid", 
-        "February Deduction", "February Leaves", "February Paid", 
-        "March Deduction", "March Leaves", "March Paid", 
-        "April Deduction", "April Leaves", "April Paid", 
-        "May Deduction", "May Leaves", "May Paid", 
-        "June Deduction", "June Leaves", "June Paid", 
-        "July Deduction", "July Leaves", "July Paid", 
-        "August Deduction", "August Leaves", "August Paid", 
-        "September Deduction", "September Leaves", "September Paid", 
-        "October Deduction", "October Leaves", "October Paid", 
-        "November Deduction", "November Leaves", "November Paid", 
-        "December Deduction", "December Leaves", "December Paid"
-    ])
-
-    # Report sheet now also stores the teacher's qualification and contact number.
-    report_sheet = workbook.create_sheet("Report")
-    report_sheet.append([
-        "Teacher Name", "Qualification", "Contact Number", "Month", "Deductions", "Leaves", "Paid Salary"
-    ])
-    workbook.save(DATABASE)
-
-# Helper function for month column mapping with updated indices.
-# With the new teacher columns, the first 5 columns are reserved for:
-# 0: Teacher Name, 1: Qualification, 2: Contact Number, 3: Joining Date, 4: Monthly Salary.
-# So monthly details now start at index 5.
-def get_month_columns():
-    month_columns = {
-        "January":   (5, 6, 7),
-        "February":  (8, 9, 10),
-        "March":     (11, 12, 13),
-        "April":     (14, 15, 16),
-        "May":       (17, 18, 19),
-        "June":      (20, 21, 22),
-        "July":      (23, 24, 25),
-        "August":    (26, 27, 28),
-        "September": (29, 30, 31),
-        "October":   (32, 33, 34),
-        "November":  (35, 36, 37),
-        "December":  (38, 39, 40)
-    }
-    return month_columns
+from datetime import date
+from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify, Response
+import datastores
+from bulk import close_payroll_month, template_csv, BulkFileError
+from dashboard import create_app
+from ledger import MONTHS
+from payroll import Teacher, days_in_month, salary_for
+
+# Teacher and payroll pages; school_app.py serves them next to the fee and transport pages.
+payroll_pages = Blueprint('payroll', __name__)
+
+DATABASE = datastores.PAYROLL_FILE
+
+# Teachers and their month-by-month pay, kept in memory and shared with the dashboard; each edit
+# saves the workbook once. The file is created on first run, and the old one-row-per-teacher
+# layout is converted on first load.
+payroll = datastores.payroll_book()
+
+def selected_year():
+    # ?year= picks the payroll year to show; defaults to the current year.
+    return request.values.get('year', date.today().year, type=int)
 
 # Route to display all teachers and their yearly summary
-@app.route('/teachers')
+@payroll_pages.route('/teachers')
 def show_teachers():
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Teachers"]
+    year = selected_year()
     teachers = []
-    month_columns = get_month_columns()
 
-    for row in sheet.iter_rows(min_row=2, values_only=True):
+    for t in payroll.teachers():
+        deductions, leaves, paid = payroll.totals(t.name, year)
         teacher = {
-            "name": row[0],
-            "qualification": row[1],
-            "contact": row[2],
-            "joining_date": row[3],
-            "monthly_salary": row[4],
-            # For deductions and paid salary, we sum the values from the monthly details.
-            "deductions": sum(row[i] or 0 for i in range(5, 41, 3)),
-            "paid_salary": sum(row[i+2] or 0 for i in range(5, 41, 3)),
-            "total_salary": (row[4] or 0) * 12,
+            "name": t.name,
+            "qualification": t.qualification,
+            "contact": t.contact,
+            "joining_date": t.joining_date,
+            "monthly_salary": t.monthly_salary,
+            # Yearly deductions and paid salary come from the payroll rollups.
+            "deductions": deductions,
+            "paid_salary": paid,
+            "total_salary": (t.monthly_salary or 0) * 12,
             "months": []
         }
         
         # Add month-wise deduction, leaves, and paid salary details.
-        for month, (deduction_col, leaves_col, paid_col) in month_columns.items():
+        for entry in payroll.year_months(t.name, year):
             teacher["months"].append({
-                "month": month,
-                "deduction": row[deduction_col] or 0,
-                "leaves": row[leaves_col] or 0,
-                "paid": row[paid_col] or 0
+                "month": MONTHS[entry.month - 1],
+                "deduction": entry.deduction,
+                "leaves": entry.leaves,
+                "paid": entry.paid
             })
 
         teachers.append(teacher)
 
-    return render_template("teachers.html", teachers=teachers, months=list(month_columns.keys()))
+    return render_template("teachers.html", teachers=teachers, months=MONTHS, year=year, years=payroll.years())
 
 # Route to add a new teacher (now including qualification and contact number)
-@app.route('/teachers/add', methods=['GET', 'POST'])
+@payroll_pages.route('/teachers/add', methods=['GET', 'POST'])
 def add_teacher():
     if request.method == 'POST':
         name = request.form['name']
@@ -108,163 +66,132 @@ def add_teacher():
         joining_date = request.form['joining_date']
         monthly_salary = float(request.form['monthly_salary'])
 
-        workbook = openpyxl.load_workbook(DATABASE)
-        sheet = workbook["Teachers"]
-        # Append a row with 5 teacher details followed by 36 zeros for monthly data.
-        row = [name, qualification, contact, joining_date, monthly_salary] + [0] * 36
-        sheet.append(row)
-        workbook.save(DATABASE)
+        try:
+            payroll.add_teacher(Teacher(name, qualification, contact, joining_date, monthly_salary))
+        except ValueError as e:
+            abort(409, str(e))
 
-        return redirect(url_for('show_teachers'))
+        return redirect(url_for('.show_teachers'))
 
     return render_template("add_teacher.html")
 
 # Route to update salary and deductions for a specific month
-@app.route('/teachers/update', methods=['POST'])
+@payroll_pages.route('/teachers/update', methods=['POST'])
 def update_teacher():
     name = request.form['name']
     month = request.form['month']
+    year = selected_year()
     attendance_days = int(request.form['attendance_days'])  # Total days teacher was present
 
-    # Define total days per month.
-    month_days = {
-        "January": 31, "February": 28, "March": 31, "April": 30,
-        "May": 31, "June": 30, "July": 31, "August": 31,
-        "September": 30, "October": 31, "November": 30, "December": 31
-    }
-
-    total_days = month_days[month]
-    leaves = total_days - attendance_days  # Auto calculate leaves
-
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Teachers"]
-    month_columns = get_month_columns()
-
-    for row in sheet.iter_rows(min_row=2):
-        if row[0].value == name:
-            deduction_col, leaves_col, paid_col = month_columns[month]
-            monthly_salary = row[4].value or 0  # Monthly salary is now at index 4
-
-            # Deduct 4% of the monthly salary per leave.
-            deduction = (monthly_salary * 0.04) * leaves
-            paid_salary = max(0, monthly_salary - deduction)  # Ensure salary doesn't go negative
-
-            # Update the monthly columns in Excel.
-            row[deduction_col].value = deduction
-            row[leaves_col].value = leaves
-            row[paid_col].value = paid_salary
+    teacher = payroll.teacher(name)
+    if teacher is None:
+        abort(404)
 
-            # Retrieve the teacher’s qualification and contact number.
-            qualification = row[1].value
-            contact = row[2].value
+    leaves = days_in_month(year, month) - attendance_days  # Auto calculate leaves
 
-            update_report_sheet(name, qualification, contact, month, deduction, leaves, paid_salary)
-            break
+    # Deduct 4% of the monthly salary per leave (salary doesn't go negative).
+    deduction, paid_salary = salary_for(teacher.monthly_salary or 0, leaves)
+    payroll.set_month(name, year, month, deduction, leaves, paid_salary)
 
-    workbook.save(DATABASE)
-    return redirect(url_for('show_teachers'))
-
-# Helper function to record updates in the Report sheet.
-def update_report_sheet(name, qualification, contact, month, deductions, leaves, paid_salary):
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Report"]
-    sheet.append([name, qualification, contact, month, deductions, leaves, paid_salary])
-    workbook.save(DATABASE)
+    return redirect(url_for('.show_teachers', year=year))
 
 # Route to delete a teacher
-@app.route('/teachers/delete/<teacher_name>', methods=['POST'])
+@payroll_pages.route('/teachers/delete/<teacher_name>', methods=['POST'])
 def delete_teacher(teacher_name):
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Teachers"]
-
-    # Find the teacher by name and delete their row.
-    for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):  # Start at row 2 to skip headers.
-        if row[0].value == teacher_name:
-            sheet.delete_rows(row_idx)
-            break
-
-    workbook.save(DATABASE)
-    return redirect(url_for('show_teachers'))
+    # Removes the teacher and their payroll history.
+    payroll.delete_teacher(teacher_name)
+    return redirect(url_for('.show_teachers'))
 
 # Route to view and update fees for the next month.
-@app.route('/teachers/next_month', methods=['POST'])
+@payroll_pages.route('/teachers/next_month', methods=['POST'])
 def next_month_update():
     name = request.form['name']
     next_month = request.form['next_month']
+    year = selected_year()
 
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Teachers"]
-    month_columns = get_month_columns()
+    teacher = payroll.teacher(name)
+    if teacher is None:
+        abort(404)
 
-    for row in sheet.iter_rows(min_row=2):
-        if row[0].value == name:
-            deduction_col, leaves_col, paid_col = month_columns[next_month]
+    # Initialize next month's salary with no deductions or leaves.
+    payroll.set_month(name, year, next_month, 0, 0, teacher.monthly_salary or 0)
 
-            # Initialize next month's salary with no deductions or leaves.
-            monthly_salary = row[4].value or 0
-            row[deduction_col].value = 0  # No deductions initially.
-            row[leaves_col].value = 0     # No leaves initially.
-            row[paid_col].value = monthly_salary
+    return redirect(url_for('.show_teachers', year=year))
 
-            qualification = row[1].value
-            contact = row[2].value
-            update_report_sheet(name, qualification, contact, next_month, 0, 0, monthly_salary)
-            break
-
-    workbook.save(DATABASE)
-    return redirect(url_for('show_teachers'))
+# Month-end payroll: open a month for every teacher at once, with leaves from an attendance sheet
+@payroll_pages.route('/teachers/close_month', methods=['GET', 'POST'])
+def close_month():
+    run, error = None, None
+    year = selected_year()
+    month = request.values.get('month', MONTHS[date.today().month - 1])
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if upload is not None and upload.filename == "":
+            upload = None  # no attendance sheet: everyone not yet opened gets a full month
+        try:
+            run = close_payroll_month(payroll, year, month, upload, skip_errors=bool(request.form.get('skip_errors')))
+        except BulkFileError as e:
+            error = str(e)
+        except KeyError:
+            error = f"Unknown month: {month}"
+
+        if request.accept_mimetypes.best == 'application/json':
+            if error:
+                return jsonify({'error': error}), 400
+            return jsonify({'year': run.year, 'month': MONTHS[run.month - 1], 'rows': run.rows,
+                            'changed': run.changed, 'saved': run.saved,
+                            'entries': [e._asdict() for e in run.entries],
+                            'errors': [e._asdict() for e in run.errors]})
+
+    return render_template("payroll_close.html", run=run, error=error, year=year, month=month,
+                           months=MONTHS, years=payroll.years())
+
+@payroll_pages.route('/teachers/close_month/template.csv', methods=['GET'])
+def attendance_template():
+    return Response(template_csv('attendance'), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=attendance_template.csv'})
 
 # Route to generate a report for a teacher (now including qualification and contact details)
-@app.route('/teachers/report/<teacher_name>', methods=['GET'])
+@payroll_pages.route('/teachers/report/<teacher_name>', methods=['GET'])
 def teacher_report(teacher_name):
-    workbook = openpyxl.load_workbook(DATABASE)
-    sheet = workbook["Teachers"]
+    year = selected_year()
+    teacher = payroll.teacher(teacher_name) or Teacher(teacher_name, None, None, None, 0)
     report = []
-    qualification = None
-    contact = None
-    joining_date = None
-    monthly_salary = 0
-
-    month_columns = get_month_columns()
-
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        if row[0] == teacher_name:
-            qualification = row[1]
-            contact = row[2]
-            joining_date = row[3]
-            monthly_salary = row[4] if row[4] else 0
-            print(f"Found teacher: {teacher_name}, Qualification: {qualification}, Contact: {contact}, Joining Date: {joining_date}, Salary: {monthly_salary}")
-
-            # Loop through each month and add the details.
-            for month, (deduction_col, leaves_col, paid_col) in month_columns.items():
-                deduction = row[deduction_col] if row[deduction_col] is not None else 0
-                leaves = row[leaves_col] if row[leaves_col] is not None else 0
-                paid_salary = row[paid_col] if row[paid_col] is not None else 0
-
-                print(f"Processing {month}: Deduction: {deduction}, Leaves: {leaves}, Paid Salary: {paid_salary}")
-
-                report.append({
-                    "month": month,
-                    "deduction": deduction,
-                    "leaves": leaves,
-                    "paid_salary": paid_salary
-                })
-            break
+
+    for entry in payroll.year_months(teacher_name, year):
+        report.append({
+            "month": MONTHS[entry.month - 1],
+            "deduction": entry.deduction,
+            "leaves": entry.leaves,
+            "paid_salary": entry.paid
+        })
+
+    # One row per year the teacher has been paid: (year, deductions, leaves, paid)
+    yearly_totals = payroll.yearly_totals(teacher_name)
 
     return render_template("teacher_report.html", teacher_name=teacher_name,
-                           qualification=qualification, contact=contact,
-                           joining_date=joining_date, monthly_salary=monthly_salary,
-                           report=report)
+                           qualification=teacher.qualification, contact=teacher.contact,
+                           joining_date=teacher.joining_date, monthly_salary=teacher.monthly_salary or 0,
+                           report=report, year=year, yearly_totals=yearly_totals)
+
+# The payroll app on its own; school_app.py runs it together with the fee and transport pages.
+app = create_app(payroll_pages)
+timer.mark('app imported')
 
 def start_flask():
     app.run()
 
 if __name__ == '__main__':
+    import webview  # only the desktop window needs it
+
     # Start Flask in a separate thread.
     flask_thread = threading.Thread(target=start_flask)
     flask_thread.daemon = True
     flask_thread.start()
+    # Read the payroll workbook while the window is opening.
+    threading.Thread(target=lambda: (datastores.warm_up('payroll'), timer.mark('data loaded')), daemon=True).start()
 
     # Create a webview window.
     webview.create_window('School Software', 'http://127.0.0.1:5000')
+    timer.mark('window created')
     webview.start()
@@ -0,0 +1,463 @@
+"""
+DataFrame cache of the transport ledger (data/transport_data.xlsx).
+
+index.py used to pd.read_excel() the workbook on every request and rewrite
+it with to_excel() after every single-row change. TransportLedger keeps the
+ledger as one DataFrame in memory:
+
+* On load it reads a Feather copy of the sheet (transport_data.xlsx.feather)
+  when the copy was made from the current workbook, judged by the
+  workbook's mtime and size. Otherwise it reads the workbook and writes a
+  fresh copy. The Feather copy needs pyarrow; without it every load reads
+  the workbook.
+* Appended rows are buffered and concatenated in one go the next time the
+  frame is read.
+* Edits are journaled and merged into the workbook by the storage writer
+  thread (coordinator.py), as store.WorkbookStore does for the rosters.
+  Edits replace the frame rather than change it in place, so a frame a page
+  is reading never changes under it, even while a save is running.
+* The per-student summary on the index page is kept up to date edit by edit
+  instead of running groupby() on every hit, and so are the charges, paid
+  charges and dues per year and month that the dashboard shows.
+* Every row has a "Record ID" that never changes, so pages link to a row by
+  ID rather than by its position in the sheet (positions shift when a
+  student is deleted). Rows from before the column existed get an ID the
+  first time the sheet is loaded. Dict indexes map record IDs to rows and
+  student names to their rows.
+"""
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+
+from coordinator import coordinator
+from ledger import MONTH_NUMBERS, parse_date
+
+COLUMNS = ["Student Name", "Father's Name", "Contact", "Location", "Grade", "Monthly Charges",
+           "Month", "Paid Charges", "Paid Date", "Dues", "Joining Date", "Record ID"]
+NUMERIC_COLUMNS = ["Monthly Charges", "Paid Charges", "Dues"]
+
+# How the index page summarizes each student's rows (same as its old groupby().agg()).
+FIRST_COLUMNS = ["Father's Name", "Contact", "Location", "Grade"]
+SUM_COLUMNS = ["Monthly Charges", "Paid Charges", "Dues"]
+# "Record ID" in the summary is the student's latest row, the one the index page edits.
+SUMMARY_COLUMNS = ["Student Name"] + FIRST_COLUMNS + SUM_COLUMNS + ["Month", "Record ID"]
+
+
+def new_record_id():
+    return uuid.uuid4().hex[:12]
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, float) and value != value) or value is pd.NaT
+
+
+def row_period(row):
+    """(year, month 1-12) a row is for: its Month, in the year it was paid (or, unpaid, joined).
+
+    Either part is None when the sheet does not say.
+    """
+    month = MONTH_NUMBERS.get(str(row.get("Month") or '').strip().lower())
+    day = parse_date(row.get("Paid Date")) or parse_date(row.get("Joining Date"))
+    return (day.year if day else None, month)
+
+
+def normalize_frame(df):
+    """Give the sheet a stable schema: known columns present, charges numeric, text as str."""
+    for column in COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    for column in df.columns:
+        if column in NUMERIC_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        else:
+            df[column] = df[column].map(lambda v: None if _is_blank(v) else str(v)).astype(object)
+    return df.reset_index(drop=True)
+
+
+def normalize_row(row):
+    clean = {}
+    for column, value in row.items():
+        if column in NUMERIC_COLUMNS:
+            try:
+                clean[column] = float(value)
+            except (TypeError, ValueError):
+                clean[column] = float('nan')
+        else:
+            clean[column] = None if _is_blank(value) or value == '' else str(value)
+    return clean
+
+
+class TransportLedger:
+    """The transport sheet as a DataFrame, with buffered appends and write-behind saves."""
+
+    def __init__(self, path, flush_delay=2.0):
+        self.path = path
+        self.cache_path = path + ".feather"
+        self.cache_meta_path = path + ".feather.json"
+        self.journal_path = path + ".journal"
+        self._pending_path = path + ".journal.flushing"
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._signature = None
+        self._df = pd.DataFrame(columns=COLUMNS)
+        self._appended = []  # rows added since the frame was last concatenated
+        self._summary = {}
+        self._rows_by_name = {}
+        self._row_by_id = {}
+        self._periods = {}  # (year, month), with None for "any", -> [charges, paid, dues]
+
+    # --- loading -----------------------------------------------------------
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _read_cache(self, signature):
+        try:
+            with open(self.cache_meta_path, encoding='utf-8') as f:
+                if json.load(f).get('signature') != signature:
+                    return None
+            return pd.read_feather(self.cache_path)
+        except (OSError, ValueError, ImportError):
+            return None
+
+    def _write_cache(self, df, signature):
+        self._commit_cache(self._write_cache_file(df), signature)
+
+    def _write_cache_file(self, df):
+        """Write the Feather copy to a temp file; returns its name, or None without pyarrow."""
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            df.to_feather(tmp_path)
+        except (ImportError, ValueError, TypeError) as e:
+            print(f"Not caching {self.path} as Feather: {e}")
+            return None
+        return tmp_path
+
+    def _commit_cache(self, tmp_path, signature):
+        if tmp_path is None:
+            return
+        os.replace(tmp_path, self.cache_path)
+        with open(self.cache_meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'signature': signature}, f)
+
+    def _load(self):
+        signature = self._file_signature()
+        if signature is None:
+            df = normalize_frame(pd.DataFrame(columns=COLUMNS))
+        else:
+            df = self._read_cache(signature)  # saved already normalized
+            if df is None:
+                df = normalize_frame(pd.read_excel(self.path))
+                self._write_cache(df, signature)
+        self._df = df
+        self._appended = []
+        self._rebuild_summary()
+        # Edits that were journaled but not yet merged into the workbook.
+        replayed = False
+        for journal in (self._pending_path, self.journal_path):
+            for entry in self._read_journal(journal):
+                self._apply(entry)
+                replayed = True
+        if self._assign_missing_ids():
+            replayed = True
+        self._signature = signature  # last, so lock-free readers wait for the load to finish
+        if replayed:
+            self._schedule_flush()
+
+    def _assign_missing_ids(self):
+        """Give rows saved before the Record ID column existed an ID, journaled like any edit."""
+        df = self._frame()
+        missing = [int(position) for position in df.index[df["Record ID"].isna()]]
+        if not missing:
+            return False
+        entry = {'op': 'assign_ids', 'ids': {str(position): new_record_id() for position in missing}}
+        self._journal(entry)
+        self._apply(entry)
+        return True
+
+    def refresh(self):
+        """Reload the sheet if the file changed since it was last read."""
+        if self._signature is not None and self._signature == self._file_signature():
+            return
+        with self._lock:
+            if self._signature is None or self._signature != self._file_signature():
+                self._load()
+
+    def _frame(self):
+        if self._appended:
+            new_rows = pd.DataFrame(self._appended, columns=self._df.columns)
+            self._df = pd.concat([self._df, new_rows], ignore_index=True) if len(self._df) else new_rows
+            self._appended = []
+        return self._df
+
+    # --- reads -------------------------------------------------------------
+
+    def frame(self):
+        """The whole ledger. Treat it as read-only; edit through the methods below."""
+        with self._lock:
+            self.refresh()
+            return self._frame()
+
+    def row(self, record_id):
+        """One row as a Series (KeyError if there is no such record)."""
+        with self._lock:
+            df = self.frame()
+            return df.iloc[self._row_by_id[record_id]]
+
+    def rows_for(self, student_name):
+        with self._lock:
+            df = self.frame()
+            return df.iloc[self._rows_by_name.get(student_name, [])]
+
+    def summary(self, search=''):
+        """One dict per student (sorted by name), as the index page shows them."""
+        with self._lock:
+            self.refresh()
+            search = search.lower()
+            return [dict(self._summary[name]) for name in sorted(self._summary)
+                    if not search or search in name.lower()]
+
+    def period_totals(self, year=None, month=None):
+        """{'charges', 'paid', 'dues'} over the rows of a year and/or month (None = all); see row_period()."""
+        with self._lock:
+            self.refresh()
+            charges, paid, dues = self._periods.get((year or None, month or None), (0.0, 0.0, 0.0))
+            return {'charges': charges, 'paid': paid, 'dues': dues}
+
+    # --- summary -----------------------------------------------------------
+
+    def _rebuild_summary(self):
+        df = self._frame()
+        self._summary = {}
+        self._rows_by_name = {}
+        self._row_by_id = {record_id: position for position, record_id in enumerate(df["Record ID"])
+                           if record_id is not None}
+        self._periods = {}
+        if not len(df):
+            return
+        self._rebuild_periods(df)
+        groups = df.groupby(df["Student Name"], sort=False)
+        totals = groups.agg({**{c: 'first' for c in FIRST_COLUMNS + ["Month"]},
+                             **{c: 'sum' for c in SUM_COLUMNS}, "Record ID": 'last'})
+        for name, values in totals.to_dict(orient='index').items():
+            entry = {"Student Name": name}
+            entry.update({c: None if _is_blank(values[c]) else values[c]
+                          for c in FIRST_COLUMNS + ["Month", "Record ID"]})
+            entry.update({c: float(values[c]) for c in SUM_COLUMNS})
+            self._summary[name] = {column: entry[column] for column in SUMMARY_COLUMNS}
+        for name, positions in groups.indices.items():
+            self._rows_by_name[name] = list(positions)
+
+    @staticmethod
+    def _summarize(name, rows):
+        entry = {"Student Name": name}
+        for column in FIRST_COLUMNS + ["Month"]:
+            present = rows[column].dropna()
+            entry[column] = present.iloc[0] if len(present) else None
+        for column in SUM_COLUMNS:
+            entry[column] = float(rows[column].sum())
+        present = rows["Record ID"].dropna()
+        entry["Record ID"] = present.iloc[-1] if len(present) else None
+        return {column: entry[column] for column in SUMMARY_COLUMNS}
+
+    def _add_to_summary(self, name, row):
+        entry = self._summary.get(name)
+        if entry is None:
+            entry = self._summary[name] = {c: None for c in SUMMARY_COLUMNS}
+            entry["Student Name"] = name
+            for column in SUM_COLUMNS:
+                entry[column] = 0.0
+        for column in FIRST_COLUMNS + ["Month"]:
+            if entry[column] is None and not _is_blank(row.get(column)):
+                entry[column] = row[column]
+        for column in SUM_COLUMNS:
+            value = row.get(column)
+            if not _is_blank(value):
+                entry[column] += value
+        if row.get("Record ID") is not None:
+            entry["Record ID"] = row["Record ID"]
+
+    def _forget_student(self, name, positions, record_ids, row_count):
+        """Drop a deleted student's summary and rows, and renumber the rows that came after them."""
+        import numpy as np  # comes with pandas
+        self._summary.pop(name, None)
+        del self._rows_by_name[name]
+        for record_id in record_ids:
+            self._row_by_id.pop(record_id, None)
+        gone = np.zeros(row_count, dtype=np.int64)
+        gone[positions] = 1
+        # New position of every old row: minus the number of deleted rows before it.
+        renumbered = (np.arange(row_count) - np.cumsum(gone)).tolist()
+        self._row_by_id = {record_id: renumbered[p] for record_id, p in self._row_by_id.items()}
+        first = positions[0]
+        for other, rows in self._rows_by_name.items():
+            if rows[-1] > first:  # row lists are in sheet order
+                self._rows_by_name[other] = [renumbered[p] for p in rows]
+
+    def _rebuild_periods(self, df):
+        # Sum each (year, month) cell with one groupby (0 stands for an unknown part), then roll the cells up.
+        periods = [row_period({"Month": m, "Paid Date": p, "Joining Date": j})
+                   for m, p, j in zip(df["Month"], df["Paid Date"], df["Joining Date"])]
+        years = [year or 0 for year, _ in periods]
+        months = [month or 0 for _, month in periods]
+        cells = df[SUM_COLUMNS].fillna(0).groupby([years, months]).sum()
+        for (year, month), values in zip(cells.index, cells.itertuples(index=False)):
+            row = dict(zip(SUM_COLUMNS, values))
+            row["Month"], row["Paid Date"] = None, None
+            self._add_to_periods(row, 1, period=(year or None, month or None))
+
+    def _add_to_periods(self, row, sign, period=None):
+        # Each row counts towards its (year, month) cell and every rollup of it.
+        year, month = period or row_period(row)
+        values = [0.0 if _is_blank(row.get(c)) else sign * float(row[c]) for c in SUM_COLUMNS]
+        for key in {(year, month), (year, None), (None, month), (None, None)}:
+            totals = self._periods.setdefault(key, [0.0, 0.0, 0.0])
+            for i, value in enumerate(values):
+                totals[i] += value
+
+    # --- writes ------------------------------------------------------------
+
+    def append(self, row):
+        """Add a row; returns its new record ID."""
+        row = normalize_row(row)
+        row["Record ID"] = new_record_id()
+        self._write({'op': 'append', 'row': row})
+        return row["Record ID"]
+
+    def update(self, record_id, values):
+        """Change some columns of one row (KeyError if there is no such record)."""
+        values = normalize_row(values)
+        values.pop("Record ID", None)
+        with self._lock:
+            self.refresh()
+            if record_id not in self._row_by_id:
+                raise KeyError(record_id)
+            self._write({'op': 'update', 'record_id': record_id, 'values': values})
+
+    def delete_student(self, student_name):
+        self._write({'op': 'delete', 'name': student_name})
+
+    def _write(self, entry):
+        with self._lock:
+            self.refresh()
+            if entry['op'] == 'append':
+                entry['at'] = len(self._df) + len(self._appended)
+            self._journal(entry)
+            self._apply(entry)
+        self._schedule_flush()
+
+    def _journal(self, entry):
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _apply(self, entry):
+        """Apply one journal entry in memory. Replaying an already merged entry is a no-op."""
+        op = entry.get('op')
+        if op == 'append':
+            count = len(self._df) + len(self._appended)
+            record_id = entry['row'].get("Record ID")
+            if record_id in self._row_by_id or entry.get('at', count) < count:
+                return  # merged into the workbook before a crash
+            row = {column: entry['row'].get(column) for column in self._df.columns}
+            self._appended.append(row)
+            self._add_to_periods(row, 1)
+            if record_id is not None:
+                self._row_by_id[record_id] = count
+            name = row.get("Student Name")
+            if name is not None:
+                self._rows_by_name.setdefault(name, []).append(count)
+                self._add_to_summary(name, row)
+        elif op == 'update':
+            position = self._row_by_id.get(entry.get('record_id'))
+            if position is None:
+                return
+            df = self._df = self._frame().copy()
+            self._add_to_periods(df.iloc[position].to_dict(), -1)
+            for column, value in entry['values'].items():
+                df.at[position, column] = value
+            self._add_to_periods(df.iloc[position].to_dict(), 1)
+            name = df.at[position, "Student Name"]
+            if not _is_blank(name):
+                self._summary[name] = self._summarize(name, df.iloc[self._rows_by_name[name]])
+        elif op == 'delete':
+            df = self._frame()
+            positions = self._rows_by_name.get(entry['name'])
+            if not positions:
+                return
+            gone = df.iloc[positions]
+            for row in gone.to_dict(orient='records'):
+                self._add_to_periods(row, -1)
+            self._df = df.drop(index=positions).reset_index(drop=True)
+            self._forget_student(entry['name'], positions, gone["Record ID"].dropna().tolist(), len(df))
+        elif op == 'assign_ids':
+            df = self._df = self._frame().copy()
+            for position, record_id in entry['ids'].items():
+                position = int(position)
+                if position < len(df) and df.at[position, "Record ID"] is None:
+                    df.at[position, "Record ID"] = record_id
+            self._rebuild_summary()
+
+    def _read_journal(self, journal):
+        if not os.path.exists(journal):
+            return []
+        entries = []
+        with open(journal, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line from a crash mid-append
+        return entries
+
+    # --- background flushing -----------------------------------------------
+
+    def _schedule_flush(self):
+        coordinator.submit(self._background_flush, key=('flush', self.path), delay=self.flush_delay)
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Could not save {self.path}, will retry: {e}")
+            self._schedule_flush()
+            raise
+
+    def _take_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as src, open(self._pending_path, 'ab') as dst:
+            dst.write(src.read())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(self.journal_path)
+
+    def flush(self):
+        """Write all journaled edits to the workbook (and the Feather copy) in one save."""
+        with self._flush_lock:
+            with self._lock:
+                self.refresh()
+                self._take_journal()
+                if not os.path.exists(self._pending_path):
+                    return
+                df = self._frame()  # never changed in place, so no copy is needed
+            # Both files are written outside the lock, so pages keep reading the cache.
+            # Only the renames happen under it, so no reader reloads a half-saved file.
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = os.path.splitext(self.path)[0] + ".tmp.xlsx"
+            df.to_excel(tmp_path, index=False)
+            cache_tmp = self._write_cache_file(df)
+            with self._lock:
+                os.replace(tmp_path, self.path)
+                self._signature = self._file_signature()
+                self._commit_cache(cache_tmp, self._signature)
+                os.remove(self._pending_path)